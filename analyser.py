@@ -3,8 +3,13 @@
 import argparse
 import logging
 
+from stockanalyser import batch as batch_run
+from stockanalyser import deadlines, instrumentation, pipeline, work_queue
+from stockanalyser.config import WORK_QUEUE_PATH
+from stockanalyser.journal import RunJournal
 from stockanalyser import logger as colorlog
 from stockanalyser.analysis.levermann import Levermann
+from stockanalyser.data_source import common
 
 colorlog.setup_logger()
 logger = logging.getLogger(__name__)
@@ -38,12 +43,93 @@ def configure_argparse():
     #                                              " country ending")
     # set_parser.set_defaults(func=set)
 
-    args = vars(parser.parse_args())
+    batch_parser = subparsers.add_parser(
+        "batch", help="evaluate many stocks concurrently")
+    batch_parser.add_argument("ISIN", nargs="*",
+                              help="Stock ISINs, default: all ISINs of the "
+                                   "selected indices")
+    batch_parser.add_argument("-i", "--index", nargs="+",
+                              help="indices from data/indizes_de.json, "
+                                   "default: all")
+    batch_parser.add_argument("-w", "--workers", type=int,
+                              help="stocks that are evaluated in parallel, "
+                                   "with --stream the workers of the fetch "
+                                   "stage, default: {}".format(
+                                       batch_run.WORKERS))
+    batch_parser.add_argument("--per-host", type=int,
+                              default=common.MAX_REQUESTS_PER_HOST,
+                              help="parallel requests per website")
+    batch_parser.add_argument("--memory-budget", type=int, metavar="MB",
+                              help="check that the memory usage stays below "
+                                   "MB and doesn't grow during the run")
+    batch_parser.add_argument("--report", metavar="FILE",
+                              help="write time per criterion, requests, "
+                                   "cache hits and database statements of "
+                                   "every stock as json to FILE")
+    batch_parser.add_argument("--prometheus", metavar="FILE",
+                              help="write the same report in the "
+                                   "Prometheus text format to FILE")
+    batch_parser.add_argument("--parse-workers", type=int, default=0,
+                              metavar="N",
+                              help="parse the pages in N processes, "
+                                   "default: in the worker threads")
+    batch_parser.add_argument("--journal", metavar="FILE",
+                              help="journal the run to FILE. If FILE "
+                                   "exists the run is resumed: finished "
+                                   "stocks are skipped and fetched pages "
+                                   "are reused")
+    batch_parser.add_argument("--stream", nargs="?", const={},
+                              type=pipeline.parse_stage_workers,
+                              metavar="STAGE=N,...",
+                              help="stream the stocks through the stages "
+                                   "{} and save each one as soon as it is "
+                                   "scored, optionally with other numbers "
+                                   "of workers, e.g. fetch=16,score=2".format(
+                                       ", ".join(pipeline.STAGES)))
+    add_budget_argument(batch_parser)
+    batch_parser.set_defaults(func=batch)
+
+    queue_parser = subparsers.add_parser(
+        "queue", help="split the evaluation of a universe between workers")
+    queue_parser.add_argument("action", choices=("add", "work", "status"),
+                              help="add: queue ISINs, work: evaluate queued "
+                                   "ISINs until the queue is empty, status: "
+                                   "show the progress")
+    queue_parser.add_argument("ISIN", nargs="*",
+                              help="Stock ISINs to add, default: all ISINs "
+                                   "of the selected indices")
+    queue_parser.add_argument("-i", "--index", nargs="+",
+                              help="indices from data/indizes_de.json, "
+                                   "default: all")
+    queue_parser.add_argument("-q", "--queue", metavar="FILE",
+                              default=WORK_QUEUE_PATH,
+                              help="SQLite file of the queue and the shared "
+                                   "rate limits, default: %(default)s")
+    queue_parser.add_argument("-w", "--workers", type=int,
+                              default=batch_run.WORKERS,
+                              help="stocks that this worker evaluates in "
+                                   "parallel")
+    queue_parser.add_argument("--per-host", type=int,
+                              default=common.MAX_REQUESTS_PER_HOST,
+                              help="parallel requests per website of this "
+                                   "worker")
+    queue_parser.add_argument("--max-attempts", type=int,
+                              default=work_queue.MAX_ATTEMPTS,
+                              help="claims of an ISIN until it is failed")
+    queue_parser.add_argument("--lease", type=float,
+                              default=work_queue.LEASE, metavar="SECONDS",
+                              help="time after which the ISINs of a dead "
+                                   "worker are claimed again")
+    add_budget_argument(queue_parser)
+    queue_parser.set_defaults(func=queue)
+
+    args = parser.parse_args()
 
     configure_logger(args.debug)
 
-    if "func" not in args:
+    if "func" not in vars(args):
         parser.print_help()
+        return
 
     args.func(args)
 
@@ -55,6 +141,18 @@ def configure_argparse():
     # else:
 
 
+def add_budget_argument(parser):
+    parser.add_argument("--budget", type=float,
+                        default=deadlines.STOCK_BUDGET, metavar="SECONDS",
+                        help="deadline per stock, criteria that miss it are "
+                             "left out and the stock is retried after the "
+                             "others. 0: no deadline, default: %(default)s")
+
+
+def budget_seconds(args):
+    return args.budget or None
+
+
 def configure_logger(debug):
     if debug:
         level = logging.DEBUG
@@ -76,8 +174,68 @@ def show_outdated(levermann_objs):
     print("-" * 80)
 
 
-def main(isin):
-    if isinstance(isin, list):
+def batch(args):
+    isins = args.ISIN or batch_run.load_universe(args.index)
+    report = None
+    if args.report or args.prometheus:
+        report = instrumentation.RunReport()
+    journal = RunJournal(args.journal) if args.journal else None
+    if args.stream is not None:
+        stages = dict(args.stream)
+        if args.workers is not None:
+            # an explicit fetch=N of --stream wins
+            stages.setdefault("fetch", args.workers)
+        results = pipeline.evaluate_universe(
+            isins, stages=stages, per_host=args.per_host,
+            memory_budget=args.memory_budget, report=report,
+            parse_workers=args.parse_workers, journal=journal,
+            budget=budget_seconds(args))
+        for result in results:
+            print(result)
+    else:
+        workers = batch_run.WORKERS if args.workers is None else args.workers
+        main(isin=isins, workers=workers, per_host=args.per_host,
+             memory_budget=args.memory_budget, report=report,
+             parse_workers=args.parse_workers, journal=journal,
+             budget=budget_seconds(args))
+    if args.report:
+        report.write_json(args.report)
+    if args.prometheus:
+        report.write_prometheus(args.prometheus)
+
+
+def queue(args):
+    tasks = work_queue.SQLiteWorkQueue(args.queue, args.max_attempts)
+    if args.action == "add":
+        isins = args.ISIN or batch_run.load_universe(args.index)
+        print("Queued {} of {} ISINs".format(tasks.add(isins), len(isins)))
+    elif args.action == "work":
+        worker = work_queue.Worker(
+            tasks, work_queue.SQLiteRateLimiter(args.queue),
+            threads=args.workers, lease=args.lease,
+            budget=budget_seconds(args))
+        for result in worker.run(per_host=args.per_host):
+            print(result)
+    for state, count in tasks.counts().items():
+        print("{:<8} {:>6}".format(state, count))
+    for isin, error in tasks.failures().items():
+        print("{:<14} FAILED: {}".format(isin, error))
+
+
+def main(isin, workers=1, per_host=common.MAX_REQUESTS_PER_HOST,
+         memory_budget=None, report=None, parse_workers=0, journal=None,
+         budget=None):
+    if isinstance(isin, list) and (workers > 1 or memory_budget or report
+                                   or parse_workers or journal or budget):
+        results = batch_run.evaluate_universe(isin, workers=workers,
+                                              per_host=per_host,
+                                              memory_budget=memory_budget,
+                                              report=report,
+                                              parse_workers=parse_workers,
+                                              journal=journal, budget=budget)
+        for result in results:
+            print(result)
+    elif isinstance(isin, list):
         for idx, stock in enumerate(isin, 1):
             # print(idx, stock)
             Levermann(isin=stock)
@@ -89,4 +247,4 @@ def main(isin):
 
 
 if __name__ == "__main__":
-    main(isin=["DE0005313704", "DE000CBK1001"])
+    configure_argparse()
@@ -0,0 +1,442 @@
+"""
+fixtures.py
+
+Responses for the benchmarks, served through ``common.set_transport``.
+
+Transports:
+    * ``SyntheticTransport``:
+        - generates pages of synthetic stocks that match the xpaths of the
+          scrapers, nothing is read from disk
+    * ``RecordingTransport``:
+        - sends real requests and stores every response in a directory
+    * ``ReplayTransport``:
+        - serves the responses of such a directory
+
+Synthetic stocks have ISINs like ``DESYN0000010`` and are registered in
+aktien_information by ``register(isins)``, so no search pages are needed.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import zlib
+
+import requests
+
+from stockanalyser.data_source import common, onvista, trading_calendar
+from stockanalyser.database import models
+
+ISIN_FORMAT = "DESYN{:06d}0"
+ONVISTA = "https://www.onvista.de/aktien/"
+FINANZEN_NET = "https://www.finanzen.net/"
+MARKETSCREENER = "https://de.marketscreener.com/"
+REVISION_POINTS = 30
+
+
+def universe(size: int) -> list:
+    return [ISIN_FORMAT.format(i) for i in range(size)]
+
+
+def _number(isin: str) -> int:
+    return int(isin[5:11])
+
+
+def _seed(isin: str) -> random.Random:
+    return random.Random(zlib.crc32(isin.encode()))
+
+
+def urls(isin: str) -> dict:
+    """Stored URLs of a synthetic stock"""
+    number = _number(isin)
+    return {
+        'onvista_url': "{}Synth-{}-Aktie-{}".format(ONVISTA, number, isin),
+        'finanzennet_url': "{}aktien/synth_{}-aktie".format(FINANZEN_NET,
+                                                            number),
+        'marketscreener_url': "{}SYNTH-{}-{}/".format(MARKETSCREENER, number,
+                                                     100000 + number),
+        'marketscreener_id': str(100000 + number),
+    }
+
+
+def register(isins: list):
+    """Stores the synthetic stocks in aktien_information"""
+    rows = []
+    for isin in isins:
+        row = urls(isin)
+        row.update({'isin': isin, 'name': "Synth {}".format(_number(isin)),
+                    'benchmark': "DAX", 'art': "",
+                    'notation_id': str(_notation_id(_number(isin)))})
+        rows.append(row)
+    with models.database.atomic():
+        for start in range(0, len(rows), 100):
+            models.AktienInformation.insert_many(
+                rows[start:start + 100]).execute()
+
+
+def _notation_id(number: int) -> int:
+    return 1000000 + number
+
+
+def response(url: str, content: bytes, status_code: int = 200,
+             final_url: str = None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = content
+    result.url = final_url or url
+    return result
+
+
+""" Synthetic pages """
+
+
+def _html(body: str) -> bytes:
+    return ('<html><head><meta charset="utf-8"></head><body>{}</body>'
+            '</html>'.format(body).encode("utf-8"))
+
+
+def _german(value: float) -> str:
+    text = "{:,.2f}".format(value)
+    return text.replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _onvista_article(inner: str) -> str:
+    return ('<div id="ONVISTA"><div><div><div><article>{}</article></div>'
+            '</div></div></div>'.format(inner))
+
+
+def overview_page(isin: str) -> bytes:
+    rng = _seed(isin)
+    market_cap = rng.choice([800, 3000, 12000, 80000]) * rng.uniform(0.8, 1.2)
+    sections = "".join("<section></section>" for _ in range(7))
+    sections += ('<section><article><div><table><tbody><tr><td>{} Mio EUR'
+                 '</td></tr></tbody></table></div></article></section>'
+                 .format(_german(market_cap)))
+    divs = ('<div></div><div><span><a title="Synth {}">Synth</a></span></div>'
+            '<div></div><div></div><div></div><div></div><div>{}</div>'
+            .format(_number(isin), sections))
+    table = ('<table><tr><td></td></tr><tr><td></td><td></td><td></td>'
+             '<td>{}</td></tr></table>'.format(_german(_close(isin, 0))))
+    return _html(_onvista_article(divs + table))
+
+
+def fundamental_page(isin: str) -> bytes:
+    rng = _seed(isin)
+    this_year = datetime.date.today().year
+    years = list(range(this_year + 1, this_year - 5, -1))
+    header = ["{}e".format(year) if year >= this_year else str(year)
+              for year in years]
+
+    def table(title, rows):
+        head = "".join("<th>{}</th>".format(h) for h in [title] + header)
+        body = "".join(
+            "<tr><td>{}</td>{}</tr>".format(
+                name, "".join("<td>{}</td>".format(v) for v in values))
+            for name, values in rows)
+        return "<table><thead><tr>{}</tr></thead><tbody>{}</tbody>" \
+               "</table>".format(head, body)
+
+    def series(low, high, unit=""):
+        return [_german(rng.uniform(low, high)) + unit for _ in years]
+
+    tables = [
+        table("Gewinn", [("Gewinn pro Aktie in EUR", series(-1, 8)),
+                         ("KGV", series(5, 30))]),
+        table("Dividende", [("Dividende in EUR", series(0, 3))]),
+        table("Cashflow", [("Cashflow je Aktie", series(0, 9))]),
+        table("Umsatz", [("Umsatz in Mio. EUR", series(100, 9000))]),
+        table("Personal", [("Mitarbeiter", series(100, 9000))]),
+        table("Bilanz", [("Bilanzsumme", series(100, 9000)),
+                         ("Eigenkapitalquote", series(5, 60, "%"))]),
+        table("Bewertung", [("KBV", series(0, 5))]),
+        table("Rentabilität", [("Umsatzrendite", series(0, 20, "%")),
+                               ("EBIT-Marge", series(-5, 25, "%")),
+                               ("Cashflow-Marge", series(0, 20, "%")),
+                               ("Eigenkapitalrendite", series(-10, 40,
+                                                              "%"))]),
+    ]
+    return _html(_onvista_article(
+        "<article><div>{}</div></article>".format("".join(tables))))
+
+
+def times_sales_page(isin: str) -> bytes:
+    notation_id = _notation_id(_number(isin))
+    return _html('<div id="exchangesLayerTs"><ul>'
+                 '<li><a href="?notation=1">Frankfurt</a></li>'
+                 '<li><a href="?notation={}">Xetra</a></li></ul></div>'
+                 .format(notation_id))
+
+
+def _close(key: str, day_index: int) -> float:
+    """Deterministic random walk of closes"""
+    rng = random.Random(zlib.crc32(key.encode()) + day_index // 50)
+    base = 20 + zlib.crc32(key.encode()) % 200
+    return base * (1 + 0.2 * rng.uniform(-1, 1)) * (1 + day_index * 1e-4)
+
+
+def price_csv(notation_id: str, year: int) -> bytes:
+    start = datetime.date(year, 1, 1)
+    end = min(datetime.date(year, 12, 31), datetime.date.today())
+    lines = ["Datum;Eroeffnung;Hoch;Tief;Schluss;Volumen"]
+    days = [start + datetime.timedelta(days=i)
+            for i in range((end - start).days + 1)]
+    for day, trading in zip(days, trading_calendar.is_trading_day(days)):
+        if trading:
+            close = _german(_close(notation_id, day.toordinal()))
+            lines.append("{};{};{};{};{};1000".format(
+                day.strftime("%d.%m.%Y"), close, close, close, close))
+    return "\n".join(lines).encode("latin-1")
+
+
+def historic_quote(notation_id: str, day: str) -> bytes:
+    day = datetime.datetime.strptime(day, "%d.%m.%Y").date()
+    return json.dumps({"close": _german(_close(notation_id,
+                                               day.toordinal()))}).encode()
+
+
+def finanzen_net_page(number: int) -> bytes:
+    # benchmark link at the absolute xpath used by the scraper
+    row = '<tr><td></td><td><a>DAX</a></td></tr>'
+    table = "<table><tr></tr><tr></tr>{}</table>".format(row)
+    div27 = "<div></div><div></div><div><div>{}</div></div>".format(table)
+    div3 = "".join("<div></div>" for _ in range(26)) + \
+        "<div>{}</div>".format(div27)
+    div6 = "<div></div><div></div><div>{}</div>".format(div3)
+    div1 = "".join("<div></div>" for _ in range(5)) + \
+        "<div>{}</div>".format(div6)
+    link = '<a title="Termine" href="/termine/synth_{}">Termine</a>'.format(
+        number)
+    return _html("<div>{}</div>{}".format(div1, link))
+
+
+def termine_page(number: int) -> bytes:
+    rng = random.Random(number)
+    today = datetime.date.today()
+    rows = []
+    for quarter in range(-6, 3):
+        day = today + datetime.timedelta(days=quarter * 91 +
+                                         rng.randint(-20, 20))
+        rows.append("<tr><td>Quartalszahlen</td><td>Q</td><td></td>"
+                    "<td>{}</td></tr>".format(day.strftime("%d.%m.%Y")))
+    return _html('<table class="table">{}</table>'.format("".join(rows)))
+
+
+def consensus_feed(code: str) -> bytes:
+    rng = random.Random(code)
+    recommendations = {key: rng.randint(0, 8) for key in (
+        "reco_BUY", "reco_OUTPERFORM", "reco_HOLD", "reco_UNDERPERFORM",
+        "reco_SELL")}
+    recommendations["reco_HOLD"] += 1
+    return json.dumps([recommendations, None, None, True]).encode()
+
+
+def revision_feed(code: str) -> bytes:
+    rng = random.Random(code)
+    start = datetime.datetime.now() - datetime.timedelta(
+        days=REVISION_POINTS)
+    years = []
+    for _ in range(2):
+        eps = rng.uniform(0.5, 5)
+        points = []
+        for day in range(REVISION_POINTS):
+            eps *= 1 + rng.uniform(-0.01, 0.01)
+            timestamp = (start + datetime.timedelta(days=day)).timestamp()
+            points.append([int(timestamp * 1000), round(eps, 3)])
+        years.append(points)
+    return json.dumps([years]).encode()
+
+
+class SyntheticTransport(object):
+    """
+    Serves generated pages for every endpoint the scrapers use
+    """
+
+    def __init__(self):
+        number = r"Synth-(\d+)-Aktie-(\w+)"
+        self.routes = [
+            (re.compile(r"onvista\.de/aktien/fundamental/" + number),
+             lambda m: fundamental_page(m.group(2))),
+            (re.compile(r"onvista\.de/aktien/times\+sales/" + number),
+             lambda m: times_sales_page(m.group(2))),
+            (re.compile(r"onvista\.de/aktien/" + number),
+             lambda m: overview_page(m.group(2))),
+            (re.compile(r"historicalquote/export\.csv\?notationId=(\d+)"
+                        r"&dateStart=01\.01\.(\d{4})"),
+             lambda m: price_csv(m.group(1), int(m.group(2)))),
+            (re.compile(r"historicalquote\.json\?notationId=(\d+)"
+                        r"&dateStart=([\d.]+)"),
+             lambda m: historic_quote(m.group(1), m.group(2))),
+            (re.compile(r"finanzen\.net/termine/synth_(\d+)"),
+             lambda m: termine_page(int(m.group(1)))),
+            (re.compile(r"finanzen\.net/aktien/synth_(\d+)-aktie"),
+             lambda m: finanzen_net_page(int(m.group(1)))),
+            (re.compile(r"codeZB=(\d+)&t=dcons"),
+             lambda m: consensus_feed(m.group(1))),
+            (re.compile(r"codeZB=(\d+)&t=rev"),
+             lambda m: revision_feed(m.group(1))),
+        ]
+        self.requests = 0
+        self.bytes = 0
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def _generate(self, url: str):
+        for pattern, page in self.routes:
+            match = pattern.search(url)
+            if match:
+                return page(match)
+        return None
+
+    def prepare(self, urls: list):
+        """Generates the pages of urls in advance, so generating them is
+        not part of a measured stage. Replaces the previous pages"""
+        self._prepared = {url: self._generate(url) for url in urls}
+
+    def __call__(self, method: str, url: str) -> requests.Response:
+        if url in self._prepared:
+            content = self._prepared[url]
+        else:
+            content = self._generate(url)
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(content or b"")
+        if content is None:
+            return response(url, b"", status_code=404)
+        return response(url, b"" if method == "HEAD" else content)
+
+
+""" Recorded responses """
+
+
+def _fixture_name(method: str, url: str) -> str:
+    return hashlib.sha1("{} {}".format(method, url).encode()).hexdigest()
+
+
+class RecordingTransport(object):
+    """
+    Sends real requests and stores every response in ``directory``
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self._lock = threading.Lock()
+
+    def __call__(self, method: str, url: str) -> requests.Response:
+        result = common._default_transport(method, url)
+        name = _fixture_name(method, url)
+        content = b"" if method == "HEAD" else result.content
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(zlib.compress(content))
+        with self._lock:
+            self.index["{} {}".format(method, url)] = {
+                "file": name, "url": result.url,
+                "status_code": result.status_code}
+            with open(self.index_path, "w") as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+        return result
+
+
+class ReplayTransport(object):
+    """
+    Serves the responses recorded by RecordingTransport. Unknown requests
+    get a 404, they are counted in ``missing``
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as f:
+            self.index = json.load(f)
+        self.missing = []
+        self.requests = 0
+        self.bytes = 0
+        self._bodies = {}
+        for key, entry in self.index.items():
+            with open(os.path.join(directory, entry["file"]), "rb") as f:
+                self._bodies[key] = zlib.decompress(f.read())
+
+    def isins(self) -> list:
+        """ISINs of the recorded onvista overview pages"""
+        found = re.findall(r"GET https://www\.onvista\.de/aktien/[^/]*"
+                           r"-Aktie-([A-Z]{2}[A-Z0-9]{9}[0-9])$",
+                           "\n".join(self.index), flags=re.M)
+        return sorted(set(found))
+
+    def prepare(self, urls: list):
+        """All responses are loaded in advance"""
+
+    def __call__(self, method: str, url: str) -> requests.Response:
+        key = "{} {}".format(method, url)
+        entry = self.index.get(key)
+        self.requests += 1
+        if entry is None:
+            self.missing.append(key)
+            return response(url, b"", status_code=404)
+        self.bytes += len(self._bodies[key])
+        return response(url, self._bodies[key], entry["status_code"],
+                        final_url=entry["url"])
+
+    def urls(self) -> list:
+        """URLs of all recorded GET requests"""
+        return [key.split(" ", 1)[1] for key in sorted(self.index)
+                if key.startswith("GET ")]
+
+
+""" Endpoints """
+
+# first matching pattern wins, same order as cache.TTL_RULES
+PAGE_KINDS = [
+    (re.compile(r"historicalquote/export\.csv"), "price_csv"),
+    (re.compile(r"historicalquote\.json"), "historic_quote"),
+    (re.compile(r"onvista\.de/aktien/fundamental/"), "fundamental"),
+    (re.compile(r"onvista\.de/aktien/times\+sales/"), "times_sales"),
+    (re.compile(r"onvista\.de/aktien/"), "overview"),
+    (re.compile(r"finanzen\.net/termine/"), "termine"),
+    (re.compile(r"finanzen\.net/"), "stock_page"),
+    (re.compile(r"afDataFeed\.php.*t=dcons"), "consensus"),
+    (re.compile(r"afDataFeed\.php.*t=rev"), "revision"),
+]
+
+
+def page_kind(url: str):
+    """Endpoint of url, None for pages the benchmarks don't parse"""
+    for pattern, kind in PAGE_KINDS:
+        if pattern.search(url):
+            return kind
+    return None
+
+
+def benchmark_urls() -> list:
+    """Price series of the benchmark indices"""
+    notation_ids = {index['notation_id']
+                    for index in onvista.BENCHMARKS.values()}
+    return [url for notation_id in sorted(notation_ids)
+            for url in onvista._price_series_urls(notation_id)]
+
+
+def stock_urls(isin: str) -> list:
+    """Every page the scrapers request for a synthetic stock"""
+    stock = urls(isin)
+    overview = stock['onvista_url']
+    page = overview.split("/")[-1]
+    notation_id = _notation_id(_number(isin))
+    code = stock['marketscreener_id']
+    return [
+        overview,
+        onvista.OnvistaScraper._build_fundamental_url(overview),
+        "https://www.onvista.de/aktien/times+sales/{}".format(page),
+        stock['finanzennet_url'],
+        "http://www.finanzen.net/termine/synth_{}".format(_number(isin)),
+        "https://de.marketscreener.com/reuters_charts/afDataFeed.php"
+        "?codeZB={}&t=dcons&iLang=3".format(code),
+        "https://de.marketscreener.com//reuters_charts/afDataFeed.php"
+        "?&codeZB={}&t=rev&sub_t=bna&iLang=1".format(code),
+    ] + onvista._price_series_urls(notation_id)
@@ -0,0 +1,399 @@
+"""
+run.py
+
+Times the stages of a universe run without touching the network. All
+requests go through ``common.set_transport`` to synthetic or recorded
+responses, the HTTP cache is disabled and every universe gets a fresh SQLite
+database.
+
+Stages:
+    * ``fetch``: all pages of the universe through common.fetch_all
+    * ``parse``: the extract functions of the scrapers on these pages
+    * ``scrape``: Stock objects incl. price series, as in a batch run
+    * ``evaluate``: Levermann criteria and score, nothing is saved
+    * ``persist``: saving stock, values and points
+
+The responses are prepared before a stage starts, so the stages only
+contain the time of the stockanalyser code.
+
+Usage:
+    python -m benchmarks.run --sizes 1,30,500,5000 --output new.json
+    python -m benchmarks.run --compare old.json --output new.json
+    python -m benchmarks.run --record fixtures/ DE0007164600 DE0008404005
+    python -m benchmarks.run --fixtures fixtures/
+    python -m benchmarks.run --parse-workers 4 --compare old.json
+
+The results are written as json, ``--compare`` prints the change of every
+stage against an earlier result file and exits with 1 on regressions.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import fixtures
+from stockanalyser import batch, instrumentation
+from stockanalyser.analysis.levermann import Levermann
+from stockanalyser.data_source import cache, common, finanzen_net, onvista, \
+    parsing
+from stockanalyser.data_source.marketscreener import MarketScreenerScraper
+from stockanalyser.database import aktieninformation, database_interface, \
+    models
+from stockanalyser.stock import Stock
+
+logger = logging.getLogger(__name__)
+
+SIZES = (1, 30, 500, 5000)
+STAGES = ("fetch", "parse", "scrape", "evaluate", "persist")
+# pages of this many stocks are fetched and parsed at once
+CHUNK = 100
+# slower by more than this fraction counts as regression
+THRESHOLD = 0.1
+# differences below this are noise, in seconds
+MIN_DIFFERENCE = 0.005
+FORMAT_VERSION = 1
+
+
+def _parse_consensus(body: bytes):
+    scraper = MarketScreenerScraper()
+    scraper._set_consensus(body)
+    return scraper._data_consensus
+
+
+def _parse_revision(body: bytes):
+    scraper = MarketScreenerScraper()
+    scraper._set_revision(body)
+    return scraper._data_revision_cy, scraper._data_revision_ny
+
+
+PARSERS = {
+    "overview": lambda body: parsing.extract_page(
+        onvista.extract_overview, body),
+    "fundamental": lambda body: parsing.extract_page(
+        onvista.extract_fundamentals, body),
+    "times_sales": lambda body: parsing.extract_page(
+        onvista.extract_notation_id, body),
+    "price_csv": onvista._parse_price_csv,
+    "historic_quote": json.loads,
+    "stock_page": lambda body: parsing.extract_page(
+        finanzen_net.extract_stock_page, body),
+    "termine": lambda body: parsing.extract_page(
+        finanzen_net.extract_quarterly_figure_dates, body),
+    "consensus": _parse_consensus,
+    "revision": _parse_revision,
+}
+
+
+class StageTimer(object):
+    """
+    Sums the duration of each stage
+    """
+
+    def __init__(self):
+        self.seconds = {stage: 0.0 for stage in STAGES}
+
+    def measure(self, stage: str, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _parse(url: str, body: bytes) -> bool:
+    parser = PARSERS.get(fixtures.page_kind(url))
+    if parser is None:
+        return True
+    try:
+        parser(body)
+        return True
+    except Exception as e:
+        logger.warning("Couldn't parse {}: {!r}".format(url, e))
+        return False
+
+
+def _parse_all(urls: list, bodies: list) -> list:
+    """With parse workers as many pages are parsed at the same time as
+    there are processes"""
+    workers = parsing.workers()
+    if not workers:
+        return list(map(_parse, urls, bodies))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_parse, urls, bodies))
+
+
+def _fetch_and_parse(urls: list, transport, timer: StageTimer) -> int:
+    """Fetches and parses the pages, returns the number of parse errors"""
+    errors = 0
+    for chunk in _chunks(urls, CHUNK * 10):
+        transport.prepare(chunk)
+        bodies = timer.measure("fetch", common.fetch_all, chunk)
+        parsed = timer.measure("parse", _parse_all, chunk, bodies)
+        errors += parsed.count(False)
+    return errors
+
+
+def _evaluate_stock(isin: str, timer: StageTimer) -> int:
+    with instrumentation.stock(isin):
+        stock = timer.measure("scrape", _scrape, isin)
+        levermann = Levermann(stock=stock, auto_evaluate=False)
+        result, _ = timer.measure("evaluate", levermann.evaluate, False)
+        timer.measure("persist", levermann.save, result)
+    return result.score
+
+
+def _scrape(isin: str) -> Stock:
+    stock = Stock(isin=isin, auto_update=False)
+    stock.update_stock_info(save=False)
+    # the price series is part of the pages of a stock, not of evaluate
+    stock.OS.price_series(stock.OS.notation_id)
+    return stock
+
+
+def _prepare_database(directory: str):
+    database_interface.configure(
+        "sqlite:///{}".format(os.path.join(directory, "benchmark.db")))
+    database_interface.create_tables()
+    aktieninformation.invalidate_cache()
+
+
+def run_universe(name: str, isins: list, pages: dict, transport,
+                 register: bool = True) -> dict:
+    """Runs all stages for the ISINs and returns the result of the run
+
+    :param pages: ISIN => urls of the stock, "" => other urls
+    """
+    urls = [url for stock_urls in pages.values() for url in stock_urls]
+    directory = tempfile.mkdtemp(prefix="stockanalyser-benchmark-")
+    try:
+        _prepare_database(directory)
+        if register:
+            fixtures.register(isins)
+            aktieninformation.invalidate_cache()
+        onvista.invalidate_benchmarks()
+        timer = StageTimer()
+        report = instrumentation.RunReport()
+        instrumentation.add_hook(report)
+        requests_start, bytes_start = transport.requests, transport.bytes
+        parse_errors = _fetch_and_parse(urls, transport, timer)
+
+        transport.prepare(fixtures.benchmark_urls())
+        timer.measure("scrape", onvista.warm_up_benchmarks)
+        scores, failed = [], []
+        for isin in isins:
+            transport.prepare(pages.get(isin, ()))
+            try:
+                scores.append(_evaluate_stock(isin, timer))
+            except (Exception, SystemExit) as e:
+                # Stock() calls exit() if it can't be created
+                logger.exception("Benchmark of {} failed".format(isin))
+                failed.append({"isin": isin, "error": repr(e)})
+    finally:
+        instrumentation.remove_hook(report)
+        _close_database()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    totals = report.to_dict()["totals"]
+    stages = {stage: {"seconds": round(seconds, 6),
+                      "per_stock_ms": round(seconds * 1000 / len(isins), 4)}
+              for stage, seconds in timer.seconds.items()}
+    return {
+        "name": name,
+        "size": len(isins),
+        "pages": len(urls),
+        "requests": transport.requests - requests_start,
+        "bytes": transport.bytes - bytes_start,
+        "parse_errors": parse_errors,
+        "failed": failed,
+        "mean_score": round(sum(scores) / len(scores), 4) if scores else None,
+        "stages": stages,
+        "criteria_seconds": totals["criteria_seconds"],
+        "db_statements": totals["db_statements"],
+        "total_seconds": round(timer.total, 6),
+    }
+
+
+def _close_database():
+    if models.database.obj is not None:
+        models.database.obj.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> dict:
+    return {
+        "format": FORMAT_VERSION,
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "argv": sys.argv[1:],
+    }
+
+
+def run_synthetic(sizes) -> list:
+    transport = fixtures.SyntheticTransport()
+    common.set_transport(transport)
+    try:
+        results = []
+        for size in sizes:
+            isins = fixtures.universe(size)
+            pages = {isin: fixtures.stock_urls(isin) for isin in isins}
+            logger.warning("Synthetic universe of {} stocks".format(size))
+            results.append(run_universe("synthetic-{}".format(size), isins,
+                                        pages, transport))
+        return results
+    finally:
+        common.set_transport()
+
+
+def run_recorded(directory: str) -> list:
+    transport = fixtures.ReplayTransport(directory)
+    common.set_transport(transport)
+    try:
+        isins = transport.isins()
+        if not isins:
+            raise ValueError("No recorded stocks in {}".format(directory))
+        result = run_universe("recorded-{}".format(len(isins)), isins,
+                              {"": transport.urls()}, transport,
+                              register=False)
+    finally:
+        common.set_transport()
+    result["missing"] = sorted(set(transport.missing))
+    return [result]
+
+
+def record(directory: str, isins: list):
+    """Evaluates real stocks and stores all responses in directory"""
+    common.set_transport(fixtures.RecordingTransport(directory))
+    temp = tempfile.mkdtemp(prefix="stockanalyser-record-")
+    try:
+        _prepare_database(temp)
+        for isin in isins:
+            print(batch.evaluate_isin(isin, from_database=False))
+    finally:
+        common.set_transport()
+        _close_database()
+        shutil.rmtree(temp, ignore_errors=True)
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    """Prints the change of each stage, returns the regressions"""
+    old_runs = {run["name"]: run for run in previous["runs"]}
+    regressions = []
+    print("{:<16} {:<9} {:>11} {:>11} {:>8}".format(
+        "run", "stage", "old [s]", "new [s]", "change"))
+    for run in current["runs"]:
+        old = old_runs.get(run["name"])
+        if old is None:
+            continue
+        for stage in STAGES + ("total",):
+            if stage == "total":
+                old_s, new_s = old["total_seconds"], run["total_seconds"]
+            else:
+                old_s = old["stages"][stage]["seconds"]
+                new_s = run["stages"][stage]["seconds"]
+            change = (new_s - old_s) / old_s if old_s else 0.0
+            regression = change > threshold and \
+                new_s - old_s > MIN_DIFFERENCE
+            print("{:<16} {:<9} {:>11.4f} {:>11.4f} {:>+7.1%}{}".format(
+                run["name"], stage, old_s, new_s, change,
+                " REGRESSION" if regression else ""))
+            if regression:
+                regressions.append((run["name"], stage, change))
+    return regressions
+
+
+def configure_argparse():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of the stockanalyser stages")
+    parser.add_argument("ISIN", nargs="*", help="stocks to record")
+    parser.add_argument("-s", "--sizes", default=",".join(map(str, SIZES)),
+                        help="sizes of the synthetic universes, default: "
+                             "%(default)s")
+    parser.add_argument("-f", "--fixtures", metavar="DIR",
+                        help="replay the responses recorded in DIR instead "
+                             "of synthetic universes")
+    parser.add_argument("--record", metavar="DIR",
+                        help="evaluate the ISINs online and record all "
+                             "responses in DIR")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the results to FILE, default: stdout")
+    parser.add_argument("-c", "--compare", metavar="FILE",
+                        help="compare with the results in FILE")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD,
+                        help="relative slowdown that counts as regression, "
+                             "default: %(default)s")
+    parser.add_argument("-p", "--parse-workers", type=int, default=0,
+                        help="parse pages in this many processes, "
+                             "default: in the calling thread")
+    parser.add_argument("-d", "--debug", action='store_true')
+    return parser.parse_args()
+
+
+def main():
+    args = configure_argparse()
+    logging.basicConfig(level=logging.DEBUG if args.debug else
+                        logging.WARNING)
+    cache.ENABLED = False
+
+    if args.record:
+        if not args.ISIN:
+            sys.exit("--record needs at least one ISIN")
+        record(args.record, args.ISIN)
+        return
+
+    parsing.set_workers(args.parse_workers)
+    try:
+        if args.fixtures:
+            runs = run_recorded(args.fixtures)
+        else:
+            runs = run_synthetic([int(size)
+                                  for size in args.sizes.split(",")])
+    finally:
+        parsing.shutdown()
+    results = {"meta": metadata(), "runs": runs}
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
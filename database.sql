@@ -1,3 +1,6 @@
+-- Schema of a new database. Existing databases are updated with the
+-- scripts in migrations/, in the order of their numbers.
+
 CREATE TABLE `aktie_levermann_punkte` (
   `idaktie_levermann_punkte` int(11) NOT NULL AUTO_INCREMENT,
   `id_aktie` int(11) NOT NULL,
@@ -26,7 +29,7 @@ CREATE TABLE `aktie_levermann_values` (
   `id_aktie` int(11) NOT NULL,
   `datum` datetime NOT NULL,
   `kurs` decimal(18,2) DEFAULT NULL,
-  `analyst_bewertung` int(11) DEFAULT NULL COMMENT '1: Kaufen 5: Verkaufen',
+  `analyst_bewertung` decimal(4,2) DEFAULT NULL COMMENT '0: Verkaufen 10: Kaufen (MarketScreener Konsens)',
   `analysten_anzahl` int(11) DEFAULT NULL,
   `kurs_ziel` decimal(18,2) DEFAULT NULL,
   `kgv` decimal(7,2) DEFAULT NULL,
@@ -62,7 +65,8 @@ CREATE TABLE `aktien_information` (
   UNIQUE KEY `ISIN_UNIQUE` (`ISIN`),
   UNIQUE KEY `Symbol_UNIQUE` (`notation_id`),
   UNIQUE KEY `Marketscreener-ID_UNIQUE` (`Marketscreener-ID`),
-  KEY `fk_aktien_idx` (`ISIN`,`Onvista-URL`)
+  KEY `fk_aktien_idx` (`ISIN`,`Onvista-URL`),
+  KEY `Name_idx` (`Name`)
 ) ENGINE=InnoDB AUTO_INCREMENT=18 DEFAULT CHARSET=latin1 COMMENT='Alle Informationen die sich nicht ändern: Name, ISIN, Symbol, Links, usw.';
 
 CREATE TABLE `aktien_jaehrliche_daten` (
@@ -79,6 +83,7 @@ CREATE TABLE `aktien_jaehrliche_daten` (
   `Q3` datetime DEFAULT NULL,
   `Q4` datetime DEFAULT NULL,
   PRIMARY KEY (`idaktien_jaehrliche_daten`),
+  UNIQUE KEY `aktie_id_jahr_UNIQUE` (`aktie_id`,`Jahr`),
   KEY `aktie_id_idx` (`aktie_id`),
   CONSTRAINT `aktie_id` FOREIGN KEY (`aktie_id`) REFERENCES `aktien_information` (`aktie_id`) ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=112 DEFAULT CHARSET=latin1 COMMENT='Daten die sich nicht mehr ändern';
@@ -0,0 +1,31 @@
+-- Adds the unique key (aktie_id, Jahr) to aktien_jaehrliche_daten.
+--
+-- The yearly data is saved with INSERT ... ON DUPLICATE KEY UPDATE, which
+-- needs this key. Databases created from an older database.sql don't have
+-- it and may already contain several rows per stock and year. The newest
+-- row of a stock and year is kept. Quarterly figure dates that only an
+-- older row has are copied into it first.
+
+UPDATE `aktien_jaehrliche_daten` `newest`
+JOIN (
+  SELECT `aktie_id`, `Jahr`,
+         MAX(`Q1`) AS `Q1`, MAX(`Q2`) AS `Q2`,
+         MAX(`Q3`) AS `Q3`, MAX(`Q4`) AS `Q4`
+  FROM `aktien_jaehrliche_daten`
+  GROUP BY `aktie_id`, `Jahr`
+  HAVING COUNT(*) > 1
+) `known` ON `known`.`aktie_id` = `newest`.`aktie_id`
+         AND `known`.`Jahr` = `newest`.`Jahr`
+SET `newest`.`Q1` = COALESCE(`newest`.`Q1`, `known`.`Q1`),
+    `newest`.`Q2` = COALESCE(`newest`.`Q2`, `known`.`Q2`),
+    `newest`.`Q3` = COALESCE(`newest`.`Q3`, `known`.`Q3`),
+    `newest`.`Q4` = COALESCE(`newest`.`Q4`, `known`.`Q4`);
+
+DELETE `older` FROM `aktien_jaehrliche_daten` `older`
+JOIN `aktien_jaehrliche_daten` `newer`
+  ON `newer`.`aktie_id` = `older`.`aktie_id`
+ AND `newer`.`Jahr` = `older`.`Jahr`
+ AND `newer`.`idaktien_jaehrliche_daten` > `older`.`idaktien_jaehrliche_daten`;
+
+ALTER TABLE `aktien_jaehrliche_daten`
+  ADD UNIQUE KEY `aktie_id_jahr_UNIQUE` (`aktie_id`,`Jahr`);
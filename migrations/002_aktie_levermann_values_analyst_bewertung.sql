@@ -0,0 +1,14 @@
+-- Stores the analyst consensus with two decimals.
+--
+-- As int(11) the column truncated the 0-10 MarketScreener consensus, e.g.
+-- 6.9 to 6, so it lost the thresholds at 3 and 7. Stocks that are loaded
+-- from the database reuse a consensus of the last 7 days
+-- (stock.ANALYST_DATA_MAX_AGE). The truncated values of that period are
+-- removed, so the consensus is scraped again instead of being reused.
+
+ALTER TABLE `aktie_levermann_values`
+  MODIFY `analyst_bewertung` decimal(4,2) DEFAULT NULL COMMENT '0: Verkaufen 10: Kaufen (MarketScreener Konsens)';
+
+UPDATE `aktie_levermann_values`
+SET `analyst_bewertung` = NULL
+WHERE `datum` >= NOW() - INTERVAL 7 DAY;
@@ -1,12 +1,20 @@
+import concurrent.futures
+import contextvars
 import datetime
 import logging
+import threading
 from datetime import date, timedelta
 from enum import Enum, unique
 
+from stockanalyser import deadlines, instrumentation
 from stockanalyser.analysis import levernann_result
-from stockanalyser.data_source import common
+from stockanalyser.analysis.thresholds import (
+    ANALYST_CONSENSUS, ANALYSTS_CONTRARIAN, EARNING_GROWTH, EARNING_REVISION,
+    EBIT_MARGIN, EQUITY_RATIO, PRICE_EARNINGS_RATIO, QUARTERLY_REACTION,
+    QUOTE_CHANGE, ROE)
+from stockanalyser.data_source import common, onvista, trading_calendar
 from stockanalyser.database import database_interface
-from stockanalyser.exceptions import NotSupportedError
+from stockanalyser.exceptions import DeadlineExceededError, NotSupportedError
 from stockanalyser.stock import Cap, Stock
 
 logger = logging.getLogger(__name__)
@@ -15,14 +23,98 @@ THIS_YEAR = date.today().year
 LAST_YEAR = date.today().year - 1
 
 
+# Criteria of the Levermann strategy, name => Criterion, see criterion()
+CRITERIA = {}
+# Data that is loaded before the criteria need it, name => Criterion
+DATA = {}
+# threads that evaluate criteria, shared by all Levermann objects
+CRITERIA_WORKERS = 16
+
+_criteria_executor_instance = None
+_criteria_executor_lock = threading.Lock()
+
+
+class Criterion(object):
+    """
+    A node of the evaluation: the Levermann method, the criteria whose points
+    are passed to it, the data it needs and the fields of the Stock it reads
+    """
+    __slots__ = ("name", "method", "inputs", "data", "fields")
+
+    def __init__(self, name: str, method: str, inputs: tuple = (),
+                 data: tuple = (), fields: tuple = ()):
+        self.name = name
+        self.method = method
+        self.inputs = tuple(inputs)
+        self.data = tuple(data)
+        self.fields = tuple(fields)
+
+    @property
+    def requires(self) -> tuple:
+        return self.inputs + self.data
+
+
+def _method_name(method) -> str:
+    return getattr(method, "__func__", method).__name__
+
+
+def criterion(name: str, inputs: tuple = (), data: tuple = (),
+              fields: tuple = ()):
+    """Registers the decorated Levermann method as evaluation of a criterion
+
+    :param name: attribute of the LevermannResult the rating is stored in
+    :param inputs: criteria that have to be evaluated before, their points
+        are the arguments of the method
+    :param data: names of the data loaders the method needs, see loader()
+    :param fields: fields of the Stock the method reads, the criterion is
+        missing if one of them is in ``Stock.missing``
+    """
+    def register(method):
+        CRITERIA[name] = Criterion(name, _method_name(method), inputs, data,
+                                   fields)
+        return method
+    return register
+
+
+def loader(name: str):
+    """Registers the decorated Levermann method as loader of data that
+    criteria depend on. Loaders fill caches, their result is not used"""
+    def register(method):
+        DATA[name] = Criterion(name, _method_name(method))
+        return method
+    return register
+
+
+def _ladder_points(value, thresholds: tuple) -> int:
+    """-1 below the low threshold, 1 above the high one, 0 in between"""
+    low, high = thresholds
+    if value < low:
+        return -1
+    if value > high:
+        return 1
+    return 0
+
+
+def _criteria_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _criteria_executor_instance
+    with _criteria_executor_lock:
+        if _criteria_executor_instance is None:
+            _criteria_executor_instance = \
+                concurrent.futures.ThreadPoolExecutor(
+                    max_workers=CRITERIA_WORKERS,
+                    thread_name_prefix="criteria")
+        return _criteria_executor_instance
+
+
 class CriteriaRating(object):
     """
     Savaes value and point of a rating
     """
 
-    def __init__(self, value, point):
+    def __init__(self, value, point, raw=None):
         self._value = value
         self._points = point
+        self._raw = raw
 
     def __str__(self):
         string = "Value: {} | Points: {} ".format(self._value, self._points)
@@ -36,6 +128,11 @@ class CriteriaRating(object):
     def points(self):
         return self._points
 
+    @property
+    def raw(self):
+        """Intermediate values the rating is based on, e.g. both quotes"""
+        return self._raw
+
 
 @unique
 class Recommendation(Enum):
@@ -67,12 +164,12 @@ class Levermann(object):
     """
 
     def __init__(self, stock: Stock = None, isin: str = None,
-                 auto_evaluate: bool = True):
+                 auto_evaluate: bool = True, from_database: bool = False):
         logger.info("Initializing {}".format(type(self).__name__))
         if stock is not None:
             self.stock = stock
         elif isin is not None:
-            self.stock = Stock(isin=isin)
+            self.stock = Stock(isin=isin, from_database=from_database)
         else:
             logger.critical(
                 "To few arguments, Stock object or ISIN are required")
@@ -95,9 +192,12 @@ class Levermann(object):
                 "Only DAX Stocks are supported. The stock symbol has to end "
                 "with .de")
 
-    def evaluate(self) -> tuple:
+    def evaluate(self, save: bool = True, parallel: bool = True) -> tuple:
         """
         Evaluates complete Levermann rating
+        :param save: False skips saving stock and result to the database
+        :param parallel: evaluate independent criteria concurrently, see
+            _evaluate_criteria
         :return: Levermann Result Object and a boolean:
                                             * True: if ratings are new
                                             * False: if ratings aren't older
@@ -109,116 +209,13 @@ class Levermann(object):
         levermann_result = levernann_result.LevermannResult(
             name=self.stock.name, isin=self.stock.ISIN)
 
-        try:
-            levermann_result.roe = self._eval_roe()
-        except Exception as e:
-            logging.exception("Exception at {}.".format("self._eval_roe()"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format("self._eval_roe()"))
-        try:
-            levermann_result.ebit_margin = self._eval_ebit_margin()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_ebit_margin()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self._eval_ebit_margin()"))
-        try:
-            levermann_result.equity_ratio = self._eval_equity_ratio()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_equity_ratio()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self._eval_equity_ratio()"))
-        try:
-            levermann_result.price_earnings_ratio = \
-                self._eval_price_earnings_ratio()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_price_earnings_ratio()"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format(
-            "self._eval_price_earnings_ratio()"))
-        try:
-            levermann_result.five_years_price_earnings_ratio = \
-                self._eval_five_years_price_earnings_ratio()
-        except Exception as e:
-            logging.exception("Exception at {}.".format(
-                "self._eval_five_years_price_earnings_ratio()"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format(
-            "self._eval_five_years_price_earnings_ratio()"))
-        try:
-            levermann_result.analyst_rating = self._eval_analyst_rating()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_analyst_rating()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self._eval_analyst_rating()"))
-        try:
-            levermann_result.quarterly_figures_reaction = \
-                self.eval_quarterly_figures_reaction()
-        except Exception as e:
-            logging.exception("Exception at {}.".format(
-                "self.eval_quarterly_figures_reaction()"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format(
-            "self.eval_quarterly_figures_reaction()"))
-        try:
-            levermann_result.quote_chg_6month = self.eval_quote_chg_6month()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self.eval_quote_chg_6month()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self.eval_quote_chg_6month()"))
-        try:
-            levermann_result.quote_chg_1year = self.eval_quote_chg_12month()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self.eval_quote_chg_12month()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self.eval_quote_chg_12month()"))
-        try:
-            levermann_result.momentum = self._eval_momentum(
-                levermann_result.quote_chg_6month.points,
-                levermann_result.quote_chg_1year.points)
-        except Exception as e:
-            logging.exception("Exception at {}.".format(
-                "self._eval_momentum(levermann_result.quote_chg_6month.points,"
-                " levermann_result.quote_chg_1year.points)"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format(
-            "self._eval_momentum(levermann_result.quote_chg_6month.points,"
-            " levermann_result.quote_chg_1year.points)"))
-        try:
-            levermann_result.three_month_reversal = \
-                self._eval_three_month_reversal()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_three_month_reversal()"))
-            logging.exception(e)
-        logger.info("Finished evaluating: {}".format(
-            "self._eval_three_month_reversal()"))
-        try:
-            levermann_result.earning_growth = self._eval_earning_growth()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_earning_growth()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self._eval_earning_growth()"))
-        try:
-            levermann_result.earning_revision = self._eval_earning_revision()
-        except Exception as e:
-            logging.exception(
-                "Exception at {}.".format("self._eval_earning_revision()"))
-            logging.exception(e)
-        logger.info(
-            "Finished evaluating: {}".format("self._eval_earning_revision()"))
+        with instrumentation.stock(self.stock.ISIN):
+            self._evaluate_criteria(levermann_result, parallel)
+        if not levermann_result.complete:
+            logger.warning("Evaluated {} without the criteria: {}".format(
+                self.stock.ISIN, ", ".join(levermann_result.missing)))
+
+        levermann_result.capture(self.stock)
 
         if self.evaluation_results:
             last = self.evaluation_results[-1]
@@ -234,17 +231,113 @@ class Levermann(object):
                 return last, False
 
         self.evaluation_results.append(levermann_result)
+        if save:
+            self.save(levermann_result)
+        return levermann_result, True
 
-        # Save data after evaluation finished
+    def _evaluate_criteria(self, levermann_result, parallel: bool = True):
+        """Evaluates all registered criteria into levermann_result
+
+        A criterion starts as soon as its inputs are evaluated and its data
+        is loaded. In parallel the loaders and independent criteria run on a
+        shared thread pool, so the price series of the stock and of the
+        reference index are fetched at the same time and the evaluation
+        takes as long as the longest chain of criteria.
+        """
+        executor = _criteria_executor() if parallel else None
+        waiting = list(DATA.values()) + list(CRITERIA.values())
+        done = set()
+        running = {}
+        while waiting or running:
+            ready = [c for c in waiting if done.issuperset(c.requires)]
+            for c in ready:
+                waiting.remove(c)
+                # the task keeps the stock of the instrumentation context
+                context = contextvars.copy_context()
+                if executor is None:
+                    context.run(self._evaluate_criterion, c, levermann_result)
+                    done.add(c.name)
+                else:
+                    running[executor.submit(
+                        context.run, self._evaluate_criterion, c,
+                        levermann_result)] = c
+            if not running:
+                if waiting and not ready:
+                    raise ValueError("Criteria with unknown or cyclic inputs:"
+                                     " {}".format([c.name for c in waiting]))
+                continue
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                done.add(running.pop(future).name)
+
+    def _evaluate_criterion(self, c, levermann_result):
+        """Sets the rating of one criterion, errors are only logged
+
+        After the deadline (see :mod:`stockanalyser.deadlines`) and if an
+        input or a field of the stock is missing the criterion is marked as
+        missing in levermann_result instead.
+        """
+        if c.name in DATA:
+            try:
+                getattr(self, c.method)()
+            except Exception as e:
+                # the criteria fetch what they need on their own
+                logger.warning("Couldn't load {}: {!r}".format(c.name, e))
+            return
+        missing = [name for name in c.inputs
+                   if name in levermann_result.missing]
+        if missing:
+            levermann_result.mark_missing(
+                c.name, "{} missing".format(", ".join(missing)))
+            return
+        missing = [name for name in c.fields if name in self.stock.missing]
+        if missing:
+            levermann_result.mark_missing(
+                c.name, "{} missed the deadline".format(", ".join(missing)))
+            return
+        if deadlines.expired():
+            levermann_result.mark_missing(c.name, "deadline exceeded")
+            return
+        with instrumentation.criterion(c.name):
+            try:
+                args = [getattr(levermann_result, name).points
+                        for name in c.inputs]
+                setattr(levermann_result, c.name,
+                        getattr(self, c.method)(*args))
+            except DeadlineExceededError as e:
+                logger.warning("{} of {}: {}".format(
+                    c.name, self.stock.ISIN, e))
+                levermann_result.mark_missing(c.name, "deadline exceeded")
+            except Exception as e:
+                logging.exception("Exception at {}.".format(c.method))
+                logging.exception(e)
+        logger.info("Finished evaluating: {}".format(c.method))
+
+    @loader("price_series")
+    def _load_price_series(self):
+        self.stock.OS.price_series(self.stock.OS.notation_id)
+
+    @loader("benchmark_series")
+    def _load_benchmark_series(self):
+        onvista.benchmark_series(self.reference_index)
+
+    def save(self, levermann_result=None, yearly: bool = True):
+        """Saves stock, values and points of an evaluation to the database
+
+        :param levermann_result: evaluation to save, default: the last one
+        :param yearly: False skips the yearly data of the stock, see
+            Stock.save
+        """
+        if levermann_result is None:
+            levermann_result = self.evaluation_results[-1]
         logger.info('<<|{:^30}|>>'.format("Saving all data to database"))
-        self.stock.save()
-        self.save_levermann_analysis()
+        self.stock.save(yearly=yearly)
+        self.save_levermann_analysis(levermann_result)
         levermann_result.save_points()
         logger.info('<<|{:^30}|>>'.format("Done"))
         logger.info(levermann_result.__str__())
 
-        return levermann_result, True
-
     def _outdated(self):
         if not self.evaluation_results:
             return True
@@ -254,6 +347,7 @@ class Levermann(object):
             return True
         return False
 
+    @criterion("earning_growth", fields=("eps",))
     def _eval_earning_growth(self):
         logger.debug("Evaluating earning growth")
         # Sorted! Uses dict to get amount
@@ -274,8 +368,9 @@ class Levermann(object):
                          "Change: {}%".format(eps_cur_year, eps_next_year,
                                               chg))
 
-            if -5 <= chg <= 5:
-                logger.debug("Earning growth change >=-5%%, <=5% => 0 Points")
+            if EARNING_GROWTH[0] <= chg <= EARNING_GROWTH[1]:
+                logger.debug("Earning growth change >={}%, <={}% => 0 "
+                             "Points".format(*EARNING_GROWTH))
                 _points = 0
             elif eps_cur_year < eps_next_year:
                 logger.debug(
@@ -288,7 +383,8 @@ class Levermann(object):
                     " year => -1 Points")
                 _points = -1
 
-            return CriteriaRating(chg, _points)
+            return CriteriaRating(chg, _points,
+                                  raw=(eps_cur_year, eps_next_year))
 
         except (NameError, TypeError, ValueError, AttributeError, KeyError,
                 IndexError) as e:
@@ -298,15 +394,17 @@ class Levermann(object):
     def _calc_ref_index_comp(self, adate):
         # compare quote of stock with the quote of the reference index at the
         # last day of the month
-        d = common.closest_weekday(adate)
-        prev_month_date = common.closest_weekday(common.prev_month(adate))
+        d, prev_month_date = trading_calendar.month_end(
+            [adate, common.prev_month(adate)]).astype(date)
 
         quote = self.stock.OS.get_historic_data(d)
         prev_quote = self.stock.OS.get_historic_data(prev_month_date)
         q_diff = ((quote / prev_quote) - 1) * 100
 
-        ref_quote = self.stock.OS.get_historic_data(d)
-        prev_ref_quote = self.stock.OS.get_historic_data(prev_month_date)
+        ref_quote = self.stock.OS.get_historic_data(
+            d, index=self.reference_index)
+        prev_ref_quote = self.stock.OS.get_historic_data(
+            prev_month_date, index=self.reference_index)
         ref_q_diff = ((ref_quote / prev_ref_quote) - 1) * 100
 
         logger.debug(
@@ -317,6 +415,8 @@ class Levermann(object):
 
         return q_diff - ref_q_diff
 
+    @criterion("three_month_reversal",
+               data=("price_series", "benchmark_series"))
     def _eval_three_month_reversal(self):
         logger.debug("Evaluating 3 month reversal")
         try:  # TODO change single char variable
@@ -353,6 +453,7 @@ class Levermann(object):
         chg = round(chg, 2)
         return chg, self._calc_quite_chg_points(chg)
 
+    @criterion("quote_chg_6month", data=("price_series",))
     def eval_quote_chg_6month(self):
         try:
             chg, _points = self._eval_quote_chg_daydiff(182)
@@ -363,6 +464,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("quote_chg_1year", data=("price_series",))
     def eval_quote_chg_12month(self):
         try:
             chg, _points = self._eval_quote_chg_daydiff(365)
@@ -373,6 +475,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("earning_revision", fields=("eval_earning_revision",))
     def _eval_earning_revision(self):
         try:
             cur_year_eps = self.stock.eval_earning_revision_cy
@@ -399,7 +502,10 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
-    def eval_quarterly_figures_reaction(self, case: str = ''):
+    @criterion("quarterly_figures_reaction",
+               data=("price_series", "benchmark_series"),
+               fields=("quarterly_figure_dates",))
+    def eval_quarterly_figures_reaction(self):
         logger.debug("Evaluating stock reaction on"
                      "quarterly figures")
         try:
@@ -431,9 +537,10 @@ class Levermann(object):
                     ref_index_quote,
                     ref_previous_index_quote, ref_index_chg))
 
-            if -1 <= rel_qf_reaction < 1:
+            low, high = QUARTERLY_REACTION
+            if low <= rel_qf_reaction < high:
                 _points = 0
-            elif rel_qf_reaction >= 1:
+            elif rel_qf_reaction >= high:
                 _points = 1
             else:
                 _points = -1
@@ -443,18 +550,14 @@ class Levermann(object):
                 " {}%, => {} Points".format(
                     rel_qf_reaction, _points))
 
-            if case is 'sql_data':
-                return qf_reaction, ref_index_chg
-
-            return CriteriaRating(rel_qf_reaction, _points)
+            return CriteriaRating(rel_qf_reaction, _points,
+                                  raw=(qf_reaction, ref_index_chg))
         except (NameError, TypeError, ValueError, AttributeError, KeyError,
                 IndexError) as e:
             logging.exception(e)
-            if case is 'sql_data':
-                return 0, 0
-            else:
-                return CriteriaRating(0, 0)
+            return CriteriaRating(0, 0)
 
+    @criterion("analyst_rating", fields=("consensus_ratings",))
     def _eval_analyst_rating(self):
         try:
             analyst_ratings = self.stock.consensus_ratings
@@ -465,16 +568,17 @@ class Levermann(object):
             number_of_analysts = int(analyst_ratings["n_analysts"])
             logger.debug("Analyst score: %s" % consensus)
 
-            if consensus < 3:
+            low, high = ANALYST_CONSENSUS
+            if consensus < low:
                 _points = -1
-            elif consensus < 7:
+            elif consensus < high:
                 _points = 0
-            elif consensus > 7:
+            elif consensus > high:
                 _points = 1
             else:
                 raise ValueError("Wrong Type")
 
-            if number_of_analysts >= 5:
+            if number_of_analysts >= ANALYSTS_CONTRARIAN:
                 _points *= -1
 
             return CriteriaRating(consensus, _points)
@@ -483,19 +587,22 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("five_years_price_earnings_ratio", fields=("per",))
     def _eval_five_years_price_earnings_ratio(self):
         try:
             per = self.stock.price_earnings_ratio_5year()
             logger.debug("Evaluating 5year PER: %s" % per)
 
-            if 0 < per < 12:
-                logger.debug("5 year PER <12: 1 Points")
+            low, high = PRICE_EARNINGS_RATIO
+            if 0 < per < low:
+                logger.debug("5 year PER <{}: 1 Points".format(low))
                 _points = 1
-            elif 12 <= per <= 16:
-                logger.debug("5 year PER >=12, <=16: 0 Points")
+            elif low <= per <= high:
+                logger.debug("5 year PER >={}, <={}: 0 Points".format(
+                    low, high))
                 _points = 0
             else:
-                logger.debug("5 year PER >16: -1 Points")
+                logger.debug("5 year PER >{}: -1 Points".format(high))
                 _points = -1
 
             return CriteriaRating(per, _points)
@@ -504,6 +611,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("price_earnings_ratio", fields=("per",))
     def _eval_price_earnings_ratio(self):
         try:
             per = self.stock.per[THIS_YEAR]
@@ -512,14 +620,17 @@ class Levermann(object):
             if per is None or 0:
                 logger.warn("Missing PER (KGV) information")
                 return CriteriaRating(0, 0)
-            elif 0 < per < 12:
-                logger.debug("PER <12: 1 Points")
+            elif 0 < per < PRICE_EARNINGS_RATIO[0]:
+                logger.debug("PER <{}: 1 Points".format(
+                    PRICE_EARNINGS_RATIO[0]))
                 _points = 1
-            elif 12 <= per <= 16:
-                logger.debug("PER >=12, <=16: 0 Points")
+            elif PRICE_EARNINGS_RATIO[0] <= per <= PRICE_EARNINGS_RATIO[1]:
+                logger.debug("PER >={}, <={}: 0 Points".format(
+                    *PRICE_EARNINGS_RATIO))
                 _points = 0
             else:
-                logger.debug("PER >16: -1 Points")
+                logger.debug("PER >{}: -1 Points".format(
+                    PRICE_EARNINGS_RATIO[1]))
                 _points = -1
 
             return CriteriaRating(per, _points)
@@ -528,6 +639,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("roe", fields=("roe",))
     def _eval_roe(self):
         try:
             year = LAST_YEAR
@@ -539,15 +651,9 @@ class Levermann(object):
             roe = self.stock.roe[year]
 
             logger.debug("Evaluating RoE (%s): %s%%" % (year, roe))
-            if roe < 10:
-                logger.debug("ROE <10%: -1 Points")
-                _points = -1
-            elif 10 <= roe <= 20:
-                logger.debug("ROE >=10%, <=20%: 0 Points")
-                _points = 0
-            elif roe > 20:
-                logger.debug("ROE >20%: 1 Point")
-                _points = 1
+            _points = _ladder_points(roe, ROE)
+            logger.debug("ROE {}%, thresholds {}%: {} Points".format(
+                roe, ROE, _points))
 
             return CriteriaRating(roe, _points)
         except (NameError, TypeError, ValueError, AttributeError, KeyError,
@@ -555,6 +661,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("equity_ratio", fields=("equity_ratio",))
     def _eval_equity_ratio(self):
         try:
             last_year = LAST_YEAR
@@ -570,15 +677,9 @@ class Levermann(object):
 
             logger.debug("Evaluating equity ratio (%s): %s%%" % (last_year,
                                                                  equity_ratio))
-            if equity_ratio < 15:
-                logger.debug("Equity Ratio <10%: -1 Points")
-                _points = -1
-            elif 15 <= equity_ratio <= 25:
-                logger.debug("Equity Ratio >=15%, <=25%: 0 Points")
-                _points = 0
-            elif equity_ratio > 25:
-                logger.debug("Equity Ratio >25%: 1 Point")
-                _points = 1
+            _points = _ladder_points(equity_ratio, EQUITY_RATIO)
+            logger.debug("Equity Ratio {}%, thresholds {}%: {} Points".format(
+                equity_ratio, EQUITY_RATIO, _points))
 
             return CriteriaRating(equity_ratio, _points)
         except (NameError, TypeError, ValueError, AttributeError, KeyError,
@@ -586,6 +687,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("ebit_margin", fields=("ebit_margin",))
     def _eval_ebit_margin(self):
         try:
             last_year = LAST_YEAR
@@ -599,15 +701,9 @@ class Levermann(object):
             ebit_margin = self.stock.ebit_margin[last_year]
 
             logger.debug("Evaluating EBIT-Margin %s" % ebit_margin)
-            if ebit_margin < 6:
-                logger.debug("EBIT-Margin <6%: -1 Points")
-                _points = -1
-            elif 6 <= ebit_margin <= 12:
-                logger.debug("6% < EBIT-Margin < 12%: 0 Points")
-                _points = 0
-            elif ebit_margin > 12:
-                logger.debug("EBIT-Margin >12%: 1 Points")
-                _points = 1
+            _points = _ladder_points(ebit_margin, EBIT_MARGIN)
+            logger.debug("EBIT-Margin {}%, thresholds {}%: {} Points".format(
+                ebit_margin, EBIT_MARGIN, _points))
 
             return CriteriaRating(ebit_margin, _points)
         except (NameError, TypeError, ValueError, AttributeError, KeyError,
@@ -615,6 +711,7 @@ class Levermann(object):
             logging.exception(e)
             return CriteriaRating(0, 0)
 
+    @criterion("momentum", inputs=("quote_chg_6month", "quote_chg_1year"))
     @staticmethod
     def _eval_momentum(points_6month_chg, points_1year_chg):
         try:
@@ -634,21 +731,11 @@ class Levermann(object):
 
     @staticmethod
     def _calc_quite_chg_points(chg):
-        if -5 <= chg <= 5:
-            return 0
-        elif chg < -5:
-            return -1
-        elif chg > 5:
-            return 1
+        return _ladder_points(chg, QUOTE_CHANGE)
 
     @staticmethod
     def _calc_earning_rev_points(chg):
-        if -5 <= chg <= 5:
-            return 0
-        elif chg > 5:
-            return 1
-        elif chg < -5:
-            return -1
+        return _ladder_points(chg, EARNING_REVISION)
 
     def short_summary_header(self):
         string_short_summary_header = (
@@ -720,12 +807,15 @@ class Levermann(object):
 
         return Recommendation.NONE
 
-    def save_levermann_analysis(self) -> int:
+    def save_levermann_analysis(self, levermann_result=None) -> int:
         """Saves values to database
 
+        :param levermann_result: evaluation to save, default: the last one
         :return: amount of changed lines
         """
-        return database_interface.save_values(self)
+        if levermann_result is None:
+            levermann_result = self.evaluation_results[-1]
+        return database_interface.save_values(levermann_result)
 
 
 if __name__ == "__main__":
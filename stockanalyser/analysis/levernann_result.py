@@ -5,6 +5,23 @@ from stockanalyser.database import database_interface
 
 logger = logging.getLogger(__name__)
 
+# attributes with the ratings of the criteria
+CRITERIA = (
+    "roe",
+    "equity_ratio",
+    "ebit_margin",
+    "earning_growth",
+    "three_month_reversal",
+    "momentum",
+    "quote_chg_6month",
+    "quote_chg_1year",
+    "earning_revision",
+    "quarterly_figures_reaction",
+    "analyst_rating",
+    "five_years_price_earnings_ratio",
+    "price_earnings_ratio",
+)
+
 
 class LevermannResult(object):
     def __init__(self, name, isin):
@@ -27,6 +44,19 @@ class LevermannResult(object):
         self.three_month_reversal = None
         self.earning_growth = None
         self._score = None
+        # criteria that couldn't be evaluated in time, name => reason
+        self.missing = {}
+
+        # raw values the ratings are based on, see capture()
+        self.quote = None
+        self.consensus = None
+        self.n_analysts = None
+        self.per = None
+        self.five_year_per = None
+        self.eps = (None, None)
+        self.earning_revision_changes = (None, None)
+        self.quarterly_figures_date = None
+        self.quarterly_reactions = (None, None)
 
         self.THIS_YEAR = datetime.date.today().year
 
@@ -35,67 +65,82 @@ class LevermannResult(object):
         s += "\n"
         s = "{:<35} {:<25}\n".format("Analysed Stock", "{}".format(self.name))
         s += "\n"
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "RoE:", "%s%%" % self.roe.value, self.roe.points
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "Equity Ratio:", "%s%%" % self.equity_ratio.value, self.equity_ratio.points
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "EBIT Margin:", "%s%%" % self.ebit_margin.value, self.ebit_margin.points
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "%s vs. %s Earning growth:" % (self.THIS_YEAR, self.THIS_YEAR + 1),
-            "%.2f%%" % self.earning_growth.value,
-            self.earning_growth.points,
-        )
-        if type(self.three_month_reversal.value) is tuple:
-            if self.three_month_reversal.value[::-1][0]:
-                s += "{:<35} {:<25} | {} Points\n".format(
-                    "3 month reversal:",
-                    "%.2f%%, %.2f%%, %.2f%%" % self.three_month_reversal.value[::-1],
-                    self.three_month_reversal.points,
-                )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "Stock momentum (6m, 1y chg points):",
-            "%s Points, %s Points" % self.momentum.value,
-            self.momentum.points,
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "6 month quote movement:",
-            "%.2f%%" % self.quote_chg_6month.value,
-            self.quote_chg_6month.points,
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "1 year quote movement:",
-            "%.2f%%" % self.quote_chg_1year.value,
-            self.quote_chg_1year.points,
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "Earning revisions (6m, 1y points):",
-            "%s Points, %s Points" % self.earning_revision.value,
-            self.earning_revision.points,
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "Quarterly figures release reaction:",
-            "%.2g%%" % self.quarterly_figures_reaction.value,
-            self.quarterly_figures_reaction.points,
-        )
-        s += "{:<35} {:<25} | {} Points\n".format(
-            "MarketScreener analyst rating",
-            str(self.analyst_rating.value or ""),
-            self.analyst_rating.points,
-        )
-        s += "{:<35} {:<25.2f} | {} Points\n".format(
-            "Price earnings ratio",
-            self.price_earnings_ratio.value,
-            self.price_earnings_ratio.points,
-        )
-        s += "{:<35} {:<25.2f} | {} Points\n".format(
-            "5y price earnings ratio",
-            self.five_years_price_earnings_ratio.value,
-            self.five_years_price_earnings_ratio.points,
-        )
+        if "roe" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "RoE:", "%s%%" % self.roe.value, self.roe.points
+            )
+        if "equity_ratio" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "Equity Ratio:", "%s%%" % self.equity_ratio.value, self.equity_ratio.points
+            )
+        if "ebit_margin" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "EBIT Margin:", "%s%%" % self.ebit_margin.value, self.ebit_margin.points
+            )
+        if "earning_growth" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "%s vs. %s Earning growth:" % (self.THIS_YEAR, self.THIS_YEAR + 1),
+                "%.2f%%" % self.earning_growth.value,
+                self.earning_growth.points,
+            )
+        if "three_month_reversal" not in self.missing:
+            if type(self.three_month_reversal.value) is tuple:
+                if self.three_month_reversal.value[::-1][0]:
+                    s += "{:<35} {:<25} | {} Points\n".format(
+                        "3 month reversal:",
+                        "%.2f%%, %.2f%%, %.2f%%" % self.three_month_reversal.value[::-1],
+                        self.three_month_reversal.points,
+                    )
+        if "momentum" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "Stock momentum (6m, 1y chg points):",
+                "%s Points, %s Points" % self.momentum.value,
+                self.momentum.points,
+            )
+        if "quote_chg_6month" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "6 month quote movement:",
+                "%.2f%%" % self.quote_chg_6month.value,
+                self.quote_chg_6month.points,
+            )
+        if "quote_chg_1year" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "1 year quote movement:",
+                "%.2f%%" % self.quote_chg_1year.value,
+                self.quote_chg_1year.points,
+            )
+        if "earning_revision" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "Earning revisions (6m, 1y points):",
+                "%s Points, %s Points" % self.earning_revision.value,
+                self.earning_revision.points,
+            )
+        if "quarterly_figures_reaction" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "Quarterly figures release reaction:",
+                "%.2g%%" % self.quarterly_figures_reaction.value,
+                self.quarterly_figures_reaction.points,
+            )
+        if "analyst_rating" not in self.missing:
+            s += "{:<35} {:<25} | {} Points\n".format(
+                "MarketScreener analyst rating",
+                str(self.analyst_rating.value or ""),
+                self.analyst_rating.points,
+            )
+        if "price_earnings_ratio" not in self.missing:
+            s += "{:<35} {:<25.2f} | {} Points\n".format(
+                "Price earnings ratio",
+                self.price_earnings_ratio.value,
+                self.price_earnings_ratio.points,
+            )
+        if "five_years_price_earnings_ratio" not in self.missing:
+            s += "{:<35} {:<25.2f} | {} Points\n".format(
+                "5y price earnings ratio",
+                self.five_years_price_earnings_ratio.value,
+                self.five_years_price_earnings_ratio.points,
+            )
+        for name, reason in self.missing.items():
+            s += "{:<35} {:<25} | missing\n".format(name + ":", reason)
         s += "\n"
 
         s += "{:<35} {:<25} | {} Points\n".format(
@@ -103,24 +148,56 @@ class LevermannResult(object):
         )
         return s
 
+    def capture(self, stock):
+        """Keeps the raw values of the evaluation.
+
+        Everything that is persisted in aktie_levermann_values is taken from
+        this snapshot, so nothing has to be fetched or computed twice.
+        """
+        self.quote = stock.quote
+        # data of websites that missed the deadline is None
+        consensus_ratings = stock.consensus_ratings or {}
+        self.consensus = consensus_ratings.get("consensus")
+        self.n_analysts = consensus_ratings.get("n_analysts")
+        self.per = (stock.per or {}).get(self.THIS_YEAR)
+        try:
+            self.five_year_per = stock.five_year_per
+        except ZeroDivisionError:
+            self.five_year_per = None
+        self.earning_revision_changes = (
+            (stock.eval_earning_revision_cy or {}).get('Change current Year'),
+            (stock.eval_earning_revision_ny or {}).get('Change next Year'))
+        self.quarterly_figures_date = \
+            stock.last_quarterly_figures_release_date()
+        if self.earning_growth is not None and self.earning_growth.raw:
+            self.eps = self.earning_growth.raw
+        if self.quarterly_figures_reaction is not None and \
+                self.quarterly_figures_reaction.raw:
+            self.quarterly_reactions = self.quarterly_figures_reaction.raw
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing
+
+    def mark_missing(self, name: str, reason: str):
+        """The criterion ``name`` couldn't be evaluated, e.g. because its
+        website missed the deadline. It counts with 0 points"""
+        self.missing[name] = reason
+        self._score = None
+
+    def points_of(self, name: str):
+        """Points of the criterion ``name``, None if it is missing"""
+        if name in self.missing:
+            return None
+        return getattr(self, name).points
+
     @property
     def score(self) -> int:
+        """Sum of the points, missing criteria are left out"""
         if self._score is None:
-            self._score = (
-                self.roe.points
-                + self.equity_ratio.points
-                + self.ebit_margin.points
-                + self.earning_growth.points
-                + self.three_month_reversal.points
-                + self.momentum.points
-                + self.quote_chg_6month.points
-                + self.quote_chg_1year.points
-                + self.earning_revision.points
-                + self.quarterly_figures_reaction.points
-                + self.analyst_rating.points
-                + self.five_years_price_earnings_ratio.points
-                + self.price_earnings_ratio.points
-            )
+            self._score = sum(getattr(self, name).points
+                              for name in CRITERIA
+                              if name not in self.missing)
         return self._score
 
     def save_points(self) -> int:
@@ -0,0 +1,36 @@
+"""
+thresholds.py
+
+Thresholds of the Levermann criteria, shared by the rating of a single
+stock in :mod:`stockanalyser.analysis.levermann` and the scoring of many
+stocks in :mod:`stockanalyser.analysis.vectorized`.
+
+Most criteria are rated on a ladder ``(low, high)``: below ``low`` -1
+point, above ``high`` 1 point, in between (inclusive) 0 points.
+"""
+
+# return on equity in percent
+ROE = (10, 20)
+# EBIT margin in percent
+EBIT_MARGIN = (6, 12)
+# equity ratio in percent
+EQUITY_RATIO = (15, 25)
+# quote change of 6 months and 1 year in percent
+QUOTE_CHANGE = (-5, 5)
+# revision of the EPS estimates in percent
+EARNING_REVISION = (-5, 5)
+# change of the EPS from this to next year in percent, 0 points inside
+EARNING_GROWTH = (-5, 5)
+
+# price earnings ratio: (0, low) 1 point, [low, high] 0 points, else -1
+PRICE_EARNINGS_RATIO = (12, 16)
+
+# reaction on quarterly figures relative to the reference index in percent:
+# below low -1 point, from high on 1 point
+QUARTERLY_REACTION = (-1, 1)
+
+# analyst consensus from 1 (sell) to 10 (buy): below low -1 point, above
+# high 1 point, exactly high is rejected
+ANALYST_CONSENSUS = (3, 7)
+# from this number of analysts on the points are inverted
+ANALYSTS_CONTRARIAN = 5
@@ -0,0 +1,241 @@
+"""
+vectorized.py
+
+Levermann scoring of many stocks at once. The inputs are columns (one
+NumPy array per criterion, one row per stock), every criterion is scored
+for all rows in a single pass. The rules and their thresholds
+(:mod:`stockanalyser.analysis.thresholds`) are the same as in
+:mod:`stockanalyser.analysis.levermann`, including its handling of missing
+values: a criterion that can't be evaluated scores 0 points.
+
+Missing values are NaN.
+
+Columns:
+    * ``roe``, ``ebit_margin``, ``equity_ratio``: in percent
+    * ``per``, ``five_year_per``: price earnings ratios
+    * ``consensus``, ``n_analysts``: MarketScreener analyst rating
+    * ``quarterly_reaction``: reaction relative to the reference index in %
+    * ``quote_chg_6month``, ``quote_chg_1year``: quote change in percent
+    * ``reversal``: shape (N, 3), relative performance of the last 3 months
+    * ``eps``: shape (N, 2), EPS of current and next year
+    * ``revision``: shape (N, 2), EPS revision of current and next year in %
+    * ``large``: bool, True for large caps
+    * ``missing``: shape (N, len(CRITERIA)), bool, criteria that missed the
+      deadline, they score 0 points like in ``LevermannResult.score``
+
+Functions:
+    * ``score(columns)``:
+        - returns the points of each criterion and the total score
+    * ``columns_from_results(results)``:
+        - builds the columns from LevermannResult objects
+"""
+
+import numpy as np
+
+from stockanalyser.analysis.thresholds import (
+    ANALYST_CONSENSUS, ANALYSTS_CONTRARIAN, EARNING_GROWTH, EARNING_REVISION,
+    EBIT_MARGIN, EQUITY_RATIO, PRICE_EARNINGS_RATIO, QUARTERLY_REACTION,
+    QUOTE_CHANGE, ROE)
+
+CRITERIA = ("roe", "ebit_margin", "equity_ratio", "price_earnings_ratio",
+            "five_years_price_earnings_ratio", "analyst_rating",
+            "quarterly_figures_reaction", "quote_chg_6month",
+            "quote_chg_1year", "momentum", "three_month_reversal",
+            "earning_growth", "earning_revision")
+
+SCALAR_COLUMNS = ("roe", "ebit_margin", "equity_ratio", "per",
+                  "five_year_per", "consensus", "n_analysts",
+                  "quarterly_reaction", "quote_chg_6month", "quote_chg_1year")
+PAIR_COLUMNS = {"reversal": 3, "eps": 2, "revision": 2}
+
+
+def _ladder(values, thresholds):
+    """-1 below the low threshold, 1 above the high one, 0 in between and
+    for NaN"""
+    low, high = thresholds
+    points = np.zeros(values.shape, dtype=np.int64)
+    points[values < low] = -1
+    points[values > high] = 1
+    return points
+
+
+def _ratio_points(per):
+    """PER rating: (0, low) => 1, [low, high] => 0, else -1, missing => 0"""
+    low, high = PRICE_EARNINGS_RATIO
+    points = np.full(per.shape, -1, dtype=np.int64)
+    points[(per > 0) & (per < low)] = 1
+    points[(per >= low) & (per <= high)] = 0
+    points[np.isnan(per)] = 0
+    return points
+
+
+def _analyst_points(consensus, n_analysts):
+    low, high = ANALYST_CONSENSUS
+    points = np.zeros(consensus.shape, dtype=np.int64)
+    points[consensus < low] = -1
+    points[consensus > high] = 1
+    # a consensus of exactly high is rejected by the scalar rating
+    points[(consensus == high) | np.isnan(n_analysts)] = 0
+    flip = n_analysts >= ANALYSTS_CONTRARIAN
+    points[flip] *= -1
+    return points
+
+
+def _quarterly_reaction_points(reaction):
+    points = np.zeros(reaction.shape, dtype=np.int64)
+    low, high = QUARTERLY_REACTION
+    points[reaction >= high] = 1
+    points[reaction < low] = -1
+    return points
+
+
+def _momentum_points(points_6month, points_1year):
+    points = np.zeros(points_6month.shape, dtype=np.int64)
+    points[(points_6month == 1) & (points_1year <= 0)] = 1
+    points[(points_6month == -1) & (points_1year >= 0)] = -1
+    return points
+
+
+def _reversal_points(reversal, large):
+    points = np.zeros(len(reversal), dtype=np.int64)
+    points[(reversal > 0).all(axis=1)] = -1
+    points[(reversal < 0).all(axis=1)] = 1
+    points[~large] = 0
+    return points
+
+
+def _earning_growth_points(eps):
+    cur_year, next_year = eps[:, 0], eps[:, 1]
+    valid = ~np.isnan(eps).any(axis=1) & (cur_year != 0) & (next_year != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chg = ((next_year / cur_year) - 1) * 100
+    points = np.zeros(len(eps), dtype=np.int64)
+    points[cur_year < next_year] = 1
+    points[cur_year > next_year] = -1
+    points[(chg >= EARNING_GROWTH[0]) & (chg <= EARNING_GROWTH[1])] = 0
+    points[~valid] = 0
+    return points
+
+
+def _earning_revision_points(revision):
+    # rows with a missing value are 0, NaN never leaves the 0 of _ladder
+    invalid = np.isnan(revision).any(axis=1)
+    psum = _ladder(revision, EARNING_REVISION).sum(axis=1)
+    points = np.sign(psum)
+    points[invalid] = 0
+    return points
+
+
+def _as_columns(columns: dict) -> dict:
+    n = len(columns["roe"])
+    prepared = {}
+    for name in SCALAR_COLUMNS:
+        prepared[name] = np.asarray(columns.get(name, np.full(n, np.nan)),
+                                    dtype=np.float64)
+    for name, width in PAIR_COLUMNS.items():
+        prepared[name] = np.asarray(
+            columns.get(name, np.full((n, width), np.nan)),
+            dtype=np.float64).reshape(n, width)
+    prepared["large"] = np.asarray(columns.get("large", np.zeros(n)),
+                                   dtype=bool)
+    prepared["missing"] = np.asarray(
+        columns.get("missing", np.zeros((n, len(CRITERIA)))),
+        dtype=bool).reshape(n, len(CRITERIA))
+    return prepared
+
+
+def score(columns: dict) -> dict:
+    """Scores all stocks of the columns
+
+    :param columns: dict of array likes, see module documentation
+    :return: dict of criterion => points array and "score" => total score
+    """
+    c = _as_columns(columns)
+    quote_chg_6month = _ladder(np.round(c["quote_chg_6month"], 2),
+                               QUOTE_CHANGE)
+    quote_chg_1year = _ladder(np.round(c["quote_chg_1year"], 2), QUOTE_CHANGE)
+
+    points = {
+        "roe": _ladder(c["roe"], ROE),
+        "ebit_margin": _ladder(c["ebit_margin"], EBIT_MARGIN),
+        "equity_ratio": _ladder(c["equity_ratio"], EQUITY_RATIO),
+        "price_earnings_ratio": _ratio_points(c["per"]),
+        "five_years_price_earnings_ratio": _ratio_points(c["five_year_per"]),
+        "analyst_rating": _analyst_points(c["consensus"], c["n_analysts"]),
+        "quarterly_figures_reaction": _quarterly_reaction_points(
+            c["quarterly_reaction"]),
+        "quote_chg_6month": quote_chg_6month,
+        "quote_chg_1year": quote_chg_1year,
+        "momentum": _momentum_points(quote_chg_6month, quote_chg_1year),
+        "three_month_reversal": _reversal_points(c["reversal"], c["large"]),
+        "earning_growth": _earning_growth_points(c["eps"]),
+        "earning_revision": _earning_revision_points(c["revision"]),
+    }
+    for idx, name in enumerate(CRITERIA):
+        points[name][c["missing"][:, idx]] = 0
+    points["score"] = np.sum([points[name] for name in CRITERIA], axis=0)
+    return points
+
+
+def _number(value) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _rated_value(rating) -> float:
+    """Value of a rating, NaN if it couldn't be evaluated"""
+    if rating is None or (rating.points == 0 and not rating.value):
+        return np.nan
+    return _number(rating.value)
+
+
+def _value(rating) -> float:
+    """Value of a rating, NaN if the criterion is missing"""
+    if rating is None:
+        return np.nan
+    return _number(rating.value)
+
+
+def columns_from_results(results: list) -> dict:
+    """Builds columns from evaluated LevermannResult objects
+
+    The values of the ratings are used, failed and missing ratings become
+    NaN. Scoring these columns reproduces ``LevermannResult.score``.
+    """
+    columns = {name: [] for name in SCALAR_COLUMNS}
+    columns.update({name: [] for name in PAIR_COLUMNS})
+    columns["large"] = []
+    columns["missing"] = []
+    for result in results:
+        missing = getattr(result, "missing", {})
+        columns["missing"].append([name in missing for name in CRITERIA])
+        columns["roe"].append(_rated_value(result.roe))
+        columns["ebit_margin"].append(_rated_value(result.ebit_margin))
+        columns["equity_ratio"].append(_rated_value(result.equity_ratio))
+        columns["per"].append(_rated_value(result.price_earnings_ratio))
+        columns["five_year_per"].append(
+            _rated_value(result.five_years_price_earnings_ratio))
+        columns["consensus"].append(_number(result.consensus))
+        columns["n_analysts"].append(_number(result.n_analysts))
+        columns["quarterly_reaction"].append(
+            _value(result.quarterly_figures_reaction))
+        columns["quote_chg_6month"].append(_value(result.quote_chg_6month))
+        columns["quote_chg_1year"].append(_value(result.quote_chg_1year))
+        reversal = None
+        if result.three_month_reversal is not None:
+            reversal = result.three_month_reversal.value
+        if not isinstance(reversal, tuple):
+            reversal = (None, None, None)
+        columns["reversal"].append([_number(v) for v in reversal])
+        columns["large"].append(reversal[0] is not None)
+        columns["eps"].append([_number(v) for v in result.eps])
+        columns["revision"].append(
+            [_number(v) for v in result.earning_revision_changes])
+    return {name: np.asarray(values, dtype=bool if name in ("large",
+                                                            "missing")
+                             else np.float64)
+            for name, values in columns.items()}
@@ -0,0 +1,316 @@
+"""Evaluate a whole universe of stocks concurrently.
+
+Every ISIN is evaluated by a worker of a thread pool. The scrapers spend
+nearly all of their time waiting for onvista, finanzen.net and
+marketscreener, so threads are sufficient. The number of parallel requests
+per host and their rate are limited in
+:mod:`stockanalyser.data_source.sessions`, which keeps each website at a
+polite load while the other hosts keep working.
+
+Functions:
+    * ``load_universe(indices)``:
+        - reads ISINs from ``data/indizes_de.json``
+    * ``evaluate_isin(isin, from_database, budget, save_partial)``:
+        - evaluates one ISIN and returns a BatchResult
+    * ``evaluate_universe(isins, workers, per_host, memory_budget, report,
+      parse_workers, journal, budget)``:
+        - evaluates all ISINs and returns a list of BatchResult objects
+
+Every stock has a budget of ``deadlines.STOCK_BUDGET`` seconds. Requests
+end at the deadline, criteria that miss it are marked as missing in the
+LevermannResult. A stock that missed its deadline is not saved but queued
+again behind the other stocks, up to ``SLOW_RETRIES`` times. Its last
+attempt saves the criteria it has.
+
+With a RunJournal an interrupted run is resumed, the stocks that were done
+are skipped and the pages that were fetched are reused, see
+:mod:`stockanalyser.journal`.
+
+Parsing the large pages holds the GIL. With parse workers the pages are
+parsed in a pool of processes, see :mod:`stockanalyser.data_source.parsing`.
+
+With a RunReport the time of each criterion, the requests, cache hits and
+database statements of every stock are collected, see
+:mod:`stockanalyser.instrumentation`.
+
+With a memory budget the resident set size is sampled after every stock.
+Scrapers only keep the values they extracted, so after the first stocks
+the RSS has to stay flat, the report at the end shows if it did.
+"""
+import concurrent.futures
+import gc
+import json
+import logging
+import os
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from stockanalyser import deadlines, exceptions, instrumentation
+from stockanalyser.journal import RunJournal
+from stockanalyser.analysis.levermann import Levermann
+from stockanalyser.config import DATA_PATH
+from stockanalyser.data_source import common, onvista, parsing
+from stockanalyser.database import database_interface
+
+logger = logging.getLogger(__name__)
+
+INDICES_FILE = os.path.join(DATA_PATH, "indizes_de.json")
+WORKERS = 8
+# attempts of a stock that missed its deadline before it is saved partially
+SLOW_RETRIES = 1
+# RSS samples before the caches are warm are not used for the growth
+MEMORY_WARM_UP = 0.1
+# growth of the RSS after the warm up that still counts as flat
+MEMORY_TOLERANCE = 0.1
+MB = 1024 * 1024
+
+
+class BatchResult(object):
+    """
+    Outcome of the evaluation of a single ISIN
+
+    :param missing: criteria that missed the deadline, the score doesn't
+        contain them
+    :param timed_out: the deadline was exceeded
+    """
+
+    def __init__(self, isin, score=None, error=None, duration=0.0,
+                 missing=(), timed_out=False):
+        self.isin = isin
+        self.score = score
+        self.error = error
+        self.duration = duration
+        self.missing = tuple(missing)
+        self.timed_out = timed_out or bool(self.missing)
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def __str__(self):
+        if self.failed:
+            return "{:<14} FAILED after {:.1f}s: {}".format(
+                self.isin, self.duration, self.error)
+        s = "{:<14} Score: {:>3} ({:.1f}s)".format(
+            self.isin, self.score, self.duration)
+        if self.missing:
+            s += " partial, missing: {}".format(", ".join(self.missing))
+        return s
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    # no procfs: peak RSS, in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if peak > 1 << 32 else peak * 1024
+
+
+class MemoryMonitor(object):
+    """
+    Samples the RSS during a batch run and enforces a budget in MB
+    """
+
+    def __init__(self, budget: int = None):
+        self.budget = budget * MB if budget else None
+        self.samples = []
+
+    def sample(self) -> int:
+        rss = rss_bytes()
+        if self.budget and rss > self.budget:
+            gc.collect()
+            rss = rss_bytes()
+            if rss > self.budget:
+                logger.error("RSS {:.0f} MB exceeds the memory budget of "
+                             "{:.0f} MB".format(rss / MB, self.budget / MB))
+        self.samples.append(rss)
+        return rss
+
+    @property
+    def growth(self) -> float:
+        """Relative growth of the RSS after the warm up"""
+        start = self.samples[int(len(self.samples) * MEMORY_WARM_UP)]
+        if not start:
+            return 0.0
+        return (self.samples[-1] - start) / start
+
+    @property
+    def flat(self) -> bool:
+        return self.growth <= MEMORY_TOLERANCE
+
+    def __str__(self):
+        if not self.samples:
+            return "RSS: no samples"
+        return "RSS: start {:.0f} MB, peak {:.0f} MB, end {:.0f} MB, " \
+               "growth after warm up {:+.1%} ({})".format(
+                   self.samples[0] / MB, max(self.samples) / MB,
+                   self.samples[-1] / MB, self.growth,
+                   "flat" if self.flat else "growing")
+
+
+def load_universe(indices=None) -> list:
+    """Reads ISINs of the given indices from ``data/indizes_de.json``
+
+    :param indices: list of index names e.g. ["DAX", "MDAX"]. None = all
+    :return: list of unique ISINs in the order of the file
+    """
+    with open(INDICES_FILE) as f:
+        universe = json.load(f)
+    if indices is None:
+        indices = list(universe.keys())
+
+    isins = []
+    for index in indices:
+        if index not in universe:
+            raise KeyError("Unknown index '{}'. Known indices: {}".format(
+                index, ", ".join(universe.keys())))
+        for isin in universe[index]:
+            if isin not in isins:
+                isins.append(isin)
+    return isins
+
+
+def evaluate_isin(isin: str, from_database: bool = True,
+                  budget: float = deadlines.STOCK_BUDGET,
+                  save_partial: bool = True) -> BatchResult:
+    """Evaluates one ISIN and never raises
+
+    :param from_database: reuse stored data that is still up to date
+    :param budget: seconds until the deadline of the stock, None = no
+        deadline
+    :param save_partial: save the result if criteria missed the deadline
+    """
+    start = time.perf_counter()
+    try:
+        with instrumentation.stock(isin):
+            with deadlines.budget(budget):
+                levermann = Levermann(isin=isin, auto_evaluate=False,
+                                      from_database=from_database)
+                result, new = levermann.evaluate(save=False)
+            # saving isn't part of the budget, a cut off save is worse
+            if new and (result.complete or save_partial):
+                levermann.save(result)
+        return BatchResult(isin, score=result.score,
+                           duration=time.perf_counter() - start,
+                           missing=result.missing)
+    except exceptions.DeadlineExceededError as e:
+        logger.warning("{} missed its deadline: {}".format(isin, e))
+        return BatchResult(isin, error=repr(e), timed_out=True,
+                           duration=time.perf_counter() - start)
+    except (Exception, SystemExit) as e:
+        # Stock() calls exit() if it can't be created
+        logger.exception("Evaluation of {} failed".format(isin))
+        return BatchResult(isin, error=repr(e),
+                           duration=time.perf_counter() - start)
+
+
+def evaluate_universe(isins: list, workers: int = WORKERS,
+                      per_host: int = common.MAX_REQUESTS_PER_HOST,
+                      memory_budget: int = None,
+                      report: instrumentation.RunReport = None,
+                      parse_workers: int = 0,
+                      journal: RunJournal = None,
+                      budget: float = deadlines.STOCK_BUDGET) -> list:
+    """Evaluates all ISINs concurrently
+
+    :param isins: list of ISINs
+    :param workers: number of stocks that are evaluated at the same time
+    :param per_host: maximum number of parallel requests per website
+    :param memory_budget: RSS budget in MB, enables the memory monitoring
+    :param report: RunReport that collects the events of the run
+    :param parse_workers: processes that parse the pages, 0 parses them in
+        the worker threads
+    :param journal: RunJournal, stocks that it has as done are skipped
+    :param budget: seconds per stock, None = no deadline
+    :return: list of BatchResult objects in the order of ``isins``
+    """
+    isins = list(dict.fromkeys(isins))
+    common.set_host_limit(per_host)
+    database_interface.configure(max_connections=workers)
+    start = time.perf_counter()
+    results = {}
+    if journal is not None:
+        journal.open()
+        for isin in isins:
+            if journal.done(isin):
+                results[isin] = BatchResult(isin, score=journal.scores[isin])
+    pending = [isin for isin in isins if isin not in results]
+    monitor = MemoryMonitor(memory_budget) if memory_budget else None
+    logger.info("Evaluating {} stocks with {} workers ({} requests per "
+                "host, {} done before)".format(len(pending), workers,
+                                               per_host, len(results)))
+    if report is not None:
+        instrumentation.add_hook(report)
+    if journal is not None:
+        instrumentation.add_hook(journal)
+    if parse_workers:
+        parsing.set_workers(parse_workers)
+    try:
+        onvista.warm_up_benchmarks()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers) as pool:
+
+            def submit(isin, attempt):
+                last = attempt >= SLOW_RETRIES
+                future = pool.submit(evaluate_isin, isin, budget=budget,
+                                     save_partial=last)
+                futures[future] = (isin, attempt)
+
+            futures = {}
+            for isin in pending:
+                submit(isin, 0)
+            finished = 0
+            while futures:
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    isin, attempt = futures.pop(future)
+                    result = future.result()
+                    if result.timed_out and attempt < SLOW_RETRIES:
+                        # behind the other stocks, so it doesn't block them
+                        logger.warning("{} missed its deadline, retrying it "
+                                       "later".format(isin))
+                        submit(isin, attempt + 1)
+                        continue
+                    finished += 1
+                    results[isin] = result
+                    if journal is not None:
+                        journal.record(isin, result.score, result.error)
+                    log = logger.warning if result.failed or \
+                        result.timed_out else logger.info
+                    log("{}/{} {}".format(finished, len(pending), result))
+                    if monitor is not None:
+                        monitor.sample()
+    finally:
+        if parse_workers:
+            parsing.shutdown()
+        if journal is not None:
+            instrumentation.remove_hook(journal)
+            journal.close()
+        if report is not None:
+            instrumentation.remove_hook(report)
+            report.finish()
+
+    failed = [r for r in results.values() if r.failed]
+    logger.info("Finished {} stocks in {:.1f}s, {} failed, {} partial".format(
+        len(pending), time.perf_counter() - start, len(failed),
+        sum(bool(r.missing) for r in results.values())))
+    for result in failed:
+        logger.warning(str(result))
+    if monitor is not None:
+        log = logger.info if monitor.flat else logger.warning
+        log(str(monitor))
+    if report is not None:
+        logger.info(str(report))
+
+    return [results[isin] for isin in isins]
@@ -0,0 +1,184 @@
+"""
+cache.py
+
+Persistent HTTP response cache. Bodies are stored zlib compressed together
+with the time they were fetched in a SQLite file below ``DATA_PATH``.
+
+How long a response stays valid depends on the endpoint family (see
+``TTL_RULES``): fundamentals only change quarterly, quotes daily and
+historic closes of past dates never. Pinned urls are served regardless of
+their age, e.g. the pages of an interrupted run that is resumed.
+
+"""
+
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Union
+
+from stockanalyser.config import HTTP_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("STOCKANALYSER_HTTP_CACHE", "1") != "0"
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+FOREVER = None
+
+DEFAULT_TTL = HOUR
+INTERVAL_DAYS = {"M1": 31, "Y1": 366}
+
+
+def _historic_quote_ttl(url: str) -> Union[float, None]:
+    """Closes of a time window that is over don't change anymore"""
+    match = re.search(r"dateStart=(\d{2}\.\d{2}\.\d{4})", url)
+    interval = re.search(r"interval=(\w+)", url)
+    if match is None or interval is None \
+            or interval.group(1) not in INTERVAL_DAYS:
+        return HOUR
+    start = datetime.datetime.strptime(match.group(1), "%d.%m.%Y").date()
+    window = datetime.timedelta(days=INTERVAL_DAYS[interval.group(1)])
+    if start + window < datetime.date.today():
+        return FOREVER
+    return HOUR
+
+
+# first matching rule wins. TTL is seconds, FOREVER or a function of the url
+TTL_RULES = [
+    (re.compile(r"onvista\.de/onvista/boxes/(popup/)?historicalquote"),
+     _historic_quote_ttl),
+    (re.compile(r"onvista\.de/aktien/fundamental/"), 7 * DAY),
+    (re.compile(r"onvista\.de/aktien/times\+sales/"), 30 * DAY),
+    (re.compile(r"onvista\.de/aktien/"), 6 * HOUR),
+    (re.compile(r"finanzen\.net/termine/"), DAY),
+    (re.compile(r"finanzen\.net/"), 7 * DAY),
+    (re.compile(r"marketscreener\.com/.*afDataFeed\.php.*t=dcons"), 6 * HOUR),
+    (re.compile(r"marketscreener\.com/.*afDataFeed\.php.*t=rev"), 6 * HOUR),
+    (re.compile(r"marketscreener\.com/suchen/"), 30 * DAY),
+]
+
+
+def ttl_for(url: str) -> Union[float, None]:
+    """Returns the time to live in seconds, None means forever"""
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(url):
+            return ttl(url) if callable(ttl) else ttl
+    return DEFAULT_TTL
+
+
+class CachedResponse(object):
+    """
+    Minimal stand-in for requests.Response that is served from the cache
+    """
+
+    def __init__(self, url, content, fetched_at):
+        self.url = url
+        self.content = content
+        self.fetched_at = fetched_at
+        self.status_code = 200
+
+
+class ResponseCache(object):
+    """
+    URL keyed cache of response bodies in a SQLite database.
+
+    Every thread gets its own connection, SQLite handles the locking.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, "
+                "final_url TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, "
+                "body BLOB NOT NULL)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, url: str, ttl=DEFAULT_TTL) -> Union[CachedResponse, None]:
+        """Returns the cached response if it is younger than ``ttl``"""
+        row = self._connection().execute(
+            "SELECT final_url, fetched_at, body FROM responses WHERE url = ?",
+            (url,)).fetchone()
+        if row is None:
+            return None
+        final_url, fetched_at, body = row
+        if ttl is not FOREVER and fetched_at + ttl < time.time():
+            logger.debug("Cache entry of '%s' expired" % url)
+            return None
+        logger.debug("Cache hit '%s'" % url)
+        return CachedResponse(final_url, zlib.decompress(body), fetched_at)
+
+    def put(self, url: str, final_url: str, content: bytes):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(url, final_url, fetched_at, body) VALUES (?, ?, ?, ?)",
+                (url, final_url, time.time(), zlib.compress(content)))
+
+    def purge(self, older_than: float = 30 * DAY) -> int:
+        """Deletes entries that were fetched before ``older_than`` seconds"""
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute(
+                "DELETE FROM responses WHERE fetched_at < ?",
+                (time.time() - older_than,))
+        return cursor.rowcount
+
+
+_cache = None
+_cache_lock = threading.Lock()
+# urls and "HEAD <url>" keys that never expire
+_pinned = set()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def lookup(url: str) -> Union[CachedResponse, None]:
+    """Returns a still valid cached response or None"""
+    if not ENABLED:
+        return None
+    ttl = FOREVER if url in _pinned else ttl_for(url)
+    return get_cache().get(url, ttl)
+
+
+def pin(urls):
+    """Serves the cached responses of urls and their redirects regardless
+    of their age"""
+    for url in urls:
+        _pinned.add(url)
+        _pinned.add("HEAD " + url)
+
+
+def unpin():
+    _pinned.clear()
+
+
+def store(url: str, response):
+    """Stores the body of a successful response"""
+    if not ENABLED:
+        return
+    get_cache().put(url, response.url, response.content)
@@ -6,21 +6,27 @@ Functions that are used by all modules in this package!
 """
 
 import asyncio
+import contextvars
 import datetime
 import logging
-import pathlib
-import urllib.request
+import time
+import urllib.parse
+from contextlib import contextmanager
 from typing import Union
 
 import holidays
-import numpy as np
+import requests
 from lxml import html, etree
 
-from stockanalyser import exceptions
+from stockanalyser import deadlines, exceptions, instrumentation
+from stockanalyser.data_source import cache, sessions, trading_calendar
 
 logger = logging.getLogger(__name__)
 
 SLEEP = 10
+RETRIES = 3
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_REQUESTS_PER_HOST = sessions.MAX_REQUESTS_PER_HOST
 
 url_last = ''
 holidays_germany = holidays.DE()
@@ -29,8 +35,155 @@ holidays_germany = holidays.DE()
 """ All request and HTML-Element handling """
 
 
-async def request_cooldown():
-    await asyncio.sleep(SLEEP)
+def request_cooldown(attempt: int = 0):
+    """Sleeps before a request is retried. Doubles with every attempt"""
+    time.sleep(SLEEP * 2 ** attempt)
+
+
+async def async_request_cooldown(attempt: int = 0):
+    """Awaitable version of :func:`request_cooldown`"""
+    await asyncio.sleep(SLEEP * 2 ** attempt)
+
+
+def set_host_limit(limit: int):
+    """Sets the maximum number of parallel requests per host.
+
+    Replaces the sessions of all hosts, so it should be called before a
+    batch run starts.
+    """
+    global MAX_REQUESTS_PER_HOST
+    sessions.configure(per_host=limit)
+    MAX_REQUESTS_PER_HOST = limit
+
+
+def _host(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc
+
+
+@contextmanager
+def host_slot(url: str):
+    """Blocks until a request slot for the host of ``url`` is free"""
+    with sessions.get_manager().host(url).slot():
+        yield
+
+
+def _is_retryable(error: requests.RequestException) -> bool:
+    if isinstance(error, requests.HTTPError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def _is_throttled(error: requests.RequestException) -> bool:
+    """The rate limiter of the host already waits before the retry"""
+    return isinstance(error, requests.HTTPError) and \
+        error.response.status_code in sessions.THROTTLE_STATUS_CODES
+
+
+def _get(url: str) -> requests.Response:
+    """Single GET request without retries, served from cache if possible"""
+    cached = cache.lookup(url)
+    if cached is not None:
+        instrumentation.record_request(url, len(cached.content), cached=True)
+        return cached
+    response = _get_online(url)
+    instrumentation.record_request(url, len(response.content), cached=False)
+    cache.store(url, response)
+    return response
+
+
+def _get_online(url: str) -> requests.Response:
+    deadlines.check(url)
+    with host_slot(url):
+        response = _transport("GET", url)
+    response.raise_for_status()
+    return response
+
+
+def _default_transport(method: str, url: str) -> requests.Response:
+    """Sends the request over the rate limited session of the host
+
+    :param method: "GET" or "HEAD", HEAD follows all redirects
+    """
+    host = sessions.get_manager().host(url)
+    if method == "HEAD":
+        response = host.request("HEAD", url, allow_redirects=True)
+        if response.status_code not in (403, 405, 501):
+            return response
+        # HEAD is not supported, stop reading after the headers
+        response = host.request("GET", url, stream=True)
+        response.close()
+        return response
+    return host.request("GET", url)
+
+
+_transport = _default_transport
+
+
+def set_transport(transport=None):
+    """Replaces the HTTP layer, e.g. with recorded responses for benchmarks
+
+    :param transport: callable(method, url) -> requests.Response, None
+        restores the default transport
+    """
+    global _transport
+    _transport = transport or _default_transport
+
+
+def _resolve(url: str) -> requests.Response:
+    """Follows the redirects of url without downloading the document"""
+    key = "HEAD " + url
+    cached = cache.lookup(key)
+    if cached is not None:
+        instrumentation.record_request(url, 0, cached=True)
+        return cached
+    deadlines.check(url)
+    with host_slot(url):
+        response = _transport("HEAD", url)
+    instrumentation.record_request(url, 0, cached=False)
+    response.raise_for_status()
+    cache.store(key, cache.CachedResponse(response.url, b"", time.time()))
+    return response
+
+
+def resolve_url(url: str, retries: int = RETRIES) -> str:
+    """Returns the url after all redirects
+
+    Only the headers are requested, so this is much cheaper than
+    ``request_url(url).url``.
+    """
+    logger.debug("Resolving '%s'" % url)
+    return _with_retries(_resolve, url, retries).url
+
+
+def request_url(url: str, retries: int = RETRIES) -> requests.Response:
+    """Fetches url and retries on server errors and connection problems
+
+    :raises requests.RequestException: if all retries failed
+    :return: response after all redirects
+    """
+    logger.debug("Fetching webpage '%s'" % url)
+    return _with_retries(_get, url, retries)
+
+
+def _with_retries(request, url: str, retries: int):
+    for attempt in range(retries + 1):
+        try:
+            return request(url)
+        except requests.RequestException as error:
+            if attempt == retries or not _is_retryable(error):
+                raise
+            if _is_throttled(error):
+                logger.warning("Website {} returned with: {}! Retrying "
+                               "when the host allows it".format(_host(url),
+                                                                error))
+                continue
+            # a retry after the deadline is of no use
+            deadlines.check_wait(SLEEP * 2 ** attempt,
+                                 "a retry of {}".format(_host(url)))
+            logger.warning("Sleeping for {} seconds. Website {} returned "
+                           "with: {}!".format(SLEEP * 2 ** attempt,
+                                              _host(url), error))
+            request_cooldown(attempt)
 
 
 def url_to_etree(url: str):
@@ -39,20 +192,76 @@ def url_to_etree(url: str):
 
 
 def request_url_to_str(url: str):
-    req = urllib.request.Request(url)
-    req.add_header('User-Agent', get_random_ua())
-    logger.debug("Fetching webpage '%s'" % url)
-    try:
-        resp = urllib.request.urlopen(req).read()
-        return resp
-    except (urllib.request.HTTPError) as httperr:
-        logger.exception("HTTPError: {}. ".format(httperr.code))
-        # logger.exception(httperr)
-        logger.warning("Sleeping for {} seconds. Website {} returned with "
-                       "error code {}!".format(SLEEP, url.split("/")[2],
-                                               httperr.code))
-        request_cooldown()
-        request_url_to_str(url)
+    return request_url(url).content
+
+
+class AsyncFetcher(object):
+    """
+    Fetches many urls concurrently inside an asyncio event loop.
+
+    The blocking requests run in the default executor and share the
+    per host sessions and limits with :func:`request_url`. Retries are
+    awaited, so other requests continue while one of them backs off.
+    """
+
+    def __init__(self, retries: int = RETRIES):
+        self.retries = retries
+        self._semaphores = {}
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = _host(url)
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(MAX_REQUESTS_PER_HOST)
+        return self._semaphores[host]
+
+    async def fetch_response(self, url: str) -> requests.Response:
+        logger.debug("Fetching webpage '%s'" % url)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore(url):
+                    return await run_in_executor(_get, url)
+            except requests.RequestException as error:
+                if attempt == self.retries or not _is_retryable(error):
+                    raise
+                if _is_throttled(error):
+                    logger.warning("Website {} returned with: {}! Retrying "
+                                   "when the host allows it".format(
+                                       _host(url), error))
+                    continue
+                deadlines.check_wait(SLEEP * 2 ** attempt,
+                                     "a retry of {}".format(_host(url)))
+                logger.warning("Sleeping for {} seconds. Website {} "
+                               "returned with: {}!".format(
+                                   SLEEP * 2 ** attempt, _host(url), error))
+                await async_request_cooldown(attempt)
+
+    async def fetch(self, url: str) -> bytes:
+        response = await self.fetch_response(url)
+        return response.content
+
+    async def fetch_all(self, urls: list) -> list:
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+
+async def run_in_executor(function, *args):
+    """Runs function in the default executor with the current context, so
+    the stock of the calling task is known to the instrumentation"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, context.run, function, *args)
+
+
+def run_async(coroutine):
+    """Runs coroutine in a new event loop of the calling thread"""
+    return asyncio.run(coroutine)
+
+
+def fetch_all(urls: list) -> list:
+    """Fetches all urls concurrently
+
+    :return: list of response bodies in the order of ``urls``
+    """
+    return run_async(AsyncFetcher().fetch_all(urls))
 
 
 def str_to_etree(response_read):
@@ -65,23 +274,8 @@ def tostring(etree_element):
 
 
 def get_random_ua():
-    """ Takes random User Agent from file """
-    random_ua = ''
-    ua_file = pathlib.Path(__file__).parent / 'ua_file.txt'
-    try:
-        with open(ua_file) as f:
-            lines = f.readlines()
-        if len(lines) > 0:
-            prng = np.random.RandomState()
-            index = prng.permutation(len(lines) - 1)
-            idx = np.asarray(index, dtype=np.integer)[0]
-            random_ua = lines[int(idx)]
-            random_ua = random_ua.replace("\n", "")
-    except Exception as ex:
-        print('Exception in random_ua')
-        print(str(ex))
-    finally:
-        return random_ua
+    """ Takes random User Agent from the preloaded pool """
+    return sessions.user_agents().random()
 
 
 def solve_xpath(etree: html, xpath: str):
@@ -93,12 +287,18 @@ def solve_xpath(etree: html, xpath: str):
 """Date calculation and formatting"""
 
 
-def prev_work_day(adate: Union[str, datetime.date, datetime.date]):
-    """Returns date that is not on a Weekend and is not a german holiday"""
+def prev_work_day(adate: Union[str, datetime.datetime, datetime.date]):
+    """Returns the XETRA trading day before adate
+
+    :return: datetime.date for a date, else datetime.datetime with the time
+        of adate, midnight for a str
+    """
     adate = convert_to_datetime(adate)
-    prev_day = prev_weekday(adate)
-    if is_german_holiday(prev_day):
-        return prev_work_day(prev_day)
+    if adate is None:
+        return None
+    prev_day = trading_calendar.prev_trading_day(adate)
+    if isinstance(adate, datetime.datetime):
+        return datetime.datetime.combine(prev_day, adate.time(), adate.tzinfo)
     return prev_day
 
 
@@ -159,22 +359,15 @@ def prev_weekday(adate: Union[str, datetime.datetime, datetime.date]):
 
 
 def closest_weekday(adate):
-    """ Closest Weekday:
+    """ Closest XETRA trading day:
 
             * Saturday -> Friday before
             * Sunday -> Monday after
                 - If monday after is not in the future
-    :return: datetime
+            * Holidays -> nearest trading day, the earlier one on a tie
+    :return: datetime.date
         """
-    if isinstance(adate, datetime.datetime):
-        adate = adate.date()
-    if adate.isoweekday() == 7:
-        if (adate + datetime.timedelta(days=1)) > datetime.date.today():
-            return adate - datetime.timedelta(days=2)
-        return adate + datetime.timedelta(days=1)
-    elif adate.isoweekday() == 6:
-        return adate - datetime.timedelta(days=1)
-    return adate
+    return trading_calendar.closest_trading_day(adate)
 
 
 def convert_to_datetime(adate):
@@ -204,12 +397,9 @@ def is_german_holiday(adate: datetime.date):
     Returns:
         boolean -- if it's a german holiday: True
     """
-    if datetime.date(adate.year, 12, 31) not in holidays_germany:
-        holidays_germany.append(
-            {datetime.date(adate.year, 12, 31): 'Silvester'})
-    if adate in holidays_germany:
+    if (adate.month, adate.day) == (12, 31):  # Silvester
         return True
-    return False
+    return adate in holidays_germany
 
 
 def unixtime_to_datetime(timestamp, milliseconds: bool = False) -> datetime.datetime:
@@ -1,9 +1,10 @@
-from urllib import request, parse
+from urllib import parse
 from datetime import datetime
 import logging
 import re
 
-from stockanalyser.data_source import common
+from stockanalyser import exceptions
+from stockanalyser.data_source import common, parsing
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,23 @@ class FinanzenNetScraper(object):
                                "suchergebnis.asp?_search="
         self._benchmark = None
         self._quarterly_figures_dates = None
-        self.etree = None
+        # stock page until it is reduced to a StockPageRecord
+        self._page = None
+        self._stock_page = None
+
+    @property
+    def stock_page(self):
+        """Values of the stock page, the page itself is not kept"""
+        if self._stock_page is None:
+            if self._page is None:
+                if not self.URL:
+                    self.lookup_url()
+                if self._page is None:
+                    self._page = common.request_url_to_str(self.URL)
+            self._stock_page = parsing.extract_page(extract_stock_page,
+                                                    self._page)
+            self._page = None
+        return self._stock_page
 
     def lookup_url(self):
         # Finanzen.net search with symbol not possible
@@ -35,23 +52,21 @@ class FinanzenNetScraper(object):
     def _get_url_response(self, arg=None):
         if self.ISIN is arg:
             url = self.BASE_SEARCH_URL + self.ISIN
-            url_response = request.urlopen(request.Request(url))
+            url_response = common.request_url(url)
             if url is not url_response.url:
                 logger.debug(
                     "Got redireted! URL: {0}!".format(url_response.url))
                 self.URL = url_response.url
-                self.etree = common.str_to_etree(
-                    response_read=url_response.read())
+                self._page = url_response.content
+                self._stock_page = None
                 self._name = self.name
 
         if self.name is arg:
             xpath = '//*[@id="suggestBESearch"]/div/div[4]/div/table/tr'
             url = self.BASE_SEARCH_URL + self.name
-            url_response = request.urlopen(
-                request.Request(url)).read()
+            url_response = common.request_url_to_str(url)
 
             lxml_html = common.str_to_etree(response_read=url_response)
-            self.etree = lxml_html
             for elem in lxml_html.xpath(xpath):
                 # Name from finanzen.net website
                 isin = elem.xpath('./td[2]')[0].text_content().encode(
@@ -70,13 +85,26 @@ class FinanzenNetScraper(object):
                     self._name = self.name
                     break
 
-    def _get_termine_url(self):
-        element = self.etree
-        path = element.xpath('//a[@title][contains(., "Termine")]')[0].attrib[
-            'href']
-        logger.debug("fetched termine path: %s" % path)
+    async def fetch_async(self, fetcher: common.AsyncFetcher):
+        """Fetches stock and Termine page without blocking other scrapers"""
+        if self._stock_page is None and self._page is None \
+                and (self.URL or self.ISIN):
+            url = self.URL or self.BASE_SEARCH_URL + self.ISIN
+            url_response = await fetcher.fetch_response(url)
+            self.URL = url_response.url
+            self._page = url_response.content
+        if not self._quarterly_figures_dates and (self._page is not None or
+                                                  self._stock_page is not None):
+            page = await fetcher.fetch(self._get_termine_url())
+            self._quarterly_figures_dates = await parsing.extract_page_async(
+                extract_quarterly_figure_dates, page)
 
-        return parse.urljoin("http://www.finanzen.net/", path)
+    def _get_termine_url(self):
+        termine_url = self.stock_page.termine_url
+        if termine_url is None:
+            raise exceptions.MissingDataError(
+                "No link to the Termine page on {}".format(self.URL))
+        return termine_url
 
     def _fetch_recent_quarterly_figures_release_date(self):
         # returns a sorted list of all "Quartalszahlen" dates
@@ -86,45 +114,13 @@ class FinanzenNetScraper(object):
                 raise ValueError("Stock's finanzen.net URL is not set ")
 
         termine_url = self._get_termine_url()
-        etree = common.url_to_etree(termine_url)
-        rows = etree.xpath("//table[@class='table']//tr")
-        release_dates = []
-        for r in rows:
-            if r.xpath("td//text()='Quartalszahlen'"):
-                str_date = r.xpath("td[4]")[0].text_content()
-                # if the string contains "(e)*" it means it's an estimated
-                # date, skip those we want reliable dates
-                if "(e)" in str_date:
-                    continue
-                d = datetime.strptime(str_date, '%d.%m.%Y').date()
-                release_dates.append(d)
-
-        release_dates.sort()
-        logger.debug("fetched quarterly figures release dates: {}".format(
-            release_dates))
-        self._quarterly_figures_dates = release_dates
+        self._quarterly_figures_dates = parsing.url_to_record(
+            termine_url, extract_quarterly_figure_dates)
 
-    def _get_benchmark(self):  # TODO add support for different xpath (trial and error)
-        if self.etree is None:
-            self.lookup_url()
-        element = self.etree
-        xpaths = [
-            "/html/body/div[1]/div[6]/div[3]/div[27]/div[3]/div[1]/table/tr[3]/td[2]/a[1]",
-            "/html/body/div[1]/div[6]/div[3]/div[27]/div[3]/div[1]/table/tr[4]/td[2]/a[1]"
-        ]
-        if element is not None:
-            for xpath in xpaths:
-                try:
-                    benchmark = element.xpath(xpath)[0].text_content()
-                    if bool(re.match(r"dax", benchmark, re.I)):
-                        self._benchmark = benchmark
-                        break
-                except IndexError as err:
-                    logger.error(err)
-                    continue
-
-        else:
-            logger.warning("Etree not defined")
+    def _get_benchmark(self):
+        self._benchmark = self.stock_page.benchmark
+        if not self._benchmark:
+            logger.warning("No benchmark found on {}".format(self.URL))
 
     @property
     def benchmark(self):
@@ -147,3 +143,62 @@ class FinanzenNetScraper(object):
         name = name.replace("_", "-")
         self._name = name
         return self._name
+
+
+class StockPageRecord(object):
+    """
+    Values of the stock page. None if a value couldn't be found
+    """
+    __slots__ = ("benchmark", "termine_url")
+
+    def __init__(self, benchmark=None, termine_url=None):
+        self.benchmark = benchmark
+        self.termine_url = termine_url
+
+
+# TODO add support for different xpath (trial and error)
+_BENCHMARK_XPATHS = [
+    "/html/body/div[1]/div[6]/div[3]/div[27]/div[3]/div[1]/table/tr[3]/td[2]/a[1]",
+    "/html/body/div[1]/div[6]/div[3]/div[27]/div[3]/div[1]/table/tr[4]/td[2]/a[1]"
+]
+
+
+def extract_stock_page(page) -> StockPageRecord:
+    """Reduces the stock page to a StockPageRecord"""
+    record = StockPageRecord()
+    for xpath in _BENCHMARK_XPATHS:
+        elements = page.xpath(xpath)
+        if not elements:
+            logger.debug("No benchmark at {}".format(xpath))
+            continue
+        benchmark = elements[0].text_content()
+        if re.match(r"dax", benchmark, re.I):
+            record.benchmark = benchmark
+            break
+
+    links = page.xpath('//a[@title][contains(., "Termine")]')
+    if links:
+        path = links[0].attrib['href']
+        logger.debug("fetched termine path: %s" % path)
+        record.termine_url = parse.urljoin("http://www.finanzen.net/", path)
+    return record
+
+
+def extract_quarterly_figure_dates(page) -> list:
+    """Sorted release dates of the quarterly figures on the Termine page"""
+    rows = page.xpath("//table[@class='table']//tr")
+    release_dates = []
+    for r in rows:
+        if r.xpath("td//text()='Quartalszahlen'"):
+            str_date = r.xpath("td[4]")[0].text_content()
+            # if the string contains "(e)*" it means it's an estimated
+            # date, skip those we want reliable dates
+            if "(e)" in str_date:
+                continue
+            d = datetime.strptime(str_date, '%d.%m.%Y').date()
+            release_dates.append(d)
+
+    release_dates.sort()
+    logger.debug("fetched quarterly figures release dates: {}".format(
+        release_dates))
+    return release_dates
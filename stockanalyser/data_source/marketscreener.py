@@ -16,21 +16,34 @@ class MarketScreenerScraper(object):
         self.name = name
 
         self.BASE_SEARCH_URL = "https://de.marketscreener.com/suchen/firmen/?aComposeInputSearch=s_"
-        self.URL = ms_url
-        if not self.URL:
-            self.URL = self._lookup_url()
-
-        self.URL_revisions = self.URL + "reviews-revisions/"
-        self.URL_consensus = self.URL + "analystenerwartungen/"
-
-        self.codeZB = ms_id
-        if not self.codeZB:
-            self.codeZB = self._lookup_codeZB()
+        # URL and codeZB are looked up when they are needed
+        self._url = ms_url
+        self._codeZB = ms_id
 
         self._data_consensus: dict = {}
         self._data_revision_cy: dict = {}
         self._data_revision_ny: dict = {}
 
+    @property
+    def URL(self):
+        if not self._url:
+            self._url = self._lookup_url()
+        return self._url
+
+    @property
+    def URL_revisions(self):
+        return self.URL + "reviews-revisions/"
+
+    @property
+    def URL_consensus(self):
+        return self.URL + "analystenerwartungen/"
+
+    @property
+    def codeZB(self):
+        if not self._codeZB:
+            self._codeZB = self._lookup_codeZB()
+        return self._codeZB
+
     @property
     def consensus_data(self):
         if not self._data_consensus:
@@ -43,6 +56,22 @@ class MarketScreenerScraper(object):
             self._set_revision()
         return self._data_revision_cy, self._data_revision_ny
 
+    async def fetch_async(self, fetcher: common.AsyncFetcher):
+        """Fetches consensus and revision data concurrently"""
+        if not self._codeZB:
+            # the search request blocks, keep the event loop free meanwhile
+            self._codeZB = await common.run_in_executor(self._lookup_codeZB)
+        urls = []
+        if not self._data_consensus:
+            urls.append(self._consensus_url())
+        if not (self._data_revision_cy and self._data_revision_ny):
+            urls.append(self._revision_url())
+        responses = dict(zip(urls, await fetcher.fetch_all(urls)))
+        if self._consensus_url() in responses:
+            self._set_consensus(responses[self._consensus_url()])
+        if self._revision_url() in responses:
+            self._set_revision(responses[self._revision_url()])
+
     def _lookup_url(self):
         if self.ISIN:
             url = self.BASE_SEARCH_URL + self.ISIN
@@ -67,10 +96,19 @@ class MarketScreenerScraper(object):
     def _lookup_codeZB(self):
         return self.URL.split('/')[-2].split('-')[-1]
 
-    def _set_revision(self):
-        url = "https://de.marketscreener.com//reuters_charts/afDataFeed.php?&codeZB={}&t=rev&sub_t=bna&iLang=1".format(
+    def _revision_url(self) -> str:
+        return "https://de.marketscreener.com//reuters_charts/afDataFeed.php?&codeZB={}&t=rev&sub_t=bna&iLang=1".format(
             self.codeZB)
-        revisions_data = json.loads(common.request_url_to_str(url))
+
+    def _consensus_url(self) -> str:
+        return "https://de.marketscreener.com/reuters_charts/afDataFeed.php?codeZB={}&t=dcons&iLang=3".format(
+            self.codeZB
+        )
+
+    def _set_revision(self, response: bytes = None):
+        if response is None:
+            response = common.request_url_to_str(self._revision_url())
+        revisions_data = json.loads(response)
         eps_four_weeks_cy = revisions_data[0][0][-20][1]
         date_four_weeks_cy = revisions_data[0][0][-20][0]
         date_four_weeks_cy = common.unixtime_to_datetime(
@@ -103,11 +141,10 @@ class MarketScreenerScraper(object):
         self._data_revision_ny["Change next Year"] = change_ny
         # return self._data_revision_cy, self._data_revision_ny
 
-    def _set_consensus(self):
-        url = "https://de.marketscreener.com/reuters_charts/afDataFeed.php?codeZB={}&t=dcons&iLang=3".format(
-            self.codeZB
-        )
-        consensus_data = json.loads(common.request_url_to_str(url))
+    def _set_consensus(self, response: bytes = None):
+        if response is None:
+            response = common.request_url_to_str(self._consensus_url())
+        consensus_data = json.loads(response)
 
         if consensus_data[3] is False:
             raise ValueError("Did not respond correctly (404)")
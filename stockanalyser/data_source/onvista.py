@@ -3,16 +3,21 @@ Gets all data from the onvista.de webpage!
 
 """
 
+import asyncio
 import re
 import json
-import urllib.request
 import datetime
 import csv
+import threading
+import time
 from typing import Union
 import logging
 
-from stockanalyser import exceptions
-from stockanalyser.data_source import common
+from lxml import etree
+
+from stockanalyser import deadlines, exceptions
+from stockanalyser.data_source import common, parsing
+from stockanalyser.data_source.timeseries import PriceSeries
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +39,22 @@ BENCHMARKS = {
     },
 }
 
+# Levermann needs closes of up to one year and one month ago
+HISTORY_DAYS = 400
+
+# seconds after a failed download of a benchmark until it is tried again
+BENCHMARK_RETRY = 60
+
+# Price series of the benchmarks are shared by all OnvistaScraper objects.
+# notation_id: (day of download, PriceSeries)
+_benchmark_series = {}
+# notation_id: time.monotonic() of the last failed download
+_benchmark_failures = {}
+# notation_id: Lock that is held during the download of the benchmark
+_benchmark_locks = {}
+# guards the dicts above, never held during a download
+_benchmark_series_lock = threading.Lock()
+
 
 def is_number(txt: str) -> bool:
     """ Tries to convert string into number """
@@ -51,28 +72,29 @@ class OnvistaScraper(object):
 
     """
 
-    def __init__(self, url=None, isin=None):
+    def __init__(self, url=None, isin=None, prefetch_fundamentals=True):
+        """Nothing is fetched until a value is accessed
+
+        :param prefetch_fundamentals: False skips the fundamental page in
+            fetch_async, it is fetched when a fundamental value is accessed
+        """
         logger.info("Initializing {}".format(type(self).__name__))
-        if not url and isin:
-            self.ISIN = isin
-            self._lookup_url()
-        elif not (url and isin):
+        if not (url or isin):
             raise exceptions.MissingDataError(
                 "Not enough Inputs! Check function call!")
-        elif url:
-            self.overview_url = url
-
-        self.fundamental_url = self._build_fundamental_url(self.overview_url)
-        self.__fundamental_url_etree = self._fetch_fundamental_webpage()
-
-        self.__overview_url_etree = self._fetch_overview_webpage()
-
-        self._name = None
-        self._previous_close = None
+        self.ISIN = isin
+        self._overview_url = url
+        self.prefetch_fundamentals = prefetch_fundamentals
+        # pages are reduced to these records, the trees are not kept
+        self._overview = None
         self._currency = None  # Currently not used
-        self._market_cap = None
 
         self._notation_id = None
+        # criteria are evaluated in parallel, the id is only looked up once
+        self._notation_id_lock = threading.Lock()
+        self._fundamentals = None
+        self._price_series = {}
+        self._price_series_lock = threading.Lock()
 
         self._eps = None
         self._per = None
@@ -113,65 +135,122 @@ class OnvistaScraper(object):
     @property
     def notation_id(self):
         """ Notation ID. Required for historic data """
-        if self._notation_id is None:
-            self._notation_id = self._get_notation_id()
+        with self._notation_id_lock:
+            if self._notation_id is None:
+                self._notation_id = self._get_notation_id()
         return self._notation_id
 
     @property
     def market_cap(self):
-        if self._market_cap is None:
-            self._market_cap = self._get_market_cap()
-        return self._market_cap
+        return self._overview_value("market_cap")
 
     @property
     def previous_close(self):
-        if self._previous_close is None:
-            self._previous_close = self._get_previous_close()
-        return self._previous_close
+        return self._overview_value("previous_close")
 
     @property
     def name(self):
-        if self._name is None:
-            self._name = self._get_name()
-        return self._name
+        return self._overview_value("name")
+
+    def _overview_value(self, field: str):
+        if self._overview is None:
+            self._overview = parsing.url_to_record(self.overview_url,
+                                                   extract_overview)
+        value = getattr(self._overview, field)
+        if value is None:
+            raise exceptions.MissingDataError(
+                "Couldn't find {} on {}".format(field, self.overview_url))
+        return value
+
+    @property
+    def overview_url(self):
+        if self._overview_url is None:
+            self._overview_url = self._lookup_url()
+        return self._overview_url
+
+    @property
+    def fundamental_url(self):
+        return self._build_fundamental_url(self.overview_url)
 
     def _lookup_url(self):
         url_base = 'https://www.onvista.de/aktien/'
         url_base_redirect = url_base + self.ISIN
-        http_request = urllib.request.Request(url_base_redirect)
-        http_respnse = urllib.request.urlopen(http_request)
-        if (url_base and self.ISIN) in http_respnse.url:
-            self.overview_url = http_respnse.url
-            return self.overview_url
-        elif url_base not in http_respnse.url:
+        url = common.resolve_url(url_base_redirect)
+        if (url_base and self.ISIN) in url:
+            return url
+        elif url_base not in url:
             raise ValueError("Couldn't find Onvista Url")
 
-    def _fetch_fundamental_webpage(self):
-        return common.url_to_etree(self.fundamental_url)
-
-    def _fetch_overview_webpage(self):
-        return common.url_to_etree(self.overview_url)
-
-    def _get_notation_id(self) -> str:
+    async def fetch_async(self, fetcher: common.AsyncFetcher):
+        """Fetches all pages that weren't loaded yet concurrently"""
+        if self._overview_url is None:
+            self._overview_url = await common.run_in_executor(
+                self._lookup_url)
+
+        urls = []
+        if self._overview is None:
+            urls.append(self.overview_url)
+        if self._fundamentals is None and self.prefetch_fundamentals:
+            urls.append(self.fundamental_url)
+        if self._notation_id is None:
+            urls.append(self._notation_id_url())
+        pages = dict(zip(urls, await fetcher.fetch_all(urls)))
+
+        extractors = {
+            self.overview_url: extract_overview,
+            self.fundamental_url: extract_fundamentals,
+            self._notation_id_url(): extract_notation_id,
+        }
+        # with parse workers the pages are parsed in parallel
+        records = dict(zip(pages, await asyncio.gather(*(
+            parsing.extract_page_async(extractors[url], page)
+            for url, page in pages.items()))))
+
+        if self.overview_url in records:
+            self._overview = records[self.overview_url]
+        if self.fundamental_url in records:
+            self._fundamentals = records[self.fundamental_url]
+        if self._notation_id_url() in records:
+            self._notation_id = records[self._notation_id_url()]
+
+    def _notation_id_url(self) -> str:
         url = self.overview_url.split("/")
-        notation_id_url = "https://www.onvista.de/aktien/{}/{}".format(
+        return "https://www.onvista.de/aktien/{}/{}".format(
             "times+sales", url[-1])
-        etree = common.url_to_etree(notation_id_url)
-        page_xpath = '//*[@id="exchangesLayerTs"]/ul/li/a'
 
-        table_ul = etree.xpath(page_xpath)
-        for li in table_ul:
-            exchange = li.text.strip()
-            if exchange == "Xetra":
-                notation_id = li.get("href").split("=")[1]
-                return notation_id
+    def _get_notation_id(self) -> str:
+        return parsing.url_to_record(self._notation_id_url(),
+                                     extract_notation_id)
 
     def get_historic_data(self, day: Union[datetime.datetime, datetime.date], index=None) -> Union[float, None]:
-        """Gets close of historical date"""
+        """Gets close of historical date
+
+        The close is looked up in the price series of the notation, which is
+        downloaded once. If there is no close near ``day`` in the series the
+        single quote is requested.
+        """
         if index is None:
             notation_id = self.notation_id
+            series = self.price_series(notation_id)
         else:
             notation_id = BENCHMARKS[index]['notation_id']
+            series = benchmark_series(index)
+        try:
+            return series.close_at(day)
+        except (KeyError, exceptions.MissingDataError) as e:
+            logger.debug("{}. Requesting single quote instead".format(e))
+            return self._get_historic_quote(notation_id, day)
+
+    def price_series(self, notation_id) -> PriceSeries:
+        """Daily closes of the last ``HISTORY_DAYS`` days of a notation"""
+        with self._price_series_lock:
+            if notation_id not in self._price_series:
+                self._price_series[notation_id] = _load_price_series(
+                    notation_id)
+            return self._price_series[notation_id]
+
+    @staticmethod
+    def _get_historic_quote(notation_id, day: Union[datetime.datetime, datetime.date]) -> float:
         day = day.strftime("%d.%m.%Y")
         url = "https://www.onvista.de/onvista/boxes/popup/historicalquote.json?notationId={}&dateStart={}&interval=M1".format(
             notation_id, day)  # 323547
@@ -213,145 +292,296 @@ class OnvistaScraper(object):
         spl.insert(4, "fundamental")
         return "/".join(spl)
 
-    def _extract_from_table(self, table_xpath, table_header, row_xpath,
-                            row_header):
-        if self.__fundamental_url_etree is None:
-            self.__fundamental_url_etree = self._fetch_fundamental_webpage()
-        table = self.__fundamental_url_etree.findall(table_xpath)
-        theader = self._get_table_header(table)
-        if theader[0] != table_header:
+    @property
+    def fundamentals(self) -> dict:
+        """All tables of the fundamental page, see extract_fundamentals"""
+        if self._fundamentals is None:
+            self._fundamentals = parsing.url_to_record(
+                self.fundamental_url, extract_fundamentals)
+        return self._fundamentals
+
+    def _extract(self, table_header, row_header) -> dict:
+        try:
+            table = self.fundamentals[table_header]
+        except KeyError:
+            raise exceptions.ParsingError(
+                "Table '%s' not found" % table_header)
+        try:
+            result = table[row_header]
+        except KeyError:
             raise exceptions.ParsingError(
-                "Unexpected table header: '%s'" % theader[0])
+                "Row '%s' not found in table '%s'" % (row_header,
+                                                      table_header))
+        logger.debug("Extracted '%s' from onvista: %s" % (row_header, result))
+        return dict(result)
 
-        columns = self.__fundamental_url_etree.findall(row_xpath)
-        table_elements = []
-        for column in columns:
-            column_value = _normalize_number(column.text)
-            if column_value is "CONTINUE":
-                continue
-            if isinstance(column_value, (float, int)):
-                column_value = column_value
-            table_elements.append(column_value)
+    def _get_eps(self):
+        return self._extract("gewinn", "gewinn pro aktie in eur")
 
-        if table_elements[0] != row_header:
-            raise exceptions.ParsingError(
-                "Unexpected 1. row header: '%s' != '%s'" % (
-                    table_elements[0], row_header))
+    def _get_ebit_margin(self):
+        return self._extract("rentabilität", "ebit-marge")
 
-        if len(theader) != len(table_elements):
-            raise exceptions.ParsingError(
-                "Parsing error, table header contains"
-                " more elements than rows:'%s' vs '%s'" % (
-                    theader, table_elements))
+    def _get_equity_ratio(self):
+        return self._extract("bilanz", "eigenkapitalquote")
 
-        result = {}
-        for i in range(len(table_elements)):
-            if theader[i] == table_header:
-                continue
-            result[theader[i]] = table_elements[i]
-        logger.debug("Extracted '%s' from onvista: %s" % (row_header, result))
+    def _get_roe(self):
+        return self._extract("rentabilität", "eigenkapitalrendite")
 
-        return result
+    def _get_price_earnings_ratio(self):
+        return self._extract("gewinn", "kgv")
 
-    def _get_eps(self):
-        table_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                      '/article/article/div/table[1]/thead/tr/'
-        row_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                    '/article/article/div/table[1]/tbody/tr[1]/'
 
-        return self._extract_from_table(table_xpath, "gewinn", row_xpath,
-                                        "gewinn pro aktie in eur")
+class OverviewRecord(object):
+    """
+    Values of the overview page. None if a value couldn't be found
+    """
+    __slots__ = ("name", "previous_close", "market_cap")
+
+    def __init__(self, name=None, previous_close=None, market_cap=None):
+        self.name = name
+        self.previous_close = previous_close
+        self.market_cap = market_cap
+
+
+_NAME = etree.XPath('//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article'
+                    '/div[2]/span/a/@title')
+_PREVIOUS_CLOSE = etree.XPath('//*[@id="ONVISTA"]/div[1]/div[1]/div[1]'
+                              '/article/table/tr[2]/td[4]/text()')
+_MARKET_CAP = [
+    etree.XPath('//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article'
+                '/div[7]/section[{}]/article/div/table[1]/tbody/tr'
+                '/td[1]/text()'.format(section))
+    for section in (8, 7)]
+
+
+def extract_overview(page) -> OverviewRecord:
+    """Reduces the overview page to an OverviewRecord"""
+    record = OverviewRecord()
+    names = _NAME(page)
+    if names:
+        record.name = str(names[0])
+    closes = _PREVIOUS_CLOSE(page)
+    if closes:
+        close = _normalize_number(str(closes[0]))
+        if isinstance(close, float):
+            record.previous_close = close
+    for xpath in _MARKET_CAP:
+        market_cap = xpath(page)
+        if market_cap:
+            record.market_cap = _configure_market_cap(str(market_cap[0]))
+            break
+    return record
+
+
+def extract_notation_id(page) -> str:
+    """Notation id of the Xetra quotes on the times+sales page"""
+    page_xpath = '//*[@id="exchangesLayerTs"]/ul/li/a'
+
+    table_ul = page.xpath(page_xpath)
+    for li in table_ul:
+        exchange = li.text.strip()
+        if exchange == "Xetra":
+            notation_id = li.get("href").split("=")[1]
+            return notation_id
+
+
+def _configure_market_cap(market_cap: str) -> float:
+    if market_cap.endswith("Mio EUR"):
+        market_cap = market_cap.replace("Mio EUR", "")
+        market_cap = market_cap.strip()
+        market_cap = _normalize_number(market_cap)
+        return market_cap * 10 ** 6
+    else:
+        return -1
 
-    def _get_ebit_margin(self):
-        table_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                      '/article/article/div/table[8]/thead/tr/'
-        row_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                    '/article/article/div/table[8]/tbody/tr[2]/'
 
-        return self._extract_from_table(table_xpath, "rentabilität", row_xpath,
-                                        "ebit-marge")
+def _price_series_urls(notation_id, days: int = HISTORY_DAYS) -> list:
+    """One yearly csv export per calendar year of the window.
 
-    def _get_equity_ratio(self):
-        table_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                      '/article/article/div/table[6]/thead/tr/'
-        row_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                    '/article/article/div/table[6]/tbody/tr[2]/'
+    Windows start at January 1st, so the exports of past years never change
+    and are cached forever.
+    """
+    today = datetime.date.today()
+    first_year = (today - datetime.timedelta(days=days)).year
+    return ["https://www.onvista.de/onvista/boxes/historicalquote/export.csv"
+            "?notationId={}&dateStart=01.01.{}&interval=Y1".format(
+                notation_id, year)
+            for year in range(first_year, today.year + 1)]
+
+
+def _parse_price_csv(response: bytes) -> list:
+    """Parses onvista's csv export into (date, close) tuples"""
+    rows = csv.reader(response.decode("latin-1").splitlines(), delimiter=";")
+    close_idx = 4
+    pairs = []
+    for row in rows:
+        if not row:
+            continue
+        if "Schluss" in row:
+            close_idx = row.index("Schluss")
+            continue
+        try:
+            day = datetime.datetime.strptime(row[0].strip(), "%d.%m.%Y").date()
+        except ValueError:
+            continue
+        close = _normalize_number(row[close_idx])
+        if isinstance(close, float):
+            pairs.append((day, close))
+    return pairs
+
+
+def fetch_price_series(notation_id, days: int = HISTORY_DAYS) -> PriceSeries:
+    """Downloads the daily closes of the last ``days`` days"""
+    pairs = []
+    for response in common.fetch_all(_price_series_urls(notation_id, days)):
+        pairs.extend(_parse_price_csv(response))
+    logger.debug("Fetched {} closes of notation {}".format(len(pairs),
+                                                         notation_id))
+    return PriceSeries.from_pairs(pairs)
+
+
+def _load_price_series(notation_id) -> PriceSeries:
+    """Like fetch_price_series but returns an empty series on errors"""
+    try:
+        return fetch_price_series(notation_id)
+    except (IOError, ValueError) as e:
+        # requests' exceptions are IOErrors
+        logger.warning("Couldn't fetch price series of {}: {}".format(
+            notation_id, e))
+        return PriceSeries.from_pairs([])
 
-        return self._extract_from_table(table_xpath, "bilanz", row_xpath,
-                                        "eigenkapitalquote")
 
-    def _get_roe(self):
-        table_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                      '/article/article/div/table[8]/thead/tr/'
-        row_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                    '/article/article/div/table[8]/tbody/tr[4]/'
+def benchmark_series(index: str) -> PriceSeries:
+    """Shared price series of a benchmark index, e.g. "DAX"
 
-        return self._extract_from_table(table_xpath, "rentabilität", row_xpath,
-                                        "eigenkapitalrendite")
+    The series is downloaded on first use and again on the next day, only
+    one thread per benchmark downloads it while the others wait. A failed
+    download is tried again after BENCHMARK_RETRY seconds. Until then the
+    series of an earlier day is used or, without one, get_historic_data
+    falls back to single quotes.
 
-    def _get_price_earnings_ratio(self):
-        table_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                      '/article/article/div/table[1]/thead/tr/'
-        row_xpath = './/*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                    '/article/article/div/table[1]/tbody/tr[2]/'
-
-        return self._extract_from_table(table_xpath, "gewinn", row_xpath,
-                                        "kgv")
-
-    def _get_name(self):
-        xapth_name = '//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article' \
-                     '/div[2]/span/a/@title'
-        name = common.solve_xpath(self.__overview_url_etree, xapth_name)[0]
-        name = name.encode("utf-8").decode("utf-8")
-        return name
-
-    def _get_previous_close(self):
-        xapth_previous_close = '//*[@id="ONVISTA"]/div[1]/div[1]/div[1]' \
-                               '/article/table/tr[2]/td[4]/text()'
-        previous_close = common.solve_xpath(self.__overview_url_etree,
-                                            xapth_previous_close)[0]
-        previous_close = previous_close.encode("utf-8").decode("utf-8")
-        return float(_normalize_number(previous_close))
-
-    def _get_market_cap(self) -> float:
-        xapth_market_cap_8 = '//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article' \
-            '/div[7]/section[8]/article/div/table[1]/tbody/tr' \
-            '/td[1]/text()'
-        xapth_market_cap_7 = '//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article' \
-            '/div[7]/section[7]/article/div/table[1]/tbody/tr' \
-            '/td[1]/text()'
-        market_cap = common.solve_xpath(self.__overview_url_etree,
-                                        xapth_market_cap_8)
-        if not market_cap:
-            market_cap = common.solve_xpath(self.__overview_url_etree,
-                                            xapth_market_cap_7)
-        if not market_cap:
-            raise exceptions.MissingDataError(
-                "Couldn't find market capitalization")
-        return self.__configure_market_cap(market_cap[0])
-
-    def __configure_market_cap(self, market_cap: str) -> int:
-        if market_cap.endswith("Mio EUR"):
-            market_cap = market_cap.replace("Mio EUR", "")
-            market_cap = market_cap.strip()
-            market_cap = _normalize_number(market_cap)
-            return market_cap * 10 ** 6
-        else:
-            return -1
+    :raises DeadlineExceededError: if the deadline ends while another
+        thread downloads the series
+    """
+    notation_id = BENCHMARKS[index]['notation_id']
+    series = _cached_benchmark(notation_id)
+    if series is not None:
+        return series
+    with _benchmark_series_lock:
+        lock = _benchmark_locks.setdefault(notation_id, threading.Lock())
+    timeout = deadlines.remaining()
+    if not lock.acquire(timeout=-1 if timeout is None else max(0, timeout)):
+        raise exceptions.DeadlineExceededError(
+            "Deadline exceeded while waiting for the series of {}".format(
+                index))
+    try:
+        # another thread may have downloaded it meanwhile
+        series = _cached_benchmark(notation_id)
+        if series is not None:
+            return series
+        loaded = _load_price_series(notation_id)
+        with _benchmark_series_lock:
+            if len(loaded):
+                _benchmark_series[notation_id] = (datetime.date.today(),
+                                                  loaded)
+                _benchmark_failures.pop(notation_id, None)
+                return loaded
+            _benchmark_failures[notation_id] = time.monotonic()
+            _, series = _benchmark_series.get(notation_id, (None, loaded))
+            return series
+    finally:
+        lock.release()
+
+
+def _cached_benchmark(notation_id) -> Union[PriceSeries, None]:
+    """The series of today, the stale or an empty series after a recent
+    failed download, None if it has to be downloaded"""
+    with _benchmark_series_lock:
+        fetched, series = _benchmark_series.get(notation_id, (None, None))
+        if fetched == datetime.date.today():
+            return series
+        failed = _benchmark_failures.get(notation_id)
+        if failed is not None and \
+                time.monotonic() - failed < BENCHMARK_RETRY:
+            return series if series is not None else \
+                PriceSeries.from_pairs([])
+        return None
+
+
+def warm_up_benchmarks(indices=("DAX", "MDAX", "SDAX")):
+    """Downloads the benchmark series before a batch run starts"""
+    for index in indices:
+        benchmark_series(index)
+
+
+def invalidate_benchmarks():
+    with _benchmark_series_lock:
+        _benchmark_series.clear()
+        _benchmark_failures.clear()
+
+
+_FUNDAMENTAL_TABLES = etree.XPath(
+    '//*[@id="ONVISTA"]/div[1]/div[1]/div[1]/article/article/div/table')
+_TABLE_HEADER_CELLS = etree.XPath('./thead/tr/*')
+_TABLE_ROWS = etree.XPath('./tbody/tr')
+_ROW_CELLS = etree.XPath('./*')
+_MINUS_SIGNS = str.maketrans({"\u2212": "-", "\u2013": "-"})
+
+
+def extract_fundamentals(page) -> dict:
+    """Walks once through all tables of the fundamental page
+
+    :param page: etree of the fundamental page
+    :return: table title => row title => year => value, e.g.
+        ``{"gewinn": {"kgv": {2019: 12.5, 2018: 14.1}}}``
+    """
+    tables = {}
+    for table in _FUNDAMENTAL_TABLES(page):
+        header = OnvistaScraper._get_table_header(_TABLE_HEADER_CELLS(table))
+        if not header or header[0] in tables:
+            continue
+        rows = {}
+        for row in _TABLE_ROWS(table):
+            values = []
+            for cell in _ROW_CELLS(row):
+                value = _normalize_number(cell.text or "")
+                if value == "CONTINUE":
+                    continue
+                values.append(value)
+            if len(values) != len(header):
+                logger.debug("Skipping row %s of table '%s', expected %s "
+                             "columns" % (values, header[0], len(header)))
+                continue
+            rows.setdefault(values[0], dict(zip(header[1:], values[1:])))
+        tables[header[0]] = rows
+    return tables
 
 
 def _normalize_number(value: str) -> Union[None, str, float]:
+    """Parses German formatted numbers like "-1.234,56%"
+
+    :return: None for "-", "CONTINUE" for empty cells, float for numbers and
+        the lowercased text otherwise
+    """
     value = value.lower().strip()
-    if value is "-":
+    if value == "-":
         return None
-    if value in ("", " "):
+    if not value:
         return "CONTINUE"
-    # replace german decimal seperator "," with "."
-    number = re.search(r'[+|-]?([\d|\.]{0,12},\d{0,2})%?', value)
+    number = value.translate(_MINUS_SIGNS).rstrip("%").strip()
+    if number[:1].isdigit() or number[:1] in "+-" and number[1:2].isdigit():
+        try:
+            return float(number.replace(".", "").replace(",", "."))
+        except ValueError:
+            pass
+    # number within text e.g. "ca. 1,5 mrd", a comma alone is no number,
+    # e.g. in "gewinn je aktie, verwässert"
+    number = re.search(r'([+-]?)(\d[\d.]{0,12},\d{0,2}|[\d.]*,\d+)%?',
+                       value)
     if number is None:
         return value
-    else:
-        number = number.group(1)
-        number = number.replace(".", "")
-        number = number.replace(",", ".")
-        return float(number)
+    try:
+        return float(number.group(1) + number.group(2).replace(".", "")
+                     .replace(",", "."))
+    except ValueError:
+        return value
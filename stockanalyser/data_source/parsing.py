@@ -0,0 +1,124 @@
+"""
+parsing.py
+
+Reduces pages to records, optionally in a pool of processes.
+
+lxml holds the GIL while it builds a tree, so the large pages (onvista
+fundamentals, finanzen.net Termine) are parsed one after the other even if
+many threads fetch at the same time. After ``set_workers(n)`` the raw bytes
+of a page are sent to one of n processes, the tree is built and reduced
+there and only the record comes back. The fetching threads and the event
+loop keep working meanwhile.
+
+An extract function takes the etree of a page and returns a picklable
+record. It has to be a module level function, so the worker processes can
+import it. Trees never leave the process they were built in.
+
+Functions:
+    * ``set_workers(workers)``, ``shutdown()``, ``workers()``
+    * ``extract_page(extract, page)``: blocks, for threads
+    * ``extract_page_async(extract, page)``: awaitable, for fetch_async
+    * ``url_to_record(url, extract)``
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+
+from stockanalyser.data_source import common
+
+logger = logging.getLogger(__name__)
+
+# smaller pages are parsed in the calling thread, sending them to another
+# process takes longer than parsing them
+MIN_OFFLOAD_BYTES = 32 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+_workers = 0
+
+
+def _extract(extract, page: bytes):
+    """Runs in the worker processes"""
+    return extract(common.str_to_etree(page))
+
+
+def set_workers(workers: int = None):
+    """Parses pages in ``workers`` processes from now on. Pages that were
+    sent to the previous pool are parsed before it shuts down, pages that
+    would be sent to it afterwards are parsed in the calling thread
+
+    :param workers: number of processes, None = one per CPU, 0 parses in the
+        calling thread again
+    """
+    global _pool, _workers
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 0:
+        raise ValueError("Number of parse workers can't be negative: "
+                         "{}".format(workers))
+    with _pool_lock:
+        previous, _pool = _pool, None
+        _workers = workers
+        if workers:
+            # forking a process with running threads can copy held locks
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"))
+    if previous is not None:
+        previous.shutdown()
+    logger.info("Parsing pages in {}".format(
+        "{} processes".format(workers) if workers else "the calling thread"))
+
+
+def shutdown():
+    set_workers(0)
+
+
+def workers() -> int:
+    """Number of parse processes, 0 if pages are parsed in the calling
+    thread"""
+    return _workers
+
+
+def _offload_pool(page: bytes):
+    """The pool if the page is worth sending to another process"""
+    if len(page) < MIN_OFFLOAD_BYTES:
+        return None
+    return _pool
+
+
+def extract_page(extract, page: bytes):
+    """Parses page and returns the record of ``extract(etree)``"""
+    pool = _offload_pool(page)
+    if pool is None:
+        return _extract(extract, page)
+    try:
+        future = pool.submit(_extract, extract, page)
+    except RuntimeError:
+        # set_workers shut the pool down meanwhile
+        return _extract(extract, page)
+    return future.result()
+
+
+async def extract_page_async(extract, page: bytes):
+    """Awaitable version of :func:`extract_page`, the event loop isn't
+    blocked while another process parses the page"""
+    pool = _offload_pool(page)
+    if pool is None:
+        return _extract(extract, page)
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(pool, _extract, extract, page)
+    except RuntimeError:
+        # set_workers shut the pool down meanwhile
+        return _extract(extract, page)
+    return await future
+
+
+def url_to_record(url: str, extract):
+    """Fetches url and returns the record of ``extract(etree)``"""
+    return extract_page(extract, common.request_url_to_str(url))
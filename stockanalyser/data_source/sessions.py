@@ -0,0 +1,316 @@
+"""
+sessions.py
+
+One HTTP session per host with a request rate that adapts to the host.
+
+Every host gets a ``requests.Session`` (persistent connections, cookies)
+with a fixed user agent from the preloaded pool, a limit of parallel
+requests and a token bucket. The bucket starts at the rate of
+``HOST_RATES`` and raises it slowly after successful responses. A 429 or
+503 halves the rate and pauses the host for the time of the Retry-After
+header, so concurrent runs settle at the highest rate the host accepts.
+
+The buckets only limit this process. Workers that share a host limit, e.g.
+the workers of a work queue, additionally wait for a shared limiter, see
+``set_shared_limiter``.
+
+Every request has a timeout of ``REQUEST_TIMEOUT``. Inside a deadline (see
+:mod:`stockanalyser.deadlines`) the timeout ends at the deadline and waits
+for the bucket or a free slot that would end after it raise a
+DeadlineExceededError.
+
+Classes:
+    * ``TokenBucket``: adaptive rate limit
+    * ``HostSession``: session, rate and parallel requests of a host
+    * ``SessionManager``: the HostSessions of all hosts
+
+Functions:
+    * ``get_manager()``, ``configure(per_host)``
+    * ``set_shared_limiter(limiter)``: rate limit across processes
+    * ``user_agents()``: the preloaded user agent pool
+"""
+
+import datetime
+import email.utils
+import logging
+import pathlib
+import random
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from typing import Union
+
+import requests
+import requests.adapters
+
+from stockanalyser import deadlines, exceptions
+
+logger = logging.getLogger(__name__)
+
+UA_FILE = pathlib.Path(__file__).parent / 'ua_file.txt'
+
+# requests per second when a host is contacted the first time
+DEFAULT_RATE = 2.0
+HOST_RATES = {
+    "www.onvista.de": 5.0,
+    "www.finanzen.net": 2.0,
+    "de.marketscreener.com": 2.0,
+}
+# the rate is raised up to this multiple of the initial rate
+MAX_RATE_FACTOR = 4
+MIN_RATE = 0.1
+# rate change after a successful and after a throttled response
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+# pause of a throttled host without Retry-After header, in seconds
+DEFAULT_PAUSE = 10
+MAX_PAUSE = 300
+THROTTLE_STATUS_CODES = (429, 503)
+MAX_REQUESTS_PER_HOST = 4
+# seconds to connect and between two bytes of the response
+REQUEST_TIMEOUT = (10, 30)
+
+# object with acquire(host) and throttle(host, pause), e.g.
+# work_queue.SQLiteRateLimiter
+_shared_limiter = None
+
+
+class UserAgentPool(object):
+    """
+    User agents of ``ua_file.txt``, read once
+    """
+
+    def __init__(self, path: pathlib.Path = UA_FILE):
+        try:
+            with open(path) as f:
+                self.agents = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            logger.warning("Couldn't read user agents: {}".format(e))
+            self.agents = []
+
+    def random(self) -> str:
+        if not self.agents:
+            return ''
+        return random.choice(self.agents)
+
+
+_user_agents = None
+_user_agents_lock = threading.Lock()
+
+
+def user_agents() -> UserAgentPool:
+    global _user_agents
+    with _user_agents_lock:
+        if _user_agents is None:
+            _user_agents = UserAgentPool()
+        return _user_agents
+
+
+def retry_after(response: requests.Response) -> Union[float, None]:
+    """Seconds of the Retry-After header, None if there is none"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        until = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (until - now).total_seconds())
+
+
+class TokenBucket(object):
+    """
+    Allows ``rate`` requests per second with bursts of ``burst`` requests
+    """
+
+    def __init__(self, rate: float, burst: float = None,
+                 max_rate: float = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_rate = max_rate or rate * MAX_RATE_FACTOR
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now <= self._updated:
+            return
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.paused_until > now:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            deadlines.check_wait(wait, "the rate limit")
+            time.sleep(wait)
+
+    def throttle(self, pause: float) -> bool:
+        """Lowers the rate and pauses the host
+
+        Responses of requests that were sent in parallel arrive while the
+        host is paused already, they only extend the pause.
+
+        :return: True if the rate was lowered
+        """
+        with self._lock:
+            now = time.monotonic()
+            lowered = self.paused_until <= now
+            if lowered:
+                self.rate = max(MIN_RATE, self.rate * RATE_DECREASE)
+            self.paused_until = max(self.paused_until,
+                                    now + min(pause, MAX_PAUSE))
+            # no burst after the pause, tokens are refilled from its end
+            self.tokens = 0
+            self._updated = self.paused_until
+            return lowered
+
+    def increase(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+
+class HostSession(object):
+    """
+    Session, rate limit and parallel requests of one host
+    """
+
+    def __init__(self, host: str, rate: float, max_requests: int):
+        self.host = host
+        self.bucket = TokenBucket(rate)
+        self._slots = threading.BoundedSemaphore(max_requests)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=max_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # a browser keeps its user agent as long as it keeps its cookies
+        self.session.headers.update({
+            'User-Agent': user_agents().random(),
+            'Accept-Language': 'de-DE,de;q=0.9,en;q=0.5',
+        })
+
+    @contextmanager
+    def slot(self):
+        """Blocks until one of the parallel requests of the host is free"""
+        timeout = deadlines.remaining()
+        if timeout is None:
+            self._slots.acquire()
+        elif not self._slots.acquire(timeout=max(0.0, timeout)):
+            raise exceptions.DeadlineExceededError(
+                "No free request slot for {} before the deadline".format(
+                    self.host))
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends the request as soon as the rate allows it
+
+        :raises DeadlineExceededError: if the deadline is over before
+        """
+        limiter = _shared_limiter
+        if limiter is not None:
+            limiter.acquire(self.host)
+        self.bucket.acquire()
+        kwargs.setdefault("timeout", deadlines.timeout(REQUEST_TIMEOUT))
+        response = self.session.request(method, url, **kwargs)
+        self.observe(response)
+        return response
+
+    def observe(self, response: requests.Response):
+        """Adapts the rate to the status of the response"""
+        if response.status_code in THROTTLE_STATUS_CODES:
+            pause = retry_after(response)
+            if pause is None:
+                pause = DEFAULT_PAUSE
+            limiter = _shared_limiter
+            if limiter is not None:
+                limiter.throttle(self.host, pause)
+            if self.bucket.throttle(pause):
+                logger.warning("{} throttled with {}, {:.2f} requests/s "
+                               "after a pause of {}s".format(
+                                   self.host, response.status_code,
+                                   self.bucket.rate, pause))
+        elif response.status_code < 400:
+            self.bucket.increase()
+
+
+class SessionManager(object):
+    """
+    Creates a HostSession for every host on first use
+    """
+
+    def __init__(self, max_requests: int = MAX_REQUESTS_PER_HOST,
+                 rates: dict = None):
+        self.max_requests = max_requests
+        self.rates = dict(HOST_RATES if rates is None else rates)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostSession:
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostSession(
+                    host, self.rates.get(host, DEFAULT_RATE),
+                    self.max_requests)
+            return self._hosts[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.host(url).request(method, url, **kwargs)
+
+    def rates_per_host(self) -> dict:
+        with self._lock:
+            return {host: session.bucket.rate
+                    for host, session in self._hosts.items()}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> SessionManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionManager()
+        return _manager
+
+
+def configure(per_host: int = MAX_REQUESTS_PER_HOST, rates: dict = None):
+    """Replaces all sessions, e.g. with another number of parallel requests
+    per host. Should be called before a batch run starts"""
+    global _manager
+    if per_host < 1:
+        raise ValueError("Host limit has to be at least 1: {}".format(
+            per_host))
+    with _manager_lock:
+        _manager = SessionManager(per_host, rates)
+
+
+def set_shared_limiter(limiter=None):
+    """Every request also waits for ``limiter.acquire(host)`` and throttled
+    responses are reported to ``limiter.throttle(host, pause)``. None
+    removes the limiter"""
+    global _shared_limiter
+    _shared_limiter = limiter
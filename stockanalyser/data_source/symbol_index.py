@@ -0,0 +1,151 @@
+"""
+symbol_index.py
+
+Process-wide index of the ticker symbols in ``data/symbol_json/``.
+
+Every region is loaded once. The lowercased names of all entries are joined
+to one string in the order of the json file, so looking up a name is a single
+``str.find`` plus a binary search for the entry the match belongs to. This
+keeps the "first entry containing the name" semantics of the former linear
+scan.
+
+A pickled copy of the prepared index is written next to the json file and
+used as long as it is newer than the json file.
+
+Functions:
+    * ``get_index(region)``:
+        - returns the SymbolIndex of a region
+    * ``lookup(region, name)``:
+        - returns (name, symbol) of the first matching entry or None
+"""
+
+import bisect
+import json
+import logging
+import os
+import pickle
+import threading
+from typing import Tuple, Union
+
+from stockanalyser.config import DATA_PATH
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_PATH = os.path.join(DATA_PATH, "symbol_json")
+# raised when the pickled SymbolIndex changes, e.g. the offsets
+PICKLE_VERSION = 2
+SEPARATOR = "\n"
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def normalize_name(name: str) -> str:
+    return name.replace("-", " ").lower()
+
+
+class SymbolIndex(object):
+    """
+    Names and symbols of one region in the order of the json file
+    """
+
+    def __init__(self, symbols: dict):
+        self.names = list(symbols.keys())
+        self.symbols = list(symbols.values())
+        self.exact = {}
+        # lower() may change the length of a name, e.g. of "İ"
+        lowered = [name.lower() for name in self.names]
+        offsets = []
+        offset = 0
+        for idx, name in enumerate(lowered):
+            offsets.append(offset)
+            offset += len(name) + len(SEPARATOR)
+            self.exact.setdefault(name, idx)
+        self.offsets = offsets
+        self.haystack = SEPARATOR.join(lowered)
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, name: str) -> Union[Tuple[str, str], None]:
+        """First entry whose name contains ``name``
+
+        :param name: name of the company, "-" is treated as space
+        :return: (name, symbol) or None
+        """
+        needle = normalize_name(name)
+        if SEPARATOR in needle:
+            return None
+        position = self.haystack.find(needle)
+        if position == -1:
+            return None
+        idx = bisect.bisect_right(self.offsets, position) - 1
+        return self.names[idx], self.symbols[idx]
+
+    def get(self, name: str) -> Union[str, None]:
+        """Symbol of the entry with exactly this name"""
+        idx = self.exact.get(name.lower())
+        if idx is None:
+            return None
+        return self.symbols[idx]
+
+
+def _json_path(region: str) -> str:
+    return os.path.join(SYMBOL_PATH, "{}.json".format(region))
+
+
+def _pickle_path(region: str) -> str:
+    return os.path.join(SYMBOL_PATH, "{}.pickle".format(region))
+
+
+def _load_pickle(region: str) -> Union[SymbolIndex, None]:
+    path = _pickle_path(region)
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(_json_path(region)):
+            return None
+        with open(path, "rb") as f:
+            version, index = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    if version != PICKLE_VERSION:
+        return None
+    return index
+
+
+def _dump_pickle(region: str, index: SymbolIndex):
+    try:
+        with open(_pickle_path(region), "wb") as f:
+            pickle.dump((PICKLE_VERSION, index), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logger.debug("Could not write symbol index of {}: {}".format(region,
+                                                                     e))
+
+
+def _build(region: str) -> SymbolIndex:
+    index = _load_pickle(region)
+    if index is not None:
+        return index
+    with open(_json_path(region)) as f:
+        index = SymbolIndex(json.load(f))
+    _dump_pickle(region, index)
+    logger.debug("Built symbol index of {} with {} entries".format(
+        region, len(index)))
+    return index
+
+
+def get_index(region: str) -> SymbolIndex:
+    with _indices_lock:
+        if region not in _indices:
+            _indices[region] = _build(region)
+        return _indices[region]
+
+
+def lookup(region: str, name: str) -> Union[Tuple[str, str], None]:
+    return get_index(region).find(name)
+
+
+def clear():
+    """Drops all loaded indices, e.g. after the json files were updated"""
+    with _indices_lock:
+        _indices.clear()
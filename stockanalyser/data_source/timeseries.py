@@ -0,0 +1,93 @@
+"""
+timeseries.py
+
+In-memory store for daily closes. Dates and closes are kept in sorted
+NumPy arrays, so every lookup is a binary search.
+
+"""
+
+import datetime
+from typing import Union
+
+import numpy as np
+
+from stockanalyser import exceptions
+
+MAX_DISTANCE = 7
+
+
+def to_datetime64(day: Union[datetime.datetime, datetime.date]) -> np.datetime64:
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    return np.datetime64(day, 'D')
+
+
+class PriceSeries(object):
+    """
+    Daily closes of one notation, sorted by date
+
+    Functions:
+        * ``close_at(day)``:
+            - close of ``day`` or of the nearest trading day
+        * ``closes_at(days)``:
+            - vectorized version of close_at
+    """
+
+    def __init__(self, dates: np.ndarray, closes: np.ndarray):
+        order = np.argsort(dates, kind="mergesort")
+        dates = dates[order]
+        closes = closes[order]
+        # keep the last close of duplicated dates (overlapping downloads)
+        keep = np.append(dates[1:] != dates[:-1], True)[:len(dates)]
+        self.dates = dates[keep]
+        self.closes = closes[keep]
+
+    @classmethod
+    def from_pairs(cls, pairs) -> "PriceSeries":
+        """Creates series from an iterable of (date, close) tuples"""
+        pairs = list(pairs)
+        dates = np.array([to_datetime64(day) for day, _ in pairs],
+                         dtype="datetime64[D]")
+        closes = np.array([close for _, close in pairs], dtype=np.float64)
+        return cls(dates, closes)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __str__(self):
+        if not len(self):
+            return "PriceSeries(empty)"
+        return "PriceSeries({} closes, {} - {})".format(
+            len(self), self.dates[0], self.dates[-1])
+
+    def _nearest_index(self, days: np.ndarray) -> np.ndarray:
+        """Index of the nearest date, ties go to the earlier date"""
+        right = np.searchsorted(self.dates, days, side="left")
+        right = np.clip(right, 0, len(self.dates) - 1)
+        left = np.clip(right - 1, 0, len(self.dates) - 1)
+        left_distance = np.abs(days - self.dates[left])
+        right_distance = np.abs(self.dates[right] - days)
+        return np.where(left_distance <= right_distance, left, right)
+
+    def closes_at(self, days, max_distance: int = MAX_DISTANCE) -> np.ndarray:
+        """Closes of the nearest trading days
+
+        :param days: array like of dates
+        :param max_distance: maximum distance in days to the next known close
+        :raises KeyError: if a date is too far away from any known close
+        """
+        if not len(self):
+            raise exceptions.MissingDataError("Price series is empty")
+        days = np.asarray([to_datetime64(day) for day in days],
+                          dtype="datetime64[D]")
+        idx = self._nearest_index(days)
+        distance = np.abs(self.dates[idx] - days).astype(np.int64)
+        if (distance > max_distance).any():
+            raise KeyError("No close within {} days of {}".format(
+                max_distance, days[distance > max_distance]))
+        return self.closes[idx]
+
+    def close_at(self, day: Union[datetime.datetime, datetime.date],
+                 max_distance: int = MAX_DISTANCE) -> float:
+        """Close of ``day`` or of the nearest trading day"""
+        return float(self.closes_at([day], max_distance)[0])
@@ -0,0 +1,116 @@
+"""
+trading_calendar.py
+
+Trading days of XETRA as a precomputed NumPy business day calendar.
+
+All functions accept a single date or an array like of dates. A single
+date returns a ``datetime.date``, everything else an array of
+``datetime64[D]``, so thousands of dates are resolved in one call.
+
+Functions:
+    * ``is_trading_day(days)``
+    * ``prev_trading_day(days)``: last trading day before ``days``
+    * ``next_trading_day(days)``: first trading day after ``days``
+    * ``closest_trading_day(days)``: nearest trading day, never in the future
+    * ``month_end(days)``: last trading day of the month
+"""
+
+import datetime
+from typing import Union
+
+import numpy as np
+from dateutil.easter import easter
+
+FIRST_YEAR = 1990
+YEARS_AHEAD = 10
+WEEKMASK = "1111100"
+
+
+def xetra_holidays(year: int) -> list:
+    """Weekdays without trading on XETRA"""
+    easter_sunday = easter(year)
+    return [
+        datetime.date(year, 1, 1),  # Neujahr
+        easter_sunday - datetime.timedelta(days=2),  # Karfreitag
+        easter_sunday + datetime.timedelta(days=1),  # Ostermontag
+        datetime.date(year, 5, 1),  # Tag der Arbeit
+        datetime.date(year, 12, 24),  # Heiligabend
+        datetime.date(year, 12, 25),  # 1. Weihnachtstag
+        datetime.date(year, 12, 26),  # 2. Weihnachtstag
+        datetime.date(year, 12, 31),  # Silvester
+    ]
+
+
+def _build_calendar() -> np.busdaycalendar:
+    last_year = datetime.date.today().year + YEARS_AHEAD
+    holidays = [day for year in range(FIRST_YEAR, last_year + 1)
+                for day in xetra_holidays(year)]
+    return np.busdaycalendar(weekmask=WEEKMASK,
+                             holidays=np.array(holidays,
+                                               dtype="datetime64[D]"))
+
+
+CALENDAR = _build_calendar()
+
+Dates = Union[datetime.date, datetime.datetime, np.datetime64, list,
+              np.ndarray]
+
+
+def _to_days(days: Dates):
+    """Returns (datetime64[D] array, True if a single date was given)"""
+    if isinstance(days, datetime.datetime):
+        days = days.date()
+    if isinstance(days, (datetime.date, np.datetime64, str)):
+        return np.array([days], dtype="datetime64[D]"), True
+    days = [day.date() if isinstance(day, datetime.datetime) else day
+            for day in days]
+    return np.asarray(days, dtype="datetime64[D]"), False
+
+
+def _result(days: np.ndarray, single: bool):
+    if single:
+        return days[0].astype(datetime.date)
+    return days
+
+
+def is_trading_day(days: Dates):
+    days, single = _to_days(days)
+    result = np.is_busday(days, busdaycal=CALENDAR)
+    return bool(result[0]) if single else result
+
+
+def prev_trading_day(days: Dates):
+    """Last trading day strictly before each date"""
+    days, single = _to_days(days)
+    return _result(np.busday_offset(days, -1, roll="forward",
+                                    busdaycal=CALENDAR), single)
+
+
+def next_trading_day(days: Dates):
+    """First trading day strictly after each date"""
+    days, single = _to_days(days)
+    return _result(np.busday_offset(days, 1, roll="backward",
+                                    busdaycal=CALENDAR), single)
+
+
+def closest_trading_day(days: Dates, latest: datetime.date = None):
+    """Nearest trading day, the earlier one if both are equally far away
+
+    :param latest: trading days after this date are not used, default: today
+    """
+    days, single = _to_days(days)
+    if latest is None:
+        latest = datetime.date.today()
+    before = np.busday_offset(days, 0, roll="backward", busdaycal=CALENDAR)
+    after = np.busday_offset(days, 0, roll="forward", busdaycal=CALENDAR)
+    use_after = ((after - days) < (days - before)) & \
+        (after <= np.datetime64(latest, "D"))
+    return _result(np.where(use_after, after, before), single)
+
+
+def month_end(days: Dates):
+    """Last trading day of the month of each date"""
+    days, single = _to_days(days)
+    last_day = (days.astype("datetime64[M]") + 1).astype("datetime64[D]") - 1
+    return _result(np.busday_offset(last_day, 0, roll="backward",
+                                    busdaycal=CALENDAR), single)
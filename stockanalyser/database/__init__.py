@@ -5,6 +5,11 @@ Main File: Database_Interface_
 Database must be created locally. Database is not shipped with this project.
 Database straucture and shema can be found in individual file.
 
+All tables share one pooled connection defined in Models_. It is configured
+with the environment variables ``STOCKANALYSER_DATABASE_URL`` (e.g.
+``sqlite:///aktien.db`` for local runs) and
+``STOCKANALYSER_DATABASE_MAX_CONNECTIONS``.
+
 Four Tables are used to Store the data:
 
 +------------------------------------------------------------------------------------------------------------------------------+
@@ -37,6 +42,7 @@ Four Tables are used to Store the data:
 
 
 .. _Database_Interface: database.html#database.database_interface
+.. _Models: database.html#module-database.models
 .. _Aktieninformation: database.html#module-database.aktieninformation
 .. _AktienDataJaehrlich: database.html#module-database.aktien_data_jaehrlich
 .. _AktieLevermannValues: database.html#module-database.aktie_levermann_values
@@ -2,47 +2,12 @@ from peewee import *
 from datetime import datetime
 
 from stockanalyser.database import aktieninformation
+from stockanalyser.database.models import BaseModel, AktienInformation
 # from database import aktieninformation
 
-database = MySQLDatabase('aktien-test',
-                         **{'charset': 'utf8', 'use_unicode': True,
-                            'host': 'localhost', 'user': 'user', 'password': 'password'})
-
-
-class UnknownField(object):
-    def __init__(self, *_, **__):
-        pass
-
-
-class BaseModel(Model):
-    class Meta:
-        database = database
-
-
-class AktienInformation(BaseModel):
-    art = CharField(column_name='Art', null=True)
-    benchmark = CharField(column_name='Benchmark', null=True)
-    finanzennet_url = CharField(column_name='FinanzenNet-URL', null=True)
-    groeße = CharField(column_name='Groeße', null=True)
-    isin = CharField(column_name='ISIN', null=True, unique=True)
-    marketscreener_id = CharField(
-        column_name='Marketscreener-ID', null=True, unique=True)
-    marketscreener_url = CharField(column_name='Marketscreener-URL', null=True)
-    name = CharField(column_name='Name', null=True)
-    onvista_url = CharField(column_name='Onvista-URL', null=True)
-    symbol = CharField(column_name='Symbol', null=True, unique=True)
-    waehrung = CharField(column_name='Waehrung', null=True)
-    aktie_id = AutoField()
-
-    class Meta:
-        table_name = 'aktien_information'
-        indexes = (
-            (('isin', 'onvista_url'), False),
-        )
-
 
 class AktieLevermannValues(BaseModel):
-    analyst_bewertung = IntegerField(null=True)
+    analyst_bewertung = DecimalField(null=True)
     analysten_anzahl = IntegerField(null=True)
     datum = DateTimeField()
     gewinn = DecimalField(null=True)
@@ -66,44 +31,45 @@ class AktieLevermannValues(BaseModel):
         table_name = 'aktie_levermann_values'
 
 
-def save_points(levermann) -> int:
-    sql_data = _prep_data(levermann)
+def save_points(levermann_result) -> int:
+    sql_data = _prep_data(levermann_result)
     return AktieLevermannValues.insert(sql_data).execute()
 
 
-def _prep_data(levermann):
-    eps = _prep_eps(levermann.stock.eps)
-    quarterly_reaction = levermann.eval_quarterly_figures_reaction(
-        case='sql_data')
+def read_last(aktie_id: int):
+    """Last stored values of a stock or None"""
+    return (AktieLevermannValues
+            .select()
+            .where(AktieLevermannValues.id_aktie == aktie_id)
+            .order_by(AktieLevermannValues.datum.desc())
+            .first())
+
+
+def _prep_data(levermann_result) -> dict:
+    """Builds the row from the values captured during the evaluation"""
     data = {
-        'analyst_bewertung': levermann.stock.consensus_ratings["consensus"],
-        'analysten_anzahl': levermann.stock.consensus_ratings["n_analysts"],
+        'analyst_bewertung': levermann_result.consensus,
+        'analysten_anzahl': levermann_result.n_analysts,
         'datum': datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
-        'gewinn': eps[0],
-        'gewinn_nj': eps[1],
-        'gewinn_veraenderung': levermann.stock.eval_earning_revision_cy['Change current Year'],
-        'gewinn_veraenderung_nj': levermann.stock.eval_earning_revision_ny['Change next Year'],
-        'id_aktie': aktieninformation.read_value('aktie_id', levermann.stock.ISIN),
-        'kgv': levermann.stock.per[datetime.today().year],
-        'kgv_5': levermann.stock.five_year_per,
-        'kurs': levermann.stock.quote,
-        'quartalszahlen_letzte': levermann.stock.last_quarterly_figures_release_date(),
-        'veraenderung_index_quartaltag': quarterly_reaction[1],
-        'veraenderung_kurs_quartaltag': quarterly_reaction[0],
-        'veraenderung_kurs_12m': levermann.eval_quote_chg_12month().value,
-        'veraenderung_kurs_6m': levermann.eval_quote_chg_6month().value,
+        'gewinn': levermann_result.eps[0],
+        'gewinn_nj': levermann_result.eps[1],
+        'gewinn_veraenderung': levermann_result.earning_revision_changes[0],
+        'gewinn_veraenderung_nj': levermann_result.earning_revision_changes[1],
+        'id_aktie': aktieninformation.read_value('aktie_id', levermann_result.isin),
+        'kgv': levermann_result.per,
+        'kgv_5': levermann_result.five_year_per,
+        'kurs': levermann_result.quote,
+        'quartalszahlen_letzte': levermann_result.quarterly_figures_date,
+        'veraenderung_index_quartaltag': levermann_result.quarterly_reactions[1],
+        'veraenderung_kurs_quartaltag': levermann_result.quarterly_reactions[0],
+        'veraenderung_kurs_12m': _value(levermann_result.quote_chg_1year),
+        'veraenderung_kurs_6m': _value(levermann_result.quote_chg_6month),
     }
 
     return data
 
 
-def _prep_eps(eps: dict) -> tuple:
-    this_year = datetime.today().year
-    eps_cur_year = eps[this_year]
-    try:
-        eps_next_year = eps[this_year + 1]
-    except KeyError:
-        eps_next_year = eps_cur_year
-        eps_cur_year = eps[this_year - 1]
-
-    return eps_cur_year, eps_next_year
+def _value(criteria_rating):
+    if criteria_rating is None:
+        return None
+    return criteria_rating.value
@@ -1,10 +1,14 @@
 import os
+import weakref
 
 from flask import Flask, g
 from peewee import *
 
 # from database import aktieninformation
 from stockanalyser.database import aktieninformation
+from stockanalyser.exceptions import DatabaseSchemaError
+from stockanalyser.database.models import database, BaseModel, \
+    AktienInformation
 import logging
 logger = logging.getLogger(__name__)
 
@@ -17,41 +21,6 @@ DEBUG = bool(os.environ.get('DEBUG'))
 app = Flask(__name__)
 app.config.from_object(__name__)
 
-database = MySQLDatabase('aktien-test', **{'charset': 'utf8', 'use_unicode': True,
-                                           'host': 'localhost', 'user': 'user', 'password': 'password'})
-
-
-class UnknownField(object):
-    def __init__(self, *_, **__):
-        pass
-
-
-class BaseModel(Model):
-    class Meta:
-        database = database
-
-
-class AktienInformation(BaseModel):
-    art = CharField(column_name='Art', null=True)
-    benchmark = CharField(column_name='Benchmark', null=True)
-    finanzennet_url = CharField(column_name='FinanzenNet-URL', null=True)
-    groeße = CharField(column_name='Groeße', null=True)
-    isin = CharField(column_name='ISIN', null=True, unique=True)
-    marketscreener_id = CharField(
-        column_name='Marketscreener-ID', null=True, unique=True)
-    marketscreener_url = CharField(column_name='Marketscreener-URL', null=True)
-    name = CharField(column_name='Name', null=True)
-    onvista_url = CharField(column_name='Onvista-URL', null=True)
-    symbol = CharField(column_name='Symbol', null=True, unique=True)
-    waehrung = CharField(column_name='Waehrung', null=True)
-    aktie_id = AutoField()
-
-    class Meta:
-        table_name = 'aktien_information'
-        indexes = (
-            (('isin', 'onvista_url'), False),
-        )
-
 
 class AktienJaehrlicheDaten(BaseModel):
     jahr = IntegerField(column_name='Jahr')
@@ -70,24 +39,99 @@ class AktienJaehrlicheDaten(BaseModel):
 
     class Meta:
         table_name = 'aktien_jaehrliche_daten'
+        indexes = (
+            (('aktie', 'jahr'), True),
+        )
+
+
+BATCH_SIZE = 100
+QUARTER_FIELDS = ('q1', 'q2', 'q3', 'q4')
+# fields of the stock that make up the yearly figures
+YEARLY_FIELDS = ('roe', 'ebit_margin', 'equity_ratio', 'eps', 'per')
+UNIQUE_KEY_MIGRATION = "migrations/001_aktien_jaehrliche_daten_unique_key.sql"
+
+# database objects whose unique key (aktie_id, Jahr) was checked
+_checked_databases = weakref.WeakSet()
 
 
-def save_yearly(stock_object) -> int:
+def save_yearly(stock_object, aktie_id: int = None) -> int:
+    """Upserts all years of one stock in a single statement"""
+    if aktie_id is None:
+        aktie_id = aktieninformation.read_value("aktie_id", stock_object.ISIN)
+    rows = _yearly_rows(stock_object, aktie_id)
+    with database.atomic():
+        return rows_upsert(rows)
+
+
+def save_yearly_batch(stock_objects: list, batch_size: int = BATCH_SIZE) -> int:
+    """Upserts the yearly data of many stocks.
+
+    The aktie_ids of a batch are read with one query, all rows of a batch
+    are written with one multi row statement inside one transaction.
+    """
     lines_changed = 0
-    aktie_id = aktieninformation.read_value("aktie_id", stock_object.ISIN)
-    for year in stock_object.eps.keys():
-        sql_data = _yearly_prepare_dict(stock_object, aktie_id, year)
-        exists = row_get(aktie_id, year)
-        if not exists:
-            lines_changed += row_insert(sql_data)
-        else:
-            lines_changed += row_update(aktie_id, year, sql_data)
+    for start in range(0, len(stock_objects), batch_size):
+        batch = stock_objects[start:start + batch_size]
+        aktie_ids = read_aktie_ids([stock.ISIN for stock in batch])
+        rows = []
+        for stock_object in batch:
+            if stock_object.ISIN not in aktie_ids:
+                logger.warning("{} is not in aktien_information. Yearly data "
+                               "is not saved".format(stock_object.ISIN))
+                continue
+            rows.extend(_yearly_rows(stock_object,
+                                     aktie_ids[stock_object.ISIN]))
+        with database.atomic():
+            lines_changed += rows_upsert(rows)
+    return lines_changed
+
+
+def save_quarterly_dates(stock_object, aktie_id: int = None) -> int:
+    """Updates only the quarterly figure dates of the stored years, e.g.
+    of a stock whose yearly figures were loaded from the database. Like
+    save_yearly it doesn't add years and keeps the stored dates of quarters
+    without a date"""
+    if aktie_id is None:
+        aktie_id = aktieninformation.read_value("aktie_id", stock_object.ISIN)
+    quarterly_figure_dates = list(stock_object.quarterly_figure_dates or [])
+    lines_changed = 0
+    with database.atomic():
+        for year in sorted({d.year for d in quarterly_figure_dates}):
+            lines_changed += AktienJaehrlicheDaten.update(
+                _quarter_columns(quarterly_figure_dates, year)).where(
+                (AktienJaehrlicheDaten.aktie == aktie_id)
+                & (AktienJaehrlicheDaten.jahr == year)).execute()
     return lines_changed
 
 
+def read_aktie_ids(isins: list) -> dict:
+    """Maps ISINs to aktie_id with a single query"""
+    query = (AktienInformation
+             .select(AktienInformation.isin, AktienInformation.aktie_id)
+             .where(AktienInformation.isin.in_(isins)))
+    return {row.isin: row.aktie_id for row in query}
+
+
+def _yearly_rows(stock_object, aktie_id: int) -> list:
+    missing = [field for field in YEARLY_FIELDS
+               if field in stock_object.missing]
+    if missing:
+        # the stored figures are better than none
+        logger.warning("{} missed {}, yearly data is not saved".format(
+            stock_object.ISIN, ", ".join(missing)))
+        return []
+    rows = []
+    for year in stock_object.eps.keys():
+        row = dict.fromkeys(QUARTER_FIELDS)
+        row.update(_yearly_prepare_dict(stock_object, aktie_id, year))
+        rows.append(row)
+    return rows
+
+
 def _yearly_prepare_dict(stock_object, aktie_id: int, year: int) -> dict:
     per = stock_object.per
-    quarterly_figure_dates = stock_object.quarterly_figure_dates
+    # None if finanzen.net missed the deadline
+    quarterly_figure_dates = stock_object.quarterly_figure_dates or []
     ebit = stock_object.ebit_margin
     roe = stock_object.roe
     equity_ratio = stock_object.equity_ratio
@@ -110,14 +154,21 @@ def _yearly_prepare_dict(stock_object, aktie_id: int, year: int) -> dict:
         sql_data['kgv'] = per[year]
     else:
         sql_data['kgv'] = None
-
-    this_year_quarterly = sort_quarterly_dates(quarterly_figure_dates, year)
-    for idx, elem in enumerate(this_year_quarterly[::-1]):
-        sql_data['q' + str(4 - idx)] = elem.strftime("%Y-%m-%d %H:%M:%S")
+    sql_data['eps'] = stock_object.eps[year]
+    sql_data.update(_quarter_columns(quarterly_figure_dates, year))
 
     return sql_data
 
 
+def _quarter_columns(quarterly_figure_dates: list, year: int) -> dict:
+    """The dates of year as columns, the last one is Q4"""
+    this_year_quarterly = sort_quarterly_dates(quarterly_figure_dates, year)
+    columns = {}
+    for idx, elem in enumerate(this_year_quarterly[::-1][:4]):
+        columns['q' + str(4 - idx)] = elem.strftime("%Y-%m-%d %H:%M:%S")
+    return columns
+
+
 def sort_quarterly_dates(quarterly_figure_dates: list, year: int) -> list:
     quarterly_figure_dates.sort()
     this_year_quarterly = []
@@ -127,6 +178,18 @@ def sort_quarterly_dates(quarterly_figure_dates: list, year: int) -> list:
     return this_year_quarterly
 
 
+def read_yearly(aktie_id: int) -> dict:
+    """Stored yearly data of one stock
+
+    :return: year => AktienJaehrlicheDaten, latest year first
+    """
+    query = (AktienJaehrlicheDaten
+             .select()
+             .where(AktienJaehrlicheDaten.aktie == aktie_id)
+             .order_by(AktienJaehrlicheDaten.jahr.desc()))
+    return {row.jahr: row for row in query}
+
+
 # TODO fix langugae: Create Tables in English not German!!
 def row_get(aktien_id: int, year: int):
     row = AktienJaehrlicheDaten.get_or_none(
@@ -145,6 +208,54 @@ def row_insert(colum_value: dict) -> int:
     return rows
 
 
+def rows_upsert(rows: list) -> int:
+    """INSERT ... ON DUPLICATE KEY UPDATE for many rows at once.
+
+    Unknown quarterly figure dates (None) don't overwrite stored dates.
+    """
+    if not rows:
+        return 0
+    check_unique_key()
+    model = AktienJaehrlicheDaten
+    quarters = [getattr(model, field) for field in QUARTER_FIELDS]
+    preserve = [model.ebit, model.eigenkapitalquote, model.eps, model.kgv,
+                model.return_on_equity]
+    if isinstance(database.obj, MySQLDatabase):
+        conflict_target = None
+        update = {field: fn.COALESCE(fn.VALUES(field), field)
+                  for field in quarters}
+    else:
+        # SQLite and PostgreSQL name the conflicting key explicitly
+        conflict_target = [model.aktie, model.jahr]
+        update = {field: fn.COALESCE(getattr(EXCLUDED, field.column_name),
+                                     field)
+                  for field in quarters}
+    return (model.insert_many(rows)
+            .on_conflict(conflict_target=conflict_target, preserve=preserve,
+                         update=update)
+            .execute())
+
+
+def check_unique_key():
+    """The upsert needs the unique key (aktie_id, Jahr), without it every
+    save would insert another row per stock and year
+
+    :raises DatabaseSchemaError: if the key is missing
+    """
+    if database.obj in _checked_databases:
+        return
+    table = AktienJaehrlicheDaten._meta.table_name
+    columns = {'aktie_id', 'jahr'}
+    for index in database.get_indexes(table):
+        if index.unique and {column.lower() for column in index.columns} \
+                == columns:
+            _checked_databases.add(database.obj)
+            return
+    raise DatabaseSchemaError(
+        "{} has no unique key (aktie_id, Jahr), apply {} first".format(
+            table, UNIQUE_KEY_MIGRATION))
+
+
 # Request handlers -- these two hooks are provided by flask and we will use them
 # to create and tear down a database connection on each request.
 @app.before_request
@@ -1,10 +1,16 @@
+import collections
+import difflib
 import os
+import re
+import threading
 
 from flask import Flask, g
 from peewee import *
 import logging
 from playhouse import shortcuts
 
+from stockanalyser.database.models import database, AktienInformation
+
 logger = logging.getLogger(__name__)
 
 # Flask settings.
@@ -13,40 +19,18 @@ DEBUG = bool(os.environ.get('DEBUG'))
 app = Flask(__name__)
 app.config.from_object(__name__)
 
-database = MySQLDatabase('aktien-test',
-                         **{'charset': 'utf8', 'use_unicode': True,
-                            'host': 'localhost', 'user': 'user', 'password': 'password'})
-
-
-class UnknownField(object):
-    def __init__(self, *_, **__):
-        pass
-
-
-class BaseModel(Model):
-    class Meta:
-        database = database
-
+ISIN_PATTERN = re.compile(r"^[A-Z]{2}[A-Z0-9]{9}[0-9]$")
+ROW_CACHE_SIZE = 4096
+NAME_MATCH_CUTOFF = 0.8
 
-class AktienInformation(BaseModel):
-    art = CharField(column_name='Art', null=True)
-    benchmark = CharField(column_name='Benchmark', null=True)
-    finanzennet_url = CharField(column_name='FinanzenNet-URL', null=True)
-    groeße = CharField(column_name='Groeße', null=True)
-    isin = CharField(column_name='ISIN', null=True, unique=True)
-    marketscreener_id = CharField(column_name='Marketscreener-ID', null=True,
-                                  unique=True)
-    marketscreener_url = CharField(column_name='Marketscreener-URL', null=True)
-    name = CharField(column_name='Name', null=True)
-    onvista_url = CharField(column_name='Onvista-URL', null=True)
-    notation_id = CharField(column_name='notation_id', null=True, unique=True)
-    aktie_id = AutoField()
+_name_index = None
+_token_index = None
+_name_index_lock = threading.Lock()
 
-    class Meta:
-        table_name = 'aktien_information'
-        indexes = (
-            (('isin', 'onvista_url'), False),
-        )
+# rows by (column, value), only found rows are cached so that an entry
+# inserted later is found by the next lookup
+_row_cache = collections.OrderedDict()
+_row_cache_lock = threading.Lock()
 
 
 def insert_data(stock_object) -> int:
@@ -65,28 +49,17 @@ def insert_data(stock_object) -> int:
             'onvista_url': stock_object.OS.overview_url,
             'notation_id': stock_object.OS.notation_id,
         }
-        return AktienInformation.insert(sql_data).execute()
+        lines_changed = AktienInformation.insert(sql_data).execute()
+        invalidate_cache()
+        return lines_changed
     else:
         return -1
 
 
 def read_value(case: str, isin: str):
-    row = AktienInformation.get_or_none(AktienInformation.isin == isin)
+    row = _row_by('isin', isin)
     if row:
-        cases = {
-            'art': row.art,
-            'benchmark': row.benchmark,
-            'finanzennet_url': row.finanzennet_url,
-            'aktie_id': row.aktie_id,
-            'isin': row.isin,
-            'marketscreener_id': row.marketscreener_id,
-            'marketscreener_url': row.marketscreener_url,
-            'name': row.name,
-            'onvista_url': row.onvista_url,
-            'notation_id': row.notation_id,
-            'groeße': row.groeße
-        }
-        return cases.get(case, 'Invalid')
+        return row.get(case, 'Invalid')
     else:
         return None
 
@@ -94,23 +67,117 @@ def read_value(case: str, isin: str):
 def find_data_entry(fields: str or int) -> dict:
     """Searches for data entry in local database.
 
-    :param fields: Can be anything
-    :return: first matching entry
+    The kind of key decides which indexed column is used:
+        * int: aktie_id
+        * ISIN: ISIN
+        * only digits: notation_id or Marketscreener-ID
+        * url: Onvista-, FinanzenNet- or Marketscreener-URL
+        * anything else: name, see find_by_name
+
+    :param fields: key of the entry
+    :return: matching entry
     """
-    columns = [AktienInformation.art, AktienInformation.benchmark,
-               AktienInformation.finanzennet_url, AktienInformation.groeße,
-               AktienInformation.isin,
-               AktienInformation.marketscreener_id,
-               AktienInformation.marketscreener_url, AktienInformation.name,
-               AktienInformation.onvista_url, AktienInformation.notation_id,
-               AktienInformation.aktie_id, ]
-    for elem in columns:
-        try:
-            row = AktienInformation.get_or_none(elem.contains(fields))
-        except ValueError:
-            continue
-        if row:
-            return shortcuts.model_to_dict(row)
+    if isinstance(fields, int):
+        return _row_by('aktie_id', fields)
+    key = str(fields).strip()
+    if ISIN_PATTERN.match(key.upper()):
+        return _row_by('isin', key.upper())
+    if key.isdigit():
+        return _row_by('notation_id', key) or \
+            _row_by('marketscreener_id', key)
+    if key.startswith("http"):
+        for column in ('onvista_url', 'finanzennet_url', 'marketscreener_url'):
+            row = _row_by(column, key)
+            if row:
+                return row
+        return None
+    return find_by_name(key)
+
+
+def find_by_name(name: str) -> dict:
+    """Finds entry by exact or similar name using the in-memory name index"""
+    index, token_index = _get_name_index()
+    normalized = _normalize_name(name)
+    if normalized in index:
+        return _row_by('aktie_id', index[normalized])
+
+    indexed_name = _find_by_tokens(token_index, normalized.split())
+    if indexed_name is not None:
+        return _row_by('aktie_id', index[indexed_name])
+
+    matches = difflib.get_close_matches(normalized, index.keys(), n=1,
+                                        cutoff=NAME_MATCH_CUTOFF)
+    if matches:
+        return _row_by('aktie_id', index[matches[0]])
+    return None
+
+
+def invalidate_cache():
+    """Needs to be called after aktien_information changed"""
+    global _name_index, _token_index
+    with _row_cache_lock:
+        _row_cache.clear()
+    with _name_index_lock:
+        _name_index = None
+        _token_index = None
+
+
+def _row_by(column: str, value) -> dict:
+    row = _cached_row(column, value)
+    if row is None:
+        return None
+    return dict(row)
+
+
+def _cached_row(column: str, value):
+    key = (column, value)
+    with _row_cache_lock:
+        if key in _row_cache:
+            _row_cache.move_to_end(key)
+            return _row_cache[key]
+    row = AktienInformation.get_or_none(
+        getattr(AktienInformation, column) == value)
+    if row is None:
+        return None
+    row = shortcuts.model_to_dict(row)
+    with _row_cache_lock:
+        _row_cache[key] = row
+        if len(_row_cache) > ROW_CACHE_SIZE:
+            _row_cache.popitem(last=False)
+    return row
+
+
+def _normalize_name(name: str) -> str:
+    name = re.sub(r"[^\w]+", " ", name.lower())
+    return " ".join(name.split())
+
+
+def _get_name_index() -> tuple:
+    """The name index and the names of the index by token"""
+    global _name_index, _token_index
+    with _name_index_lock:
+        if _name_index is None:
+            query = AktienInformation.select(AktienInformation.aktie_id,
+                                             AktienInformation.name)
+            _name_index = {_normalize_name(row.name): row.aktie_id
+                           for row in query if row.name}
+            _token_index = {}
+            for indexed_name in _name_index:
+                for token in set(indexed_name.split()):
+                    _token_index.setdefault(token, {})[indexed_name] = None
+        return _name_index, _token_index
+
+
+def _find_by_tokens(token_index: dict, tokens: list):
+    """First indexed name that contains all tokens"""
+    if not tokens:
+        return None
+    candidates = [token_index.get(token, {}) for token in set(tokens)]
+    candidates.sort(key=len)
+    # the names of a token keep the order of the name index
+    for indexed_name in candidates[0]:
+        if all(indexed_name in names for names in candidates[1:]):
+            return indexed_name
     return None
 
 
@@ -1,10 +1,25 @@
 from stockanalyser.database import aktieninformation, aktien_data_jaehrlich, \
-    aktie_levermann_result, aktie_levermann_values
+    aktie_levermann_result, aktie_levermann_values, models
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def configure(url: str = None, max_connections: int = None):
+    """Configures the connection pool that is shared by all tables"""
+    return models.configure(url=url, max_connections=max_connections)
+
+
+def create_tables():
+    """Creates all tables, e.g. for a local SQLite database"""
+    models.database.create_tables([
+        models.AktienInformation,
+        aktien_data_jaehrlich.AktienJaehrlicheDaten,
+        aktie_levermann_values.AktieLevermannValues,
+        aktie_levermann_result.AktieLevermannPunkte,
+    ], safe=True)
+
+
 def save_information(stock_object):
     lines_changed: int = aktieninformation.insert_data(
         stock_object=stock_object)
@@ -17,17 +32,47 @@ def save_yearly(stock_object):
     logger.debug("{} lines where changed!".format(lines_changed))
 
 
+def save_yearly_batch(stock_objects: list):
+    lines_changed: int = aktien_data_jaehrlich.save_yearly_batch(
+        stock_objects=stock_objects)
+    logger.debug("{} lines where changed!".format(lines_changed))
+
+
+def save_quarterly_dates(stock_object):
+    lines_changed: int = aktien_data_jaehrlich.save_quarterly_dates(
+        stock_object=stock_object)
+    logger.debug("{} lines where changed!".format(lines_changed))
+
+
 def save_points(levermann_result_object):
     lines_changed: int = aktie_levermann_result.save_points(
         levermann_result=levermann_result_object)
     logger.debug("{} lines where changed!".format(lines_changed))
 
 
-def save_values(levermann_object):
+def save_values(levermann_result_object):
     lines_changed: int = aktie_levermann_values.save_points(
-        levermann=levermann_object)
+        levermann_result=levermann_result_object)
     logger.debug("{} lines where changed!".format(lines_changed))
 
 
+def load_stock_data(isin: str) -> dict:
+    """Everything that is stored about a stock
+
+    :return: None if the stock is unknown, otherwise dict with
+        "information" (dict), "yearly" (year => row) and "values" (last
+        aktie_levermann_values row or None)
+    """
+    information = aktieninformation.find_data_entry(isin)
+    if information is None:
+        return None
+    aktie_id = information['aktie_id']
+    return {
+        'information': information,
+        'yearly': aktien_data_jaehrlich.read_yearly(aktie_id),
+        'values': aktie_levermann_values.read_last(aktie_id),
+    }
+
+
 def find_entry_in_aktieninformation(field: str) -> dict:
     return aktieninformation.find_data_entry(field)
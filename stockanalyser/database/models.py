@@ -0,0 +1,95 @@
+"""Database connection and models that are shared by the whole package.
+
+All tables use the single ``database`` object. It is a proxy to a pooled
+connection that is configured from ``STOCKANALYSER_DATABASE_URL`` (see
+config.py), so MySQL can be swapped for SQLite in local runs.
+
+"""
+import logging
+from urllib.parse import urlsplit
+
+from peewee import *
+from playhouse.db_url import connect
+
+from stockanalyser import instrumentation
+from stockanalyser.config import DATABASE_URL, DATABASE_MAX_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+database = Proxy()
+_database_url = None
+
+
+def configure(url: str = None, max_connections: int = None):
+    """(Re)configures the connection of all models.
+
+    :param url: peewee database url, default: config.DATABASE_URL
+    :param max_connections: pool size, should match the number of workers
+    :return: the configured peewee database
+    """
+    global _database_url
+    url = url or _database_url or DATABASE_URL
+    scheme = urlsplit(url).scheme
+    kwargs = {}
+    if scheme.startswith("mysql"):
+        kwargs.update({'charset': 'utf8', 'use_unicode': True})
+    if scheme.endswith("+pool"):
+        kwargs.update({
+            'max_connections': max_connections or DATABASE_MAX_CONNECTIONS,
+            'stale_timeout': 300,
+        })
+    if database.obj is not None:
+        if hasattr(database.obj, 'close_all'):
+            database.obj.close_all()
+        else:
+            database.obj.close()
+    database.initialize(_count_statements(connect(url, **kwargs)))
+    _database_url = url
+    logger.debug("Configured database '{}'".format(scheme))
+    return database.obj
+
+
+def _count_statements(db):
+    """Reports every statement of db to the instrumentation"""
+    execute_sql = db.execute_sql
+
+    def counted_execute_sql(sql, *args, **kwargs):
+        instrumentation.record_statement(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    db.execute_sql = counted_execute_sql
+    return db
+
+
+class UnknownField(object):
+    def __init__(self, *_, **__):
+        pass
+
+
+class BaseModel(Model):
+    class Meta:
+        database = database
+
+
+class AktienInformation(BaseModel):
+    art = CharField(column_name='Art', null=True)
+    benchmark = CharField(column_name='Benchmark', null=True)
+    finanzennet_url = CharField(column_name='FinanzenNet-URL', null=True)
+    groeße = CharField(column_name='Groeße', null=True)
+    isin = CharField(column_name='ISIN', null=True, unique=True)
+    marketscreener_id = CharField(column_name='Marketscreener-ID', null=True,
+                                  unique=True)
+    marketscreener_url = CharField(column_name='Marketscreener-URL', null=True)
+    name = CharField(column_name='Name', null=True, index=True)
+    onvista_url = CharField(column_name='Onvista-URL', null=True)
+    notation_id = CharField(column_name='notation_id', null=True, unique=True)
+    aktie_id = AutoField()
+
+    class Meta:
+        table_name = 'aktien_information'
+        indexes = (
+            (('isin', 'onvista_url'), False),
+        )
+
+
+configure()
@@ -0,0 +1,102 @@
+"""
+deadlines.py
+
+Time budgets for the evaluation of a stock.
+
+A budget holds for everything inside of ``budget(seconds)``, also in worker
+threads and asyncio tasks as long as the context is passed on (see
+``common.run_in_executor``). Nested budgets only shorten the deadline.
+
+Inside a budget the timeouts of requests end at the deadline at the latest
+and waits for rate limits or retries that would end after it raise a
+DeadlineExceededError instead, so a slow website can't hold a stock
+longer than its budget.
+
+Functions:
+    * ``budget(seconds)``, ``until(deadline)``: context managers
+    * ``deadline()``, ``remaining()``, ``expired()``
+    * ``check(what)``, ``check_wait(seconds, what)``, ``timeout(default)``
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Union
+
+from stockanalyser.exceptions import DeadlineExceededError
+
+# seconds a stock may take in a batch run
+STOCK_BUDGET = 180
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def until(deadline: Union[float, None]):
+    """Everything inside has to be done at ``deadline`` (time.monotonic),
+    None keeps the current deadline"""
+    current = _deadline.get()
+    if deadline is None or (current is not None and current <= deadline):
+        yield
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def budget(seconds: Union[float, None]):
+    """Everything inside has to be done in ``seconds``, None = no budget"""
+    with until(None if seconds is None else time.monotonic() + seconds):
+        yield
+
+
+def deadline() -> Union[float, None]:
+    return _deadline.get()
+
+
+def remaining() -> Union[float, None]:
+    """Seconds until the deadline, None without a budget"""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(what: str):
+    """:raises DeadlineExceededError: if the deadline is over"""
+    if expired():
+        raise DeadlineExceededError("Deadline exceeded before {}".format(
+            what))
+
+
+def check_wait(seconds: float, what: str):
+    """:raises DeadlineExceededError: if a wait of ``seconds`` would end
+    after the deadline"""
+    left = remaining()
+    if left is not None and seconds >= left:
+        raise DeadlineExceededError(
+            "Waiting {:.1f}s for {} exceeds the deadline in {:.1f}s".format(
+                seconds, what, max(0.0, left)))
+
+
+def timeout(default):
+    """The timeout of a request, ``default`` cut to the deadline
+
+    :param default: seconds or a (connect, read) tuple like in requests
+    :raises DeadlineExceededError: if the deadline is over
+    """
+    left = remaining()
+    if left is None:
+        return default
+    check("the request")
+    if isinstance(default, tuple):
+        return tuple(min(value, left) for value in default)
+    return min(default, left)
@@ -20,3 +20,11 @@ class ParsingError(Exception):
 
 class DataTypeNotSupportedError(Exception):
     pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class DatabaseSchemaError(Exception):
+    pass
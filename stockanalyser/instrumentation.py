@@ -0,0 +1,290 @@
+"""
+instrumentation.py
+
+Hooks that observe a run. The request, database and evaluation code report
+events here, registered hooks receive them together with the stock and the
+criterion that caused them.
+
+Events:
+    * request: one HTTP request, served online or from the cache
+    * statement: one SQL statement
+    * criterion: a Levermann criterion was evaluated
+
+The stock and criterion are taken from context variables, so they are
+correct in worker threads and asyncio tasks as long as the context is
+passed on (see ``common.run_in_executor``).
+
+Functions:
+    * ``add_hook(hook)``, ``remove_hook(hook)``
+    * ``stock(isin)``, ``criterion(name)``:
+        - context managers that attribute the events inside them
+    * ``record_request(url, nbytes, cached)``, ``record_statement(sql)``
+
+Classes:
+    * ``Hook``: base class with empty event handlers
+    * ``RunReport``: collects the events per stock, exports them as json and
+      in the Prometheus text format
+"""
+
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+_hooks = []
+_hooks_lock = threading.Lock()
+_stock = contextvars.ContextVar("stock", default=None)
+_criterion = contextvars.ContextVar("criterion", default=None)
+
+METRIC_PREFIX = "stockanalyser"
+
+
+class Hook(object):
+    """
+    Receives the events of a run. ``stock`` is the ISIN and ``criterion``
+    the criterion that was evaluated, both are None outside of them.
+    Handlers are called from many threads.
+    """
+
+    def on_request(self, stock, criterion, url: str, nbytes: int,
+                   cached: bool):
+        pass
+
+    def on_statement(self, stock, criterion, sql: str):
+        pass
+
+    def on_criterion(self, stock, name: str, seconds: float):
+        pass
+
+
+def add_hook(hook: Hook):
+    global _hooks
+    with _hooks_lock:
+        # replaced instead of appended, so emitting needs no lock
+        _hooks = _hooks + [hook]
+
+
+def remove_hook(hook: Hook):
+    global _hooks
+    with _hooks_lock:
+        _hooks = [h for h in _hooks if h is not hook]
+
+
+@contextmanager
+def stock(isin: str):
+    """Attributes all events inside to the stock"""
+    token = _stock.set(isin)
+    try:
+        yield
+    finally:
+        _stock.reset(token)
+
+
+@contextmanager
+def criterion(name: str):
+    """Measures the wall time of a criterion, events inside belong to it"""
+    token = _criterion.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _criterion.reset(token)
+        for hook in _hooks:
+            hook.on_criterion(_stock.get(), name, seconds)
+
+
+def record_request(url: str, nbytes: int, cached: bool):
+    if not _hooks:
+        return
+    for hook in _hooks:
+        hook.on_request(_stock.get(), _criterion.get(), url, nbytes, cached)
+
+
+def record_statement(sql: str):
+    if not _hooks:
+        return
+    for hook in _hooks:
+        hook.on_statement(_stock.get(), _criterion.get(), sql)
+
+
+class StockMetrics(object):
+    """
+    Everything that was recorded for one stock
+    """
+    __slots__ = ("criteria", "criterion_requests", "requests", "bytes",
+                 "cache_hits", "statements")
+
+    def __init__(self):
+        self.criteria = {}
+        self.criterion_requests = {}
+        self.requests = {}
+        self.bytes = 0
+        self.cache_hits = 0
+        self.statements = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "criteria_seconds": {name: round(seconds, 6) for name, seconds
+                                 in self.criteria.items()},
+            "criteria_requests": dict(self.criterion_requests),
+            "requests": dict(self.requests),
+            "bytes": self.bytes,
+            "cache_hits": self.cache_hits,
+            "db_statements": self.statements,
+        }
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+class RunReport(Hook):
+    """
+    Collects the events of a run per stock. Events outside of a stock are
+    collected under the ISIN ""
+    """
+
+    METRICS = (
+        ("criterion_seconds_total", "counter",
+         "Wall time of the Levermann criteria"),
+        ("criterion_requests_total", "counter",
+         "HTTP requests caused by the Levermann criteria"),
+        ("requests_total", "counter", "HTTP requests per host"),
+        ("downloaded_bytes_total", "counter",
+         "Bytes of responses that were not cached"),
+        ("cache_hits_total", "counter", "Responses served from the cache"),
+        ("db_statements_total", "counter", "SQL statements"),
+    )
+
+    def __init__(self):
+        self.started = datetime.datetime.now()
+        self.finished = None
+        self.stocks = {}
+        self._lock = threading.Lock()
+
+    def _metrics(self, isin) -> StockMetrics:
+        isin = isin or ""
+        if isin not in self.stocks:
+            self.stocks[isin] = StockMetrics()
+        return self.stocks[isin]
+
+    def on_request(self, stock, criterion, url, nbytes, cached):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            metrics = self._metrics(stock)
+            metrics.requests[host] = metrics.requests.get(host, 0) + 1
+            if cached:
+                metrics.cache_hits += 1
+            else:
+                metrics.bytes += nbytes
+            if criterion is not None:
+                metrics.criterion_requests[criterion] = \
+                    metrics.criterion_requests.get(criterion, 0) + 1
+
+    def on_statement(self, stock, criterion, sql):
+        with self._lock:
+            self._metrics(stock).statements += 1
+
+    def on_criterion(self, stock, name, seconds):
+        with self._lock:
+            metrics = self._metrics(stock)
+            metrics.criteria[name] = metrics.criteria.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.finished = datetime.datetime.now()
+
+    def criteria_totals(self) -> dict:
+        """Wall time per criterion over all stocks, slowest first"""
+        totals = {}
+        with self._lock:
+            for metrics in self.stocks.values():
+                for name, seconds in metrics.criteria.items():
+                    totals[name] = totals.get(name, 0.0) + seconds
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stocks = {isin: metrics.to_dict()
+                      for isin, metrics in self.stocks.items()}
+        totals = {
+            "criteria_seconds": {name: round(seconds, 6) for name, seconds
+                                 in self.criteria_totals().items()},
+            "requests": sum(sum(s["requests"].values())
+                            for s in stocks.values()),
+            "bytes": sum(s["bytes"] for s in stocks.values()),
+            "cache_hits": sum(s["cache_hits"] for s in stocks.values()),
+            "db_statements": sum(s["db_statements"] for s in stocks.values()),
+        }
+        return {
+            "started": self.started.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+            "totals": totals,
+            "stocks": stocks,
+        }
+
+    def _samples(self):
+        """(metric, labels, value) of all stocks"""
+        with self._lock:
+            for isin, metrics in sorted(self.stocks.items()):
+                for name, seconds in metrics.criteria.items():
+                    yield ("criterion_seconds_total",
+                           {"isin": isin, "criterion": name}, seconds)
+                for name, count in metrics.criterion_requests.items():
+                    yield ("criterion_requests_total",
+                           {"isin": isin, "criterion": name}, count)
+                for host, count in metrics.requests.items():
+                    yield ("requests_total", {"isin": isin, "host": host},
+                           count)
+                yield ("downloaded_bytes_total", {"isin": isin},
+                       metrics.bytes)
+                yield ("cache_hits_total", {"isin": isin},
+                       metrics.cache_hits)
+                yield ("db_statements_total", {"isin": isin},
+                       metrics.statements)
+
+    def prometheus_text(self) -> str:
+        """The report in the Prometheus text exposition format"""
+        samples = {}
+        for metric, labels, value in self._samples():
+            samples.setdefault(metric, []).append((labels, value))
+        lines = []
+        for metric, kind, description in self.METRICS:
+            name = "{}_{}".format(METRIC_PREFIX, metric)
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples.get(metric, []):
+                lines.append("{}{{{}}} {}".format(name, ",".join(
+                    '{}="{}"'.format(key, _label(label))
+                    for key, label in labels.items()), value))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str):
+        """Writes e.g. a .prom file for the node exporter textfile
+        collector"""
+        _write_atomic(path, self.prometheus_text())
+
+    def __str__(self):
+        totals = self.criteria_totals()
+        overall = sum(totals.values())
+        lines = ["Wall time per criterion:"]
+        for name, seconds in totals.items():
+            lines.append("{:<35} {:>9.3f}s {:>6.1%}".format(
+                name, seconds, seconds / overall if overall else 0.0))
+        return "\n".join(lines)
+
+
+def _write_atomic(path: str, text: str):
+    """Readers of path never see a partially written file"""
+    temp = "{}.tmp".format(path)
+    with open(temp, "w") as f:
+        f.write(text)
+    os.replace(temp, path)
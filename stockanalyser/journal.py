@@ -0,0 +1,148 @@
+"""
+journal.py
+
+Append-only journal of a batch run, so an interrupted run can be resumed.
+
+Every line is a json object with an ``event``:
+    * ``start``: the run was (re)started
+    * ``fetched``: a stock requested ``url``, the page is in the HTTP cache
+    * ``done``: the stock was evaluated and saved with ``score``
+    * ``failed``: the evaluation of the stock failed with ``error``
+
+A run that is started with an existing journal skips the ISINs that are
+done and pins the pages it fetched in the HTTP cache (see
+:func:`stockanalyser.data_source.cache.pin`), so they are not requested
+again even if their time to live is over. Pages older than ``MAX_AGE`` are
+not pinned, stocks that failed are evaluated again.
+
+Lines are flushed after every event. A line that was cut off by a crash is
+skipped when the journal is read.
+
+Classes:
+    * ``RunJournal``: instrumentation hook that writes the journal
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from stockanalyser import instrumentation
+from stockanalyser.data_source import cache
+
+logger = logging.getLogger(__name__)
+
+# pages of an interrupted run are reused for this many seconds
+MAX_AGE = cache.DAY
+
+
+class RunJournal(instrumentation.Hook):
+    """
+    Reads the journal at ``path`` if it exists and appends to it
+
+    Add it as hook, so the pages requested by the stocks are journaled.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scores = {}
+        self.failed = {}
+        self._fetched = set()
+        self._lock = threading.Lock()
+        self._file = None
+        self._cut_off = False
+
+    def _read(self) -> int:
+        """Loads the events of earlier runs, returns the number of pages
+        that are reused"""
+        if not os.path.exists(self.path):
+            return 0
+        oldest = time.time() - MAX_AGE
+        pages = set()
+        line = "\n"
+        with open(self.path) as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                    event = entry["event"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Skipping line {} of journal {}".format(
+                        number, self.path))
+                    continue
+                if event == "fetched" and entry.get("time", 0) >= oldest:
+                    pages.add(entry["url"])
+                elif event == "done":
+                    self.scores[entry["isin"]] = entry.get("score")
+                    self.failed.pop(entry["isin"], None)
+                elif event == "failed":
+                    self.failed[entry["isin"]] = entry.get("error")
+        cache.pin(pages)
+        self._fetched = pages
+        self._cut_off = not line.endswith("\n")
+        return len(pages)
+
+    def open(self):
+        pages = self._read()
+        if self.scores or pages:
+            logger.info("Resuming from journal {}: {} stocks done, {} "
+                        "failed, {} pages reused".format(
+                            self.path, len(self.scores), len(self.failed),
+                            pages))
+        self._file = open(self.path, "a")
+        if self._cut_off:
+            # the cut off line of a crash must not swallow the next event
+            self._file.write("\n")
+        self._write({"event": "start", "pid": os.getpid()})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        cache.unpin()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, entry: dict):
+        entry["time"] = round(time.time(), 3)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def done(self, isin: str) -> bool:
+        return isin in self.scores
+
+    def pending(self, isins):
+        """The ISINs that aren't done yet, isins may be a generator"""
+        for isin in isins:
+            if self.done(isin):
+                logger.debug("{} is done according to the journal".format(
+                    isin))
+                continue
+            yield isin
+
+    def record(self, isin: str, score=None, error=None):
+        """Journals the outcome of a stock, the stock is done without
+        error"""
+        if error is None:
+            self.scores[isin] = score
+            self._write({"event": "done", "isin": isin, "score": score})
+        else:
+            self.failed[isin] = error
+            self._write({"event": "failed", "isin": isin, "error": error})
+
+    def on_request(self, stock, criterion, url, nbytes, cached):
+        with self._lock:
+            if url in self._fetched:
+                return
+            self._fetched.add(url)
+        self._write({"event": "fetched", "isin": stock, "url": url})
@@ -0,0 +1,446 @@
+"""Stream a universe of stocks through the stages of an evaluation.
+
+Stages:
+    * ``resolve``: Stock object with urls and ids from the database or the
+      websites
+    * ``fetch``: all pages of the stock, concurrently
+    * ``extract``: values of the pages and stored data that is up to date
+    * ``score``: Levermann criteria
+    * ``persist``: stock, values and points are saved. The yearly data of
+      all stocks that wait in front of the stage is upserted together, in
+      one transaction per ``PERSIST_BATCH`` stocks
+
+Every stage has its own worker threads and reads the stocks from a bounded
+queue. A full queue blocks the stage in front of it, so only a few stocks
+per worker are in the pipeline at any time and the memory doesn't depend on
+the size of the universe. A stock is saved as soon as it is scored and
+dropped afterwards, the first results are in the database after the time of
+a single evaluation.
+
+A stock has ``budget`` seconds for the work of ``resolve`` to ``score``.
+The time it waits in the queues doesn't count, so a congested stage doesn't
+make the stocks in front of it miss their deadlines. Stocks that miss the
+deadline are not saved but streamed through the pipeline again after all
+others, see ``batch.SLOW_RETRIES``.
+
+Functions:
+    * ``stream_universe(isins, stages, per_host, report, parse_workers,
+      journal, budget)``:
+        - generator of BatchResult objects in the order they are finished
+    * ``evaluate_universe(isins, stages, ...)``:
+        - like :func:`stockanalyser.batch.evaluate_universe`
+
+Classes:
+    * ``Pipeline``: the stages and their queues
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+
+from stockanalyser import batch, deadlines, exceptions, instrumentation
+from stockanalyser.analysis.levermann import Levermann
+from stockanalyser.data_source import common, onvista, parsing
+from stockanalyser.database import database_interface
+from stockanalyser.journal import RunJournal
+from stockanalyser.stock import Stock
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("resolve", "fetch", "extract", "score", "persist")
+# worker threads per stage, fetching waits for the websites
+WORKERS = {
+    "resolve": 2,
+    "fetch": 8,
+    "extract": 2,
+    "score": 4,
+    "persist": 1,
+}
+# stocks that wait in front of a stage per worker of the stage
+QUEUE_FACTOR = 2
+# interval in which blocked workers check if the pipeline was stopped
+POLL = 0.1
+# stocks whose yearly data is saved together. Only stocks that are waiting
+# anyway are batched, the queue of the stage holds a batch
+PERSIST_BATCH = 20
+
+_DONE = object()
+
+
+class Item(object):
+    """
+    A stock on its way through the pipeline
+    """
+    __slots__ = ("isin", "stock", "levermann", "result", "start", "budget")
+
+    def __init__(self, isin: str, budget: float = None):
+        self.isin = isin
+        self.stock = None
+        self.levermann = None
+        self.result = None
+        self.start = time.perf_counter()
+        # seconds left for the stages, None = no deadline
+        self.budget = budget
+
+
+def _resolve(item: Item, from_database: bool = True):
+    item.stock = Stock(isin=item.isin, auto_update=False,
+                       from_database=from_database)
+
+
+def _fetch(item: Item):
+    item.stock.fetch()
+
+
+def _extract(item: Item):
+    item.stock.update_stock_info(save=False)
+    item.levermann = Levermann(stock=item.stock, auto_evaluate=False)
+
+
+def _score(item: Item):
+    item.result, _ = item.levermann.evaluate(save=False)
+
+
+def _persist(items: list, save_partial: bool = True) -> dict:
+    """Saves the stocks, the yearly data of all of them with
+    database_interface.save_yearly_batch
+
+    :return: ISIN => error of the stocks that couldn't be saved
+    """
+    errors = {}
+    stocks = []
+    for item in items:
+        if not (item.result.complete or save_partial):
+            continue
+        try:
+            with instrumentation.stock(item.isin):
+                item.levermann.save(item.result, yearly=False)
+        except Exception as e:
+            logger.exception("Persist of {} failed".format(item.isin))
+            errors[item.isin] = repr(e)
+            continue
+        if not item.stock.loaded_from_database:
+            stocks.append(item.stock)
+    if stocks:
+        database_interface.save_yearly_batch(stocks)
+    return errors
+
+
+def parse_stage_workers(text: str) -> dict:
+    """Parses e.g. "fetch=16,score=2" into {"fetch": 16, "score": 2}"""
+    workers = {}
+    for part in text.split(","):
+        name, _, count = part.partition("=")
+        name = name.strip()
+        if name not in STAGES or not count.strip().isdigit():
+            raise ValueError("Expected stage=workers with one of the stages "
+                             "{}: '{}'".format(", ".join(STAGES), part))
+        workers[name] = int(count)
+    return workers
+
+
+class Pipeline(object):
+    """
+    Connects the stages with bounded queues
+
+    :param workers: worker threads of some stages, the others keep the
+        number of ``WORKERS``
+    :param from_database: reuse stored data that is still up to date
+    :param budget: seconds per stock, None = no deadline
+    :param save_partial: save stocks that missed the deadline
+    """
+
+    def __init__(self, workers: dict = None, from_database: bool = True,
+                 budget: float = deadlines.STOCK_BUDGET,
+                 save_partial: bool = True):
+        self.workers = dict(WORKERS)
+        self.workers.update(workers or {})
+        for name, count in self.workers.items():
+            if name not in STAGES:
+                raise ValueError("Unknown stage '{}'".format(name))
+            if count < 1:
+                raise ValueError("Stage '{}' needs at least one worker: "
+                                 "{}".format(name, count))
+        self.functions = {
+            "resolve": functools.partial(_resolve,
+                                         from_database=from_database),
+            "fetch": _fetch,
+            "extract": _extract,
+            "score": _score,
+            # saving isn't part of the budget, a cut off save is worse
+            "persist": functools.partial(_persist,
+                                         save_partial=save_partial),
+        }
+        self.budget = budget
+        self._stopped = threading.Event()
+
+    @property
+    def threads(self) -> int:
+        return sum(self.workers.values())
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        """Blocks while target is full, False if the pipeline was stopped"""
+        while not self._stopped.is_set():
+            try:
+                target.put(item, timeout=POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, source: queue.Queue):
+        while not self._stopped.is_set():
+            try:
+                return source.get(timeout=POLL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _feed(self, isins, target: queue.Queue):
+        try:
+            for isin in isins:
+                if not self._put(target, Item(isin, self.budget)):
+                    return
+        except Exception:
+            logger.exception("Reading the ISINs failed")
+        for _ in range(self.workers[STAGES[0]]):
+            self._put(target, _DONE)
+
+    def _work(self, stage: str, source: queue.Queue, target: queue.Queue,
+              results: queue.Queue, finished):
+        function = self.functions[stage]
+        while True:
+            item = self._get(source)
+            if item is _DONE:
+                break
+            started = time.monotonic()
+            try:
+                # the budget only runs while a stage works on the item
+                with instrumentation.stock(item.isin), \
+                        deadlines.budget(item.budget):
+                    function(item)
+            except exceptions.DeadlineExceededError as e:
+                logger.warning("{} of {} missed the deadline: {}".format(
+                    stage.capitalize(), item.isin, e))
+                self._put(results, batch.BatchResult(
+                    item.isin, error=repr(e), timed_out=True,
+                    duration=time.perf_counter() - item.start))
+                continue
+            except (Exception, SystemExit) as e:
+                # Stock() calls exit() if it can't be created
+                logger.exception("{} of {} failed".format(
+                    stage.capitalize(), item.isin))
+                self._put(results, batch.BatchResult(
+                    item.isin, error=repr(e),
+                    duration=time.perf_counter() - item.start))
+                continue
+            if item.budget is not None:
+                item.budget -= time.monotonic() - started
+            if not self._put(target, item):
+                break
+        finished()
+
+    def _drain(self, source: queue.Queue, limit: int) -> list:
+        """The items that are waiting in source, without blocking"""
+        items = []
+        while len(items) < limit:
+            try:
+                item = source.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                # belongs to another worker or to the next round
+                self._put(source, _DONE)
+                break
+            items.append(item)
+        return items
+
+    def _persist_work(self, source: queue.Queue, results: queue.Queue,
+                      finished):
+        function = self.functions[STAGES[-1]]
+        while True:
+            item = self._get(source)
+            if item is _DONE:
+                break
+            items = [item] + self._drain(source, PERSIST_BATCH - 1)
+            try:
+                errors = function(items)
+            except Exception as e:
+                logger.exception("Persist of {} stocks failed".format(
+                    len(items)))
+                errors = {item.isin: repr(e) for item in items}
+            for item in items:
+                duration = time.perf_counter() - item.start
+                if item.isin in errors:
+                    result = batch.BatchResult(item.isin,
+                                               error=errors[item.isin],
+                                               duration=duration)
+                else:
+                    result = batch.BatchResult(
+                        item.isin, score=item.result.score,
+                        duration=duration, missing=item.result.missing)
+                if not self._put(results, result):
+                    break
+        finished()
+
+    def _finisher(self, stage: str, target: queue.Queue, receivers: int):
+        """Callback for the workers of stage, the last one tells the next
+        stage that no more stocks follow"""
+        remaining = [self.workers[stage]]
+        lock = threading.Lock()
+
+        def finished():
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in range(receivers):
+                    self._put(target, _DONE)
+        return finished
+
+    def run(self, isins):
+        """Evaluates the ISINs, which may be a generator
+
+        :return: generator of BatchResult objects in the order they are
+            finished. Closing it stops the pipeline
+        """
+        self._stopped.clear()
+        queues = [queue.Queue(maxsize=QUEUE_FACTOR * self.workers[stage])
+                  for stage in STAGES[:-1]]
+        queues.append(queue.Queue(maxsize=max(
+            QUEUE_FACTOR * self.workers[STAGES[-1]], PERSIST_BATCH)))
+        results = queue.Queue(maxsize=QUEUE_FACTOR * self.workers[STAGES[-1]])
+        threads = [threading.Thread(target=self._feed, args=(isins, queues[0]),
+                                    name="pipeline-source", daemon=True)]
+        for idx, stage in enumerate(STAGES):
+            last = idx == len(STAGES) - 1
+            target = results if last else queues[idx + 1]
+            receivers = 1 if last else self.workers[STAGES[idx + 1]]
+            finished = self._finisher(stage, target, receivers)
+            for number in range(self.workers[stage]):
+                if last:
+                    work = self._persist_work
+                    args = (queues[idx], results, finished)
+                else:
+                    work = self._work
+                    args = (stage, queues[idx], target, results, finished)
+                threads.append(threading.Thread(
+                    target=work, args=args,
+                    name="pipeline-{}-{}".format(stage, number), daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is _DONE:
+                    break
+                yield result
+        finally:
+            self._stopped.set()
+            for thread in threads:
+                thread.join()
+
+
+def stream_universe(isins, stages: dict = None,
+                    per_host: int = common.MAX_REQUESTS_PER_HOST,
+                    report: instrumentation.RunReport = None,
+                    parse_workers: int = 0, from_database: bool = True,
+                    journal: RunJournal = None,
+                    budget: float = deadlines.STOCK_BUDGET):
+    """Evaluates the ISINs in a Pipeline
+
+    Stocks that missed their deadline are evaluated again in another pass
+    after all others, the last pass saves what they have.
+
+    :param isins: ISINs, a list or a generator
+    :param stages: worker threads per stage, e.g. {"fetch": 16}
+    :param per_host: maximum number of parallel requests per website
+    :param report: RunReport that collects the events of the run
+    :param parse_workers: processes that parse the pages, 0 parses them in
+        the fetch workers
+    :param journal: RunJournal, stocks that it has as done are skipped
+    :param budget: seconds per stock, None = no deadline
+    :return: generator of BatchResult objects in the order they are
+        finished, skipped stocks are not part of it
+    """
+    pipeline = Pipeline(stages, from_database=from_database, budget=budget,
+                        save_partial=not batch.SLOW_RETRIES)
+    common.set_host_limit(per_host)
+    database_interface.configure(max_connections=pipeline.threads)
+    logger.info("Streaming stocks through {} ({} requests per host)".format(
+        ", ".join("{} x{}".format(stage, pipeline.workers[stage])
+                  for stage in STAGES), per_host))
+    if report is not None:
+        instrumentation.add_hook(report)
+    if journal is not None:
+        journal.open()
+        isins = journal.pending(isins)
+        instrumentation.add_hook(journal)
+    if parse_workers:
+        parsing.set_workers(parse_workers)
+    try:
+        onvista.warm_up_benchmarks()
+        for attempt in range(batch.SLOW_RETRIES + 1):
+            slow = []
+            for result in pipeline.run(isins):
+                if result.timed_out and attempt < batch.SLOW_RETRIES:
+                    slow.append(result.isin)
+                    continue
+                if journal is not None:
+                    journal.record(result.isin, result.score, result.error)
+                yield result
+            if not slow:
+                break
+            logger.warning("Retrying {} stocks that missed their "
+                           "deadline".format(len(slow)))
+            isins = slow
+            pipeline = Pipeline(
+                stages, from_database=from_database, budget=budget,
+                save_partial=attempt + 1 >= batch.SLOW_RETRIES)
+    finally:
+        if parse_workers:
+            parsing.shutdown()
+        if journal is not None:
+            instrumentation.remove_hook(journal)
+            journal.close()
+        if report is not None:
+            instrumentation.remove_hook(report)
+            report.finish()
+
+
+def evaluate_universe(isins, stages: dict = None,
+                      per_host: int = common.MAX_REQUESTS_PER_HOST,
+                      memory_budget: int = None,
+                      report: instrumentation.RunReport = None,
+                      parse_workers: int = 0,
+                      journal: RunJournal = None,
+                      budget: float = deadlines.STOCK_BUDGET) -> list:
+    """Streams the ISINs through a Pipeline and logs every result
+
+    :return: list of BatchResult objects in the order they are finished
+    """
+    start = time.perf_counter()
+    monitor = batch.MemoryMonitor(memory_budget) if memory_budget else None
+    results = []
+    for result in stream_universe(isins, stages, per_host, report,
+                                  parse_workers, journal=journal,
+                                  budget=budget):
+        results.append(result)
+        log = logger.warning if result.failed or result.timed_out \
+            else logger.info
+        log("{} {}".format(len(results), result))
+        if monitor is not None:
+            monitor.sample()
+
+    failed = [r for r in results if r.failed]
+    logger.info("Finished {} stocks in {:.1f}s, {} failed".format(
+        len(results), time.perf_counter() - start, len(failed)))
+    for result in failed:
+        logger.warning(str(result))
+    if monitor is not None:
+        log = logger.info if monitor.flat else logger.warning
+        log(str(monitor))
+    if report is not None:
+        logger.info(str(report))
+    return results
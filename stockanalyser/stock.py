@@ -10,26 +10,45 @@ Classes:
 .. _Cap: stockanalyser.html#stockanalyser.stock.Cap
 
 """
+import asyncio
 import datetime
-import json
 import logging
 import pickle
 from enum import Enum, unique
 
-from stockanalyser import fileutils
 from stockanalyser.config import *
+from stockanalyser.data_source import common, symbol_index
 from stockanalyser.data_source.finanzen_net import FinanzenNetScraper
 from stockanalyser.data_source.marketscreener import MarketScreenerScraper
 from stockanalyser.data_source.onvista import OnvistaScraper
 from stockanalyser.database import database_interface
+from stockanalyser.exceptions import DeadlineExceededError
 
 logger = logging.getLogger(__name__)
 
 
+ANALYST_DATA_MAX_AGE = datetime.timedelta(days=7)
+
+
 def _save(stock):
     database_interface.save_information(stock)
 
 
+def _to_float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def _stored_quarterly_dates(yearly: dict) -> list:
+    dates = []
+    for row in yearly.values():
+        for quarter in (row.q1, row.q2, row.q3, row.q4):
+            if isinstance(quarter, datetime.datetime):
+                dates.append(quarter.date())
+    return sorted(dates)
+
+
 @unique
 class Cap(Enum):
     """
@@ -54,19 +73,25 @@ class Stock(object):
         - MarketscreenerScraper
 
     Functions:
+        * ``fetch(self)``:
+            - downloads the pages of all scrapers
         * ``update_stock_info(self)``:
             - gets data from Websites
         * ``save(self)``:
             - saves itself to the database
     """
 
-    def __init__(self, isin=None, name=None, auto_update=True):
+    def __init__(self, isin=None, name=None, auto_update=True,
+                 from_database=False):
         """Constructor of the Stock Class
 
             :param isin: (str): ISIN of specific stock.
                 Should be used primarily.
 
             :param name: (str): Name of Stock. Can be used to find ISIN.
+
+            :param from_database: (bool): Use stored data that is still
+                up to date instead of scraping it, see update_stock_info
      """
         logging.info("Initializing {}".format(type(self).__name__))
         if not (isin or name):
@@ -76,6 +101,14 @@ class Stock(object):
         self.name = name
         self.ISIN = isin
         self.exchange = None
+        self.loaded_from_database = False
+        # the quarterly figure dates of a stock that was loaded from the
+        # database were scraped again and have to be saved
+        self.scraped_quarterly_dates = False
+        self._stored = None
+        self._fetched = False
+        # fields whose website missed the deadline, field => reason
+        self.missing = {}
         stock_data = self.__set_isin_urls_symb(
             isin=isin,
             name=name
@@ -83,9 +116,14 @@ class Stock(object):
         if not self.name:
             self.name = stock_data['name']
 
+        if from_database and not self.save_information:
+            self._stored = database_interface.load_stock_data(
+                stock_data['isin'])
+
         self.OS = OnvistaScraper(
             url=stock_data['onvista_url'],
-            isin=stock_data['isin']
+            isin=stock_data['isin'],
+            prefetch_fundamentals=self._stored is None
         )
 
         self.FNS = FinanzenNetScraper(
@@ -103,21 +141,167 @@ class Stock(object):
 
         """ Call update_stock_info automatically """
         if auto_update:
-            self.cap_type = self._set_market_cap(self.OS.market_cap)
-            self.quote = self.OS.previous_close
-            self.currency = "EUR"
-            self.benchmark = self.FNS.benchmark
-
-            self.roe = self.OS.roe
-            self.ebit_margin = self.OS.ebit_margin
-            self.equity_ratio = self.OS.equity_ratio
-            self.eps = self.OS.eps
-            self.per = self.OS.per
-            self.quarterly_figure_dates = self.FNS.quarterly_figure_dates
-            self.consensus_ratings = self.MSS.consensus_data
-            self.eval_earning_revision_cy, self.eval_earning_revision_ny = self.MSS.revisions
+            self.update_stock_info()
+
+    def update_stock_info(self, save=True):
+        """Gets all data of the stock.
+
+        If the stock was created with ``from_database`` only stale data is
+        scraped:
+            * yearly figures: stale if quarterly figures were released
+              after the last evaluation
+            * quarterly figure dates: stale if no future date is stored
+            * analyst ratings and revisions: stale after ANALYST_DATA_MAX_AGE
+
+        Quote and market cap are always taken from the website.
+
+        If a website misses the deadline (see :mod:`stockanalyser.deadlines`)
+        its fields stay None, the yearly figures of onvista empty, and are
+        kept in ``missing``, the criteria that need them are left out.
+        Without quote and market cap the stock can't be evaluated at all.
+
+        :param save: False skips saving the stock, see save()
+        """
+        # the scrapers fetch what is missing on access
+        self._scrape("pages", self.fetch)
+        self.cap_type = self._set_market_cap(self.OS.market_cap)
+        self.quote = self.OS.previous_close
+        self.currency = "EUR"
+
+        if self._stored is not None and self._hydrate(self._stored):
+            self.loaded_from_database = True
+            return
+
+        if self._stored is None:
+            self.benchmark = self._scrape(
+                "benchmark", lambda: self.FNS.benchmark)
+            self.quarterly_figure_dates = self._scrape(
+                "quarterly_figure_dates",
+                lambda: self.FNS.quarterly_figure_dates)
+            self.consensus_ratings = self._scrape(
+                "consensus_ratings", lambda: self.MSS.consensus_data)
+            self.eval_earning_revision_cy, self.eval_earning_revision_ny = \
+                self._scrape("eval_earning_revision",
+                             lambda: self.MSS.revisions, (None, None))
+        self.roe = self._scrape("roe", lambda: self.OS.roe, {})
+        self.ebit_margin = self._scrape(
+            "ebit_margin", lambda: self.OS.ebit_margin, {})
+        self.equity_ratio = self._scrape(
+            "equity_ratio", lambda: self.OS.equity_ratio, {})
+        self.eps = self._scrape("eps", lambda: self.OS.eps, {})
+        self.per = self._scrape("per", lambda: self.OS.per, {})
+        if save:
             self.save()
 
+    def _scrape(self, field: str, scrape, default=None):
+        """Returns ``scrape()``, ``default`` if its website missed the
+        deadline"""
+        try:
+            return scrape()
+        except DeadlineExceededError as e:
+            logger.warning("{} of {} missed the deadline: {}".format(
+                field, self.ISIN, e))
+            self.missing[field] = str(e)
+            return default
+
+    def _hydrate(self, stored: dict) -> bool:
+        """Fills the stock with stored data and scrapes only stale data
+
+        :return: True if the yearly figures were up to date, otherwise they
+            have to be scraped
+        """
+        information = stored['information']
+        yearly = stored['yearly']
+        values = stored['values']
+        today = datetime.date.today()
+        last_evaluation = values.datum.date() if values else None
+
+        self.benchmark = information['benchmark'] or self._scrape(
+            "benchmark", lambda: self.FNS.benchmark)
+
+        stored_dates = _stored_quarterly_dates(yearly)
+        quarterly_figure_dates = stored_dates
+        if not any(d > today for d in stored_dates):
+            logger.debug("No upcoming quarterly figures release stored")
+            # the stored dates are better than none
+            quarterly_figure_dates = self._scrape(
+                "quarterly_figure_dates",
+                lambda: self.FNS.quarterly_figure_dates, stored_dates)
+            self.scraped_quarterly_dates = \
+                quarterly_figure_dates != stored_dates
+        self.quarterly_figure_dates = quarterly_figure_dates
+
+        analyst_data_current = values is not None \
+            and last_evaluation >= today - ANALYST_DATA_MAX_AGE
+        if analyst_data_current and values.analyst_bewertung is not None:
+            self.consensus_ratings = {
+                "consensus": float(values.analyst_bewertung),
+                "n_analysts": values.analysten_anzahl,
+                "price_target_average": _to_float(values.kurs_ziel),
+            }
+        else:
+            self.consensus_ratings = self._scrape(
+                "consensus_ratings", lambda: self.MSS.consensus_data)
+
+        if analyst_data_current and values.gewinn_veraenderung is not None \
+                and values.gewinn_veraenderung_nj is not None:
+            self.eval_earning_revision_cy = {
+                "Change current Year": float(values.gewinn_veraenderung)}
+            self.eval_earning_revision_ny = {
+                "Change next Year": float(values.gewinn_veraenderung_nj)}
+        else:
+            self.eval_earning_revision_cy, self.eval_earning_revision_ny = \
+                self._scrape("eval_earning_revision",
+                             lambda: self.MSS.revisions, (None, None))
+
+        released = [d for d in quarterly_figure_dates if d <= today]
+        this_year = yearly.get(today.year)
+        if last_evaluation is None or not released \
+                or last_evaluation <= released[-1] \
+                or this_year is None or this_year.eps is None \
+                or this_year.kgv is None:
+            logger.info("Stored yearly figures of {} are outdated".format(
+                self.name))
+            return False
+
+        self.roe = {year: _to_float(row.return_on_equity)
+                    for year, row in yearly.items()}
+        self.ebit_margin = {year: _to_float(row.ebit)
+                            for year, row in yearly.items()}
+        self.equity_ratio = {year: _to_float(row.eigenkapitalquote)
+                             for year, row in yearly.items()}
+        self.eps = {year: _to_float(row.eps) for year, row in yearly.items()}
+        self.per = {year: _to_float(row.kgv) for year, row in yearly.items()}
+        logger.info("Loaded yearly figures of {} from database".format(
+            self.name))
+        return True
+
+    def fetch(self):
+        """Downloads the pages of all scrapers concurrently
+
+        Called by update_stock_info. Calling it before separates the
+        downloads from the extraction, e.g. in a pipeline. A stock that is
+        loaded from the database fetches its stale data on access.
+        """
+        if self._stored is None and not self._fetched:
+            common.run_async(self._fetch_async())
+            self._fetched = True
+
+    async def _fetch_async(self):
+        """Lets all scrapers fetch their pages concurrently.
+
+        Failed requests are only logged, the properties of the scrapers
+        try again when they are accessed.
+        """
+        fetcher = common.AsyncFetcher()
+        results = await asyncio.gather(self.OS.fetch_async(fetcher),
+                                       self.FNS.fetch_async(fetcher),
+                                       self.MSS.fetch_async(fetcher),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Prefetching failed: {}".format(result))
+
     def __set_isin_urls_symb(self, isin=None, name=None):
         data = self.__get_isin_urls_symb_from_database(isin=isin, name=name)
         if data is None:
@@ -168,16 +352,14 @@ class Stock(object):
     def _get_symbol_local(self, name):
         country = self.ISIN[:2]
         region = {"DE": "de", "US": "us", "NL": "de", "LU": "de"}[country]
-        dir_path = 'data/symbol_json/{}.json'.format(region)
-        with open(dir_path) as symbols:
-            symbols = json.loads(symbols.read())
-            for element, symbol in symbols.items():
-                name = name.replace("-", " ").lower()
-                if name in element.lower():
-                    self.name = element
-                    return symbol
+        match = symbol_index.lookup(region, name)
+        if match is not None:
+            self.name, symbol = match
+            return symbol
 
     def last_quarterly_figures_release_date(self):
+        if self.quarterly_figure_dates is None:
+            return None
         today = datetime.date.today()
         for d in reversed(self.quarterly_figure_dates):
             if d <= today:
@@ -189,6 +371,8 @@ class Stock(object):
         return None
 
     def _is_quarterly_figures_release_date_outdated(self):
+        if not self.quarterly_figure_dates:
+            return True
         if self.quarterly_figure_dates[-1] <= (
                 datetime.date.today() - datetime.timedelta(days=60)):
             return True
@@ -232,14 +416,22 @@ class Stock(object):
         else:
             return Cap.SMALL
 
-    def save(self):
+    def save(self, yearly: bool = True):
         """Saves Stock-Object to local database.
 
+        :param yearly: False leaves the yearly data to the caller, e.g. to
+            database_interface.save_yearly_batch. Quarterly figure dates
+            that were scraped for a stock loaded from the database are
+            saved anyway
         :return: Nothing
         """
         if self.save_information:
             database_interface.save_information(self)
-        database_interface.save_yearly(self)
+        if self.loaded_from_database:
+            if self.scraped_quarterly_dates:
+                database_interface.save_quarterly_dates(self)
+        elif yearly:
+            database_interface.save_yearly(self)
 
     def __str__(self) -> str:
         string = "{:<35} {:<25}\n".format("Name:", self.name)
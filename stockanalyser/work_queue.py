@@ -0,0 +1,496 @@
+"""
+work_queue.py
+
+Lets several worker processes split one universe.
+
+The ISINs of a universe are added to a queue, every worker claims one ISIN
+after the other with a lease and evaluates it like a batch run, the
+results are saved through ``database_interface``. While a stock is
+evaluated a heartbeat renews its lease. If a worker dies its leases run out
+and other workers claim the ISINs again, a worker that lost a lease can't
+complete or fail the ISIN of its successor anymore.
+
+States of an ISIN:
+    * ``pending``: waits for a worker
+    * ``leased``: a worker evaluates it until ``lease_until``
+    * ``done``: evaluated and saved
+    * ``failed``: all ``max_attempts`` claims failed
+
+A failed attempt makes the ISIN pending again after ``RETRY_DELAY`` times
+the number of attempts. A stock that misses its deadline (see
+:mod:`stockanalyser.deadlines`) is retried like a failed one instead of
+blocking a thread, only its last attempt saves the partial result.
+Adding a done or failed ISIN queues it again, e.g. for the next daily
+evaluation.
+
+Workers of all processes also share one rate limit per website, so adding
+workers raises the throughput until the websites' limits are reached.
+
+Classes:
+    * ``WorkQueue``: interface of the queue backends
+    * ``SQLiteWorkQueue``: queue in a SQLite file for the workers of a host
+    * ``SQLiteRateLimiter``: token bucket per website in a SQLite file
+    * ``Worker``: claims and evaluates ISINs with threads
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from stockanalyser import batch, deadlines
+from stockanalyser.config import WORK_QUEUE_PATH
+from stockanalyser.data_source import common, onvista, sessions
+from stockanalyser.database import database_interface
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, LEASED, DONE, FAILED)
+
+# seconds a claimed ISIN belongs to a worker without a heartbeat
+LEASE = 300
+MAX_ATTEMPTS = 3
+# seconds until a failed ISIN is claimed again, times the attempts
+RETRY_DELAY = 60
+# seconds between the claims of an idle worker
+POLL = 5
+# seconds until a claim is tried again after a locked or busy queue,
+# doubled per failed claim up to POLL
+CLAIM_BACKOFF = 0.5
+
+
+class Task(object):
+    """
+    An ISIN that was claimed by a worker
+    """
+    __slots__ = ("isin", "attempt")
+
+    def __init__(self, isin: str, attempt: int):
+        self.isin = isin
+        self.attempt = attempt
+
+
+class WorkQueue(object):
+    """
+    Interface of the queue backends. All methods are called from many
+    threads of many processes
+    """
+    max_attempts = MAX_ATTEMPTS
+
+    def add(self, isins) -> int:
+        """Queues the ISINs, returns the number of ISINs that are new or
+        queued again"""
+        raise NotImplementedError
+
+    def claim(self, worker: str, lease: float = LEASE):
+        """The next pending ISIN as Task, None if there is none"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker: str, isins: list,
+                  lease: float = LEASE) -> int:
+        """Renews the leases, returns the number of renewed leases"""
+        raise NotImplementedError
+
+    def complete(self, worker: str, isin: str, score: int) -> bool:
+        """Marks the ISIN as done, False if worker lost its lease"""
+        raise NotImplementedError
+
+    def fail(self, worker: str, isin: str, error: str) -> bool:
+        """Retries or fails the ISIN, False if worker lost its lease"""
+        raise NotImplementedError
+
+    def counts(self) -> dict:
+        """Number of ISINs per state"""
+        raise NotImplementedError
+
+    def failures(self) -> dict:
+        """ISIN => error of the failed ISINs"""
+        raise NotImplementedError
+
+    def remaining(self) -> int:
+        counts = self.counts()
+        return counts[PENDING] + counts[LEASED]
+
+
+class _SQLiteFile(object):
+    """
+    One connection per thread to a SQLite file, SQLite handles the locking
+    between threads and processes
+    """
+    SCHEMA = ()
+
+    def __init__(self, path: str = WORK_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # transactions are started explicitly, see _transaction
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Holds the write lock from the first read on, so no other process
+        can claim the same row in between"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+class SQLiteWorkQueue(_SQLiteFile, WorkQueue):
+    """
+    Work queue in a SQLite file that all workers of a host open
+
+    :param max_attempts: claims of an ISIN until it is failed
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tasks ("
+        "isin TEXT PRIMARY KEY, "
+        "state TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "worker TEXT, "
+        "lease_until REAL, "
+        "available_at REAL NOT NULL DEFAULT 0, "
+        "score INTEGER, "
+        "error TEXT, "
+        "updated REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS tasks_state "
+        "ON tasks (state, available_at)",
+    )
+
+    def __init__(self, path: str = WORK_QUEUE_PATH,
+                 max_attempts: int = MAX_ATTEMPTS):
+        super().__init__(path)
+        self.max_attempts = max_attempts
+
+    def add(self, isins) -> int:
+        now = time.time()
+        queued = 0
+        with self._transaction() as connection:
+            for isin in isins:
+                cursor = connection.execute(
+                    "INSERT INTO tasks (isin, state, updated) "
+                    "VALUES (?, ?, ?) "
+                    "ON CONFLICT (isin) DO UPDATE SET state = excluded.state, "
+                    "attempts = 0, available_at = 0, error = NULL, "
+                    "updated = excluded.updated WHERE state IN (?, ?)",
+                    (isin, PENDING, now, DONE, FAILED))
+                queued += cursor.rowcount
+        return queued
+
+    def claim(self, worker: str, lease: float = LEASE):
+        now = time.time()
+        with self._transaction() as connection:
+            # leases of dead workers on their last attempt
+            connection.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, "
+                "lease_until = NULL, error = ?, updated = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "Lease expired", now, LEASED, now,
+                 self.max_attempts))
+            row = connection.execute(
+                "SELECT isin, attempts FROM tasks "
+                "WHERE (state = ? AND available_at <= ?) "
+                "OR (state = ? AND lease_until < ?) "
+                "ORDER BY attempts, rowid LIMIT 1",
+                (PENDING, now, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            isin, attempts = row
+            connection.execute(
+                "UPDATE tasks SET state = ?, attempts = ?, worker = ?, "
+                "lease_until = ?, updated = ? WHERE isin = ?",
+                (LEASED, attempts + 1, worker, now + lease, now, isin))
+        return Task(isin, attempts + 1)
+
+    def heartbeat(self, worker: str, isins: list,
+                  lease: float = LEASE) -> int:
+        if not isins:
+            return 0
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET lease_until = ?, updated = ? "
+                "WHERE worker = ? AND state = ? AND isin IN ({})".format(
+                    ", ".join("?" * len(isins))),
+                [now + lease, now, worker, LEASED] + list(isins))
+        return cursor.rowcount
+
+    def complete(self, worker: str, isin: str, score: int) -> bool:
+        with self._transaction() as connection:
+            # another worker may have taken over after the lease expired
+            cursor = connection.execute(
+                "UPDATE tasks SET state = ?, score = ?, error = NULL, "
+                "worker = NULL, lease_until = NULL, updated = ? "
+                "WHERE isin = ? AND worker = ? AND state = ?",
+                (DONE, score, time.time(), isin, worker, LEASED))
+        return cursor.rowcount > 0
+
+    def fail(self, worker: str, isin: str, error: str) -> bool:
+        now = time.time()
+        with self._transaction() as connection:
+            # another worker may have taken over after the lease expired
+            cursor = connection.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? "
+                "ELSE ? END, available_at = ? + ? * attempts, error = ?, "
+                "worker = NULL, lease_until = NULL, updated = ? "
+                "WHERE isin = ? AND worker = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, now, RETRY_DELAY,
+                 error, now, isin, worker, LEASED))
+        return cursor.rowcount > 0
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self._connection().execute(
+            "SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        return counts
+
+    def failures(self) -> dict:
+        return dict(self._connection().execute(
+            "SELECT isin, error FROM tasks WHERE state = ? ORDER BY isin",
+            (FAILED,)).fetchall())
+
+
+class SQLiteRateLimiter(_SQLiteFile):
+    """
+    Token bucket per website that all workers of a host share, see
+    ``sessions.set_shared_limiter``
+
+    :param rates: requests per second of all workers together per host,
+        default: ``sessions.HOST_RATES``
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rate_limits ("
+        "host TEXT PRIMARY KEY, "
+        "tokens REAL NOT NULL, "
+        "updated REAL NOT NULL, "
+        "paused_until REAL NOT NULL DEFAULT 0)",
+    )
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, rates: dict = None):
+        super().__init__(path)
+        self.rates = dict(sessions.HOST_RATES if rates is None else rates)
+
+    def _rate(self, host: str) -> float:
+        return self.rates.get(host, sessions.DEFAULT_RATE)
+
+    def _take(self, host: str) -> float:
+        """Takes a token, returns 0 or the seconds to wait for one"""
+        rate = self._rate(host)
+        burst = max(1.0, rate)
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT tokens, updated, paused_until FROM rate_limits "
+                "WHERE host = ?", (host,)).fetchone()
+            tokens, updated, paused_until = row or (burst, now, 0.0)
+            if now > updated:
+                tokens = min(burst, tokens + (now - updated) * rate)
+                updated = now
+            if paused_until > now:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limits "
+                "(host, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (host, tokens, updated, paused_until))
+        return wait
+
+    def acquire(self, host: str):
+        """Blocks until all workers together may send a request to host"""
+        while True:
+            wait = self._take(host)
+            if wait <= 0:
+                return
+            deadlines.check_wait(wait, "the rate limit of {}".format(host))
+            time.sleep(wait)
+
+    def throttle(self, host: str, pause: float):
+        """Pauses the host for all workers"""
+        now = time.time()
+        until = now + min(pause, sessions.MAX_PAUSE)
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO rate_limits (host, tokens, updated, "
+                "paused_until) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT (host) DO UPDATE SET tokens = 0, "
+                "updated = MAX(updated, excluded.paused_until), "
+                "paused_until = MAX(paused_until, excluded.paused_until)",
+                (host, until, until))
+
+
+def default_worker_name() -> str:
+    return "{}-{}".format(socket.gethostname(), os.getpid())
+
+
+class Worker(object):
+    """
+    Claims ISINs of a queue and evaluates them in ``threads`` threads
+
+    :param limiter: shared rate limiter, e.g. SQLiteRateLimiter
+    :param lease: seconds of a lease, the heartbeat renews the leases three
+        times per lease
+    :param budget: seconds per stock, None = no deadline
+    """
+
+    def __init__(self, queue: WorkQueue, limiter=None,
+                 threads: int = batch.WORKERS, lease: float = LEASE,
+                 name: str = None, from_database: bool = True,
+                 budget: float = deadlines.STOCK_BUDGET):
+        self.queue = queue
+        self.limiter = limiter
+        self.threads = threads
+        self.lease = lease
+        self.name = name or default_worker_name()
+        self.from_database = from_database
+        self.budget = budget
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.results = []
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.lease / 3):
+            with self._active_lock:
+                isins = list(self._active)
+            try:
+                renewed = self.queue.heartbeat(self.name, isins, self.lease)
+            except sqlite3.Error as e:
+                logger.warning("Heartbeat failed: {}".format(e))
+                continue
+            if renewed < len(isins):
+                logger.warning("{} of {} leases were lost".format(
+                    len(isins) - renewed, len(isins)))
+
+    def _claim(self):
+        """The next Task, retries while the queue is locked or busy"""
+        backoff = CLAIM_BACKOFF
+        while not self._stopped.is_set():
+            try:
+                return self.queue.claim(self.name, self.lease)
+            except sqlite3.OperationalError as e:
+                logger.warning("Claim failed, retrying in {:.1f}s: {}".format(
+                    backoff, e))
+            self._stopped.wait(backoff)
+            backoff = min(POLL, backoff * 2)
+        return None
+
+    def _remaining(self) -> int:
+        try:
+            return self.queue.remaining()
+        except sqlite3.OperationalError as e:
+            logger.warning("Counting the remaining ISINs failed: {}".format(e))
+            # claimed again after POLL
+            return 1
+
+    def _finish(self, task: Task, result: batch.BatchResult, last: bool):
+        """Stores the result in the queue"""
+        try:
+            if result.failed:
+                stored = self.queue.fail(self.name, task.isin, result.error)
+            elif result.timed_out and not last:
+                # retried later, the partial result was not saved
+                stored = self.queue.fail(
+                    self.name, task.isin,
+                    "Missed the deadline without: {}".format(
+                        ", ".join(result.missing)))
+            else:
+                stored = self.queue.complete(self.name, task.isin,
+                                             result.score)
+        except sqlite3.OperationalError as e:
+            # the lease runs out and the ISIN is claimed again
+            logger.warning("Storing the result of {} failed: {}".format(
+                task.isin, e))
+            return
+        if not stored:
+            logger.warning("{} lost the lease of {}, another worker "
+                           "evaluates it".format(self.name, task.isin))
+
+    def _work(self):
+        while not self._stopped.is_set():
+            task = self._claim()
+            if task is None:
+                if self._stopped.is_set() or not self._remaining():
+                    return
+                # other workers hold the remaining leases or they wait for
+                # their retry
+                self._stopped.wait(POLL)
+                continue
+            with self._active_lock:
+                self._active.add(task.isin)
+            last = task.attempt >= self.queue.max_attempts
+            try:
+                result = batch.evaluate_isin(task.isin, self.from_database,
+                                             self.budget, save_partial=last)
+            finally:
+                with self._active_lock:
+                    self._active.discard(task.isin)
+            self._finish(task, result, last)
+            self.results.append(result)
+            log = logger.warning if result.failed or result.timed_out \
+                else logger.info
+            log("{} (attempt {}) {}".format(self.name, task.attempt, result))
+
+    def run(self, per_host: int = common.MAX_REQUESTS_PER_HOST) -> list:
+        """Works until the queue is empty
+
+        :return: BatchResult objects of the ISINs of this worker
+        """
+        start = time.perf_counter()
+        common.set_host_limit(per_host)
+        database_interface.configure(max_connections=self.threads)
+        if self.limiter is not None:
+            sessions.set_shared_limiter(self.limiter)
+        self._stopped.clear()
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     name="work-queue-heartbeat", daemon=True)
+        threads = [threading.Thread(target=self._work,
+                                    name="work-queue-{}".format(number))
+                   for number in range(self.threads)]
+        logger.info("Worker {} starts with {} threads".format(self.name,
+                                                              self.threads))
+        try:
+            onvista.warm_up_benchmarks()
+            heartbeat.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self._stopped.set()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+            if self.limiter is not None:
+                sessions.set_shared_limiter(None)
+        logger.info(
+            "Worker {} finished {} stocks in {:.1f}s, {} failed".format(
+                self.name, len(self.results), time.perf_counter() - start,
+                sum(r.failed for r in self.results)))
+        return self.results
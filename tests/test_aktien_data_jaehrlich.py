@@ -0,0 +1,75 @@
+"""Tests of the yearly upsert in stockanalyser.database.aktien_data_jaehrlich"""
+import datetime
+import os
+
+import pytest
+
+from stockanalyser.database import aktien_data_jaehrlich, database_interface
+from stockanalyser.database.aktien_data_jaehrlich import AktienJaehrlicheDaten
+from stockanalyser.database.models import AktienInformation, database
+from stockanalyser.exceptions import DatabaseSchemaError
+from stockanalyser.stock import Stock
+
+
+@pytest.fixture
+def aktie_id(tmp_path):
+    database_interface.configure(
+        "sqlite:///{}".format(os.path.join(str(tmp_path), "test.db")))
+    database_interface.create_tables()
+    return AktienInformation.insert(isin="DE0000000001",
+                                    name="Test AG").execute()
+
+
+def _row(aktie_id: int, q1=None, eps=1.0) -> dict:
+    return {"aktie": aktie_id, "jahr": 2020, "q1": q1, "q2": None,
+            "q3": None, "q4": None, "eps": eps, "ebit": None, "kgv": None,
+            "eigenkapitalquote": None, "return_on_equity": None}
+
+
+def test_upsert_updates_the_row_of_a_year(aktie_id):
+    q1 = datetime.datetime(2020, 5, 5)
+    aktien_data_jaehrlich.rows_upsert([_row(aktie_id, q1=q1)])
+    aktien_data_jaehrlich.rows_upsert([_row(aktie_id, eps=2.0)])
+    rows = list(AktienJaehrlicheDaten.select())
+    assert len(rows) == 1
+    assert float(rows[0].eps) == 2.0
+    # an unknown date doesn't overwrite the stored one
+    assert rows[0].q1 == q1
+
+
+def test_upsert_without_unique_key_fails(aktie_id):
+    for index in database.get_indexes("aktien_jaehrliche_daten"):
+        if index.unique:
+            database.execute_sql("DROP INDEX {}".format(index.name))
+    database_interface.configure()
+    with pytest.raises(DatabaseSchemaError):
+        aktien_data_jaehrlich.rows_upsert([_row(aktie_id)])
+    assert AktienJaehrlicheDaten.select().count() == 0
+
+
+def _loaded_stock(quarterly_figure_dates: list) -> Stock:
+    """A stock whose yearly figures were loaded from the database"""
+    stock = Stock.__new__(Stock)
+    stock.ISIN = "DE0000000001"
+    stock.save_information = False
+    stock.loaded_from_database = True
+    stock.scraped_quarterly_dates = True
+    stock.quarterly_figure_dates = quarterly_figure_dates
+    return stock
+
+
+def test_scraped_quarterly_dates_of_a_loaded_stock_are_saved(aktie_id):
+    q1 = datetime.datetime(2020, 5, 5)
+    aktien_data_jaehrlich.rows_upsert([_row(aktie_id, q1=q1)])
+    stock = _loaded_stock([datetime.date(2020, 8, 6),
+                           datetime.date(2020, 11, 5),
+                           datetime.date(2021, 3, 18)])
+    stock.save(yearly=False)
+
+    rows = list(AktienJaehrlicheDaten.select())
+    # no year is added, the figures and the date of Q1 are kept
+    assert len(rows) == 1
+    assert float(rows[0].eps) == 1.0
+    assert rows[0].q1 == q1
+    assert rows[0].q3 == datetime.datetime(2020, 8, 6)
+    assert rows[0].q4 == datetime.datetime(2020, 11, 5)
@@ -0,0 +1,66 @@
+"""Tests of resuming a batch run with stockanalyser.journal"""
+import json
+import os
+import time
+
+import pytest
+
+from stockanalyser import journal
+from stockanalyser.data_source import cache
+
+RECENT = "https://www.onvista.de/aktien/recent"
+OLD = "https://www.onvista.de/aktien/old"
+
+
+@pytest.fixture
+def path(tmp_path):
+    now = time.time()
+    events = [
+        {"event": "start", "pid": 1, "time": now - 60},
+        {"event": "fetched", "isin": "A", "url": RECENT, "time": now - 50},
+        {"event": "fetched", "isin": "A", "url": OLD,
+         "time": now - journal.MAX_AGE - 60},
+        {"event": "failed", "isin": "A", "error": "timeout"},
+        {"event": "done", "isin": "A", "score": 4},
+        {"event": "failed", "isin": "B", "error": "timeout"},
+        {"event": "done", "isin": "C", "score": -2},
+    ]
+    path = os.path.join(str(tmp_path), "journal.jsonl")
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+        # cut off by a crash
+        f.write('{"event": "done", "isin": "D", "sco')
+    yield path
+    cache.unpin()
+
+
+def test_resume_skips_done_isins_and_pins_recent_pages(path):
+    with journal.RunJournal(path) as run:
+        assert run.scores == {"A": 4, "C": -2}
+        assert run.failed == {"B": "timeout"}
+        assert list(run.pending(iter(["A", "B", "C", "D"]))) == ["B", "D"]
+        assert RECENT in cache._pinned
+        assert "HEAD " + RECENT in cache._pinned
+        assert OLD not in cache._pinned
+    assert not cache._pinned
+
+
+def test_events_after_a_cut_off_line_are_read(path):
+    with journal.RunJournal(path) as run:
+        run.record("D", score=7)
+        run.record("B", error="parse error")
+    with journal.RunJournal(path) as run:
+        assert run.scores == {"A": 4, "C": -2, "D": 7}
+        assert run.failed == {"B": "parse error"}
+        assert list(run.pending(["A", "B", "C", "D"])) == ["B"]
+
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line)["event"])
+            except ValueError:
+                pass
+    # the start events are not swallowed by the cut off line
+    assert events.count("start") == 3
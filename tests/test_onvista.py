@@ -0,0 +1,114 @@
+"""Tests of stockanalyser.data_source.onvista"""
+import datetime
+import threading
+import time
+
+import pytest
+from lxml import html
+
+from stockanalyser import deadlines
+from stockanalyser.data_source import onvista
+from stockanalyser.data_source.onvista import _normalize_number
+from stockanalyser.data_source.timeseries import PriceSeries
+from stockanalyser.exceptions import DeadlineExceededError
+
+PAGE = """
+<html><body><div id="ONVISTA"><div><div><div><article><article><div>
+<table>
+  <thead><tr><th>Gewinn</th><th>2020e</th><th>2019</th></tr></thead>
+  <tbody>
+    <tr><td>KGV</td><td>12,5</td><td>14,1</td></tr>
+    <tr><td>Gewinn je Aktie, verwässert</td><td>1,20</td><td>-</td></tr>
+  </tbody>
+</table>
+</div></article></article></div></div></div></div></body></html>
+"""
+
+
+def test_normalize_number():
+    assert _normalize_number("-1.234,56%") == -1234.56
+    assert _normalize_number("ca. 1,5 mrd") == 1.5
+    assert _normalize_number("-") is None
+    assert _normalize_number("  ") == "CONTINUE"
+    assert _normalize_number("KGV") == "kgv"
+
+
+def test_normalize_number_comma_in_text():
+    assert _normalize_number("Gewinn je Aktie, verwässert") == \
+        "gewinn je aktie, verwässert"
+    assert _normalize_number("a, b, c") == "a, b, c"
+
+
+def test_extract_fundamentals_comma_in_row_title():
+    tables = onvista.extract_fundamentals(html.fromstring(PAGE))
+    assert tables == {"gewinn": {
+        "kgv": {2020: 12.5, 2019: 14.1},
+        "gewinn je aktie, verwässert": {2020: 1.2, 2019: None},
+    }}
+
+
+class _Downloads(object):
+    """Replaces _load_price_series, DAX blocks until ``release`` is set"""
+
+    def __init__(self, closes: int = 1):
+        self.closes = closes
+        self.loads = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, notation_id):
+        self.loads.append(notation_id)
+        if notation_id == onvista.BENCHMARKS["DAX"]["notation_id"]:
+            self.started.set()
+            self.release.wait(5)
+        return PriceSeries.from_pairs(
+            [(datetime.date(2020, 1, 2), 100.0)] * self.closes)
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    onvista.invalidate_benchmarks()
+    downloads = _Downloads()
+    monkeypatch.setattr(onvista, "_load_price_series", downloads)
+    yield downloads
+    downloads.release.set()
+    onvista.invalidate_benchmarks()
+
+
+def test_benchmark_is_downloaded_once_a_day(downloads):
+    assert len(onvista.benchmark_series("MDAX")) == 1
+    assert len(onvista.benchmark_series("MDAX")) == 1
+    assert len(downloads.loads) == 1
+
+
+def test_failed_benchmark_download_is_retried_later(downloads):
+    downloads.closes = 0
+    assert len(onvista.benchmark_series("MDAX")) == 0
+    assert len(onvista.benchmark_series("MDAX")) == 0
+    assert len(downloads.loads) == 1
+
+    notation_id = onvista.BENCHMARKS["MDAX"]["notation_id"]
+    onvista._benchmark_failures[notation_id] -= onvista.BENCHMARK_RETRY
+    downloads.closes = 1
+    assert len(onvista.benchmark_series("MDAX")) == 1
+    assert len(downloads.loads) == 2
+
+
+def test_benchmarks_download_independently(downloads):
+    downloads.release.clear()
+    dax = threading.Thread(target=onvista.benchmark_series, args=("DAX",))
+    dax.start()
+    assert downloads.started.wait(5)
+    start = time.monotonic()
+    assert len(onvista.benchmark_series("MDAX")) == 1
+    assert time.monotonic() - start < 1
+
+    # waiting for the download of another thread ends at the deadline
+    with deadlines.budget(0.2):
+        with pytest.raises(DeadlineExceededError):
+            onvista.benchmark_series("DAX")
+    downloads.release.set()
+    dax.join()
+    assert len(onvista.benchmark_series("DAX")) == 1
+    assert len(downloads.loads) == 2
@@ -0,0 +1,38 @@
+"""Tests of stockanalyser.data_source.parsing"""
+import asyncio
+import concurrent.futures
+
+from stockanalyser.data_source import parsing
+
+PAGE = ("<html><head><title>Test AG</title></head><body>{}</body></html>"
+        .format("<p>x</p>" * parsing.MIN_OFFLOAD_BYTES).encode())
+
+
+def _title(tree) -> str:
+    return tree.findtext(".//title")
+
+
+def _shut_down_pool(monkeypatch):
+    """A pool that set_workers replaced after the page was assigned to it"""
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    pool.shutdown()
+    monkeypatch.setattr(parsing, "_offload_pool", lambda page: pool)
+
+
+def test_extract_page_after_the_pool_was_shut_down(monkeypatch):
+    _shut_down_pool(monkeypatch)
+    assert parsing.extract_page(_title, PAGE) == "Test AG"
+
+
+def test_extract_page_async_after_the_pool_was_shut_down(monkeypatch):
+    _shut_down_pool(monkeypatch)
+    assert asyncio.run(parsing.extract_page_async(_title, PAGE)) == "Test AG"
+
+
+def test_extract_page_in_processes():
+    parsing.set_workers(1)
+    try:
+        assert parsing.extract_page(_title, PAGE) == "Test AG"
+    finally:
+        parsing.shutdown()
+    assert parsing.workers() == 0
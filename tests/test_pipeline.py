@@ -0,0 +1,94 @@
+"""Tests of stockanalyser.pipeline with stubbed stages"""
+import itertools
+import threading
+import time
+
+from stockanalyser import deadlines, pipeline
+
+
+class _Result(object):
+    score = 1
+    missing = {}
+
+
+def _stage(seconds: float = 0):
+    """A stage that works ``seconds`` and then checks the deadline"""
+
+    def work(item):
+        time.sleep(seconds)
+        deadlines.check("the end of the stage")
+        item.result = _Result()
+    return work
+
+
+def _pipeline(workers: dict = None, budget: float = None, persist=None,
+              **seconds) -> pipeline.Pipeline:
+    stages = pipeline.Pipeline(dict(dict.fromkeys(pipeline.STAGES, 1),
+                                    **(workers or {})), budget=budget)
+    for stage in pipeline.STAGES[:-1]:
+        stages.functions[stage] = _stage(seconds.get(stage, 0))
+    stages.functions["persist"] = persist or (lambda items: {})
+    return stages
+
+
+def _isins(count: int = None):
+    numbers = itertools.count() if count is None else range(count)
+    return ("DE{:010d}".format(number) for number in numbers)
+
+
+def _pipeline_threads() -> list:
+    return [thread for thread in threading.enumerate()
+            if thread.name.startswith("pipeline-")]
+
+
+def test_time_in_the_queues_does_not_count():
+    # 12 stocks wait for the only score worker up to 1.1s, 0.1s of work
+    # per stage fit into the budget
+    stages = _pipeline(budget=0.5, score=0.1)
+    results = list(stages.run(_isins(12)))
+    assert len(results) == 12
+    assert [r for r in results if r.timed_out or r.failed] == []
+
+
+def test_work_of_all_stages_counts():
+    stages = _pipeline(budget=0.5, resolve=0.3, fetch=0.3)
+    results = list(stages.run(_isins(2)))
+    assert len(results) == 2
+    assert all(r.timed_out for r in results)
+
+
+def test_full_queues_stop_reading_isins():
+    release = threading.Event()
+    read = []
+
+    def isins():
+        for isin in _isins():
+            read.append(isin)
+            yield isin
+
+    def persist(items):
+        release.wait(5)
+        return {}
+
+    results = _pipeline(persist=persist).run(isins())
+    # starts the pipeline, returns once persist is released
+    consumer = threading.Thread(target=next, args=(results,))
+    consumer.start()
+    time.sleep(0.5)
+    pending = len(read)
+    time.sleep(0.3)
+    # the queues are full, nothing more is read while persist blocks
+    assert len(read) == pending
+    assert pending < 3 * pipeline.PERSIST_BATCH
+    release.set()
+    consumer.join(5)
+    results.close()
+    assert _pipeline_threads() == []
+
+
+def test_closing_the_results_stops_the_pipeline():
+    results = _pipeline(workers={"fetch": 4}).run(_isins())
+    first = next(results)
+    assert first.score == 1
+    results.close()
+    assert _pipeline_threads() == []
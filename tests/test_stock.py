@@ -0,0 +1,74 @@
+"""Tests of stockanalyser.stock with websites that miss the deadline"""
+from stockanalyser.analysis import levermann
+from stockanalyser.analysis.levermann import Levermann
+from stockanalyser.analysis.levernann_result import LevermannResult
+from stockanalyser.database import aktien_data_jaehrlich
+from stockanalyser.exceptions import DeadlineExceededError
+from stockanalyser.stock import Cap, Stock
+
+ONVISTA_FIELDS = ("roe", "ebit_margin", "equity_ratio", "eps", "per")
+
+
+class _LateFundamentals(object):
+    """Onvista whose fundamental page misses the deadline"""
+    market_cap = 10 ** 10
+    previous_close = 100.0
+
+    def __getattr__(self, name):
+        if name in ONVISTA_FIELDS:
+            raise DeadlineExceededError("Deadline exceeded before "
+                                        "the fundamental page")
+        raise AttributeError(name)
+
+
+class _FinanzenNet(object):
+    name = "test-ag"
+    benchmark = "DAX"
+    quarterly_figure_dates = []
+
+
+class _MarketScreener(object):
+    consensus_data = {"consensus": 8.0, "n_analysts": 3}
+    revisions = ({"Change current Year": 1.0}, {"Change next Year": 1.0})
+
+
+def _stock() -> Stock:
+    stock = Stock.__new__(Stock)
+    stock.ISIN = "DE0000000001"
+    stock.name = "Test AG"
+    stock.missing = {}
+    stock.loaded_from_database = False
+    stock._stored = None
+    stock._fetched = True
+    stock.OS = _LateFundamentals()
+    stock.FNS = _FinanzenNet()
+    stock.MSS = _MarketScreener()
+    stock.update_stock_info(save=False)
+    return stock
+
+
+def test_onvista_fundamentals_miss_the_deadline():
+    stock = _stock()
+    assert stock.cap_type == Cap.LARGE
+    assert set(stock.missing) == set(ONVISTA_FIELDS)
+    for field in ONVISTA_FIELDS:
+        assert getattr(stock, field) == {}
+    # the stored yearly figures are not overwritten with nothing
+    assert aktien_data_jaehrlich._yearly_rows(stock, 1) == []
+
+
+def test_criteria_of_missed_fundamentals_are_missing():
+    rating = Levermann.__new__(Levermann)
+    rating.stock = _stock()
+    rating.reference_index = "DAX"
+    result = LevermannResult(name="Test AG", isin="DE0000000001")
+    for name in ("roe", "ebit_margin", "equity_ratio", "price_earnings_ratio",
+                 "five_years_price_earnings_ratio", "earning_growth",
+                 "analyst_rating"):
+        rating._evaluate_criterion(levermann.CRITERIA[name], result)
+    assert set(result.missing) == {
+        "roe", "ebit_margin", "equity_ratio", "price_earnings_ratio",
+        "five_years_price_earnings_ratio", "earning_growth"}
+    assert result.analyst_rating.points == 1
+    result.capture(rating.stock)
+    assert result.per is None
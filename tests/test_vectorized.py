@@ -0,0 +1,227 @@
+"""Tests of stockanalyser.analysis.vectorized"""
+import datetime
+import logging
+
+import numpy as np
+
+from stockanalyser.analysis import levermann, thresholds, vectorized
+from stockanalyser.analysis.levermann import CriteriaRating, Levermann
+from stockanalyser.analysis.levernann_result import LevermannResult
+from stockanalyser.data_source import common, trading_calendar
+from stockanalyser.stock import Cap
+
+
+def _result() -> LevermannResult:
+    """A complete result of a large cap with 11 points"""
+    result = LevermannResult(name="Test AG", isin="DE0000000001")
+    result.roe = CriteriaRating(25.0, 1)
+    result.ebit_margin = CriteriaRating(15.0, 1)
+    result.equity_ratio = CriteriaRating(30.0, 1)
+    result.price_earnings_ratio = CriteriaRating(10.0, 1)
+    result.five_years_price_earnings_ratio = CriteriaRating(10.0, 1)
+    result.analyst_rating = CriteriaRating(8.0, 1)
+    result.consensus = 8.0
+    result.n_analysts = 3
+    result.quarterly_figures_reaction = CriteriaRating(2.0, 1)
+    result.quote_chg_6month = CriteriaRating(10.0, 1)
+    result.quote_chg_1year = CriteriaRating(-10.0, -1)
+    result.momentum = CriteriaRating((1, -1), 1)
+    result.three_month_reversal = CriteriaRating((-1.0, -2.0, -3.0), 1)
+    result.earning_growth = CriteriaRating(100.0, 1, raw=(1.0, 2.0))
+    result.eps = (1.0, 2.0)
+    result.earning_revision = CriteriaRating((1, 1), 1)
+    result.earning_revision_changes = (10.0, 10.0)
+    return result
+
+
+def _missing(result: LevermannResult, *names) -> LevermannResult:
+    for name in names:
+        setattr(result, name, None)
+        result.mark_missing(name, "deadline exceeded")
+    return result
+
+
+def _scores(results: list) -> list:
+    columns = vectorized.columns_from_results(results)
+    return vectorized.score(columns)["score"].tolist()
+
+
+def test_complete_result_scores_like_the_result():
+    result = _result()
+    assert result.score == 11
+    assert _scores([result]) == [11]
+
+
+def test_missing_criteria_are_left_out():
+    # the raw values of consensus and quote changes are still known, the
+    # criteria themselves missed the deadline
+    partial = _missing(_result(), "analyst_rating", "momentum",
+                       "three_month_reversal", "quarterly_figures_reaction")
+    assert partial.score == 7
+    assert _scores([partial]) == [7]
+
+
+def test_missing_inputs_become_nan():
+    partial = _missing(_result(), "quote_chg_6month", "quote_chg_1year",
+                       "momentum")
+    columns = vectorized.columns_from_results([partial])
+    assert np.isnan(columns["quote_chg_6month"][0])
+    assert np.isnan(columns["quote_chg_1year"][0])
+    assert columns["missing"][0].sum() == 3
+    assert _scores([partial]) == [partial.score]
+
+
+def test_rows_of_complete_and_partial_results():
+    results = [_result(), _missing(_result(), "roe", "earning_growth"),
+               _missing(_result(), *vectorized.CRITERIA)]
+    assert _scores(results) == [r.score for r in results] == [11, 9, 0]
+
+
+class _FakeOnvista(object):
+    """Closes of the stock and its reference index on the days the criteria
+    look up, 100 on all other days"""
+
+    def __init__(self):
+        self.closes = {}
+
+    def get_historic_data(self, day, index=None):
+        return self.closes.get((index, day), 100.0)
+
+
+class _FakeStock(object):
+    """Everything the scalar criteria read from a Stock"""
+
+    def __init__(self, row: dict):
+        this_year = levermann.THIS_YEAR
+        last_year = levermann.LAST_YEAR
+        self.name = "Test AG"
+        self.cap_type = Cap.LARGE if row["large"] else Cap.MID
+        self.roe = {last_year: row["roe"]}
+        self.ebit_margin = {last_year: row["ebit_margin"]}
+        self.equity_ratio = {last_year: row["equity_ratio"]}
+        self.per = {this_year: row["per"]}
+        self.eps = {this_year: row["eps"][0], this_year + 1: row["eps"][1]}
+        self.consensus_ratings = {"consensus": row["consensus"],
+                                  "n_analysts": row["n_analysts"]}
+        self.eval_earning_revision_cy = {
+            "Change current Year": row["revision"][0]}
+        self.eval_earning_revision_ny = {
+            "Change next Year": row["revision"][1]}
+        self.quote = 100.0
+        self._five_year_per = row["five_year_per"]
+        self.OS = _FakeOnvista()
+        closes = self.OS.closes
+
+        for days, column in ((182, "quote_chg_6month"),
+                             (365, "quote_chg_1year")):
+            before = common.closest_weekday(
+                datetime.date.today() - datetime.timedelta(days=days))
+            closes[(None, before)] = 100.0 / (1 + row[column] / 100)
+
+        # month ends of the reversal, latest first, the index stays at 100
+        month = common.prev_month(datetime.date.today())
+        ends = []
+        for _ in range(4):
+            ends.append(trading_calendar.month_end(month))
+            month = common.prev_month(month)
+        quote = 100.0
+        closes[(None, ends[3])] = quote
+        for idx in (2, 1, 0):
+            quote *= 1 + row["reversal"][idx] / 100
+            closes[(None, ends[idx])] = quote
+
+        closes[(None, QUARTERLY_FIGURES)] = \
+            100.0 * (1 + row["quarterly_reaction"] / 100)
+
+    def price_earnings_ratio_5year(self):
+        return self._five_year_per
+
+    def last_quarterly_figures_release_date(self):
+        return QUARTERLY_FIGURES
+
+
+QUARTERLY_FIGURES = datetime.date(2020, 3, 10)
+ROWS = 3000
+
+
+def _value(rng, thresholds, spread, none_share=0.05):
+    """A random value, often exactly on a threshold, sometimes None"""
+    draw = rng.random()
+    if draw < none_share:
+        return None
+    if draw < 0.3:
+        return float(rng.choice(thresholds))
+    return round(float(rng.uniform(-spread, spread)), 2)
+
+
+def _random_rows(seed: int = 42) -> list:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(ROWS):
+        rows.append({
+            "roe": _value(rng, thresholds.ROE, 40),
+            "ebit_margin": _value(rng, thresholds.EBIT_MARGIN, 30),
+            "equity_ratio": _value(rng, thresholds.EQUITY_RATIO, 50),
+            "per": _value(rng, thresholds.PRICE_EARNINGS_RATIO + (0,), 30),
+            "five_year_per": _value(rng, thresholds.PRICE_EARNINGS_RATIO,
+                                    30),
+            "consensus": float(rng.choice(
+                thresholds.ANALYST_CONSENSUS + (1, 5, 9.5))),
+            "n_analysts": None if rng.random() < 0.05 else int(
+                rng.integers(0, 10)),
+            "quarterly_reaction": float(rng.uniform(-3, 3)),
+            "quote_chg_6month": _value(rng, thresholds.QUOTE_CHANGE, 20, 0),
+            "quote_chg_1year": _value(rng, thresholds.QUOTE_CHANGE, 20, 0),
+            "reversal": [float(rng.choice((-1, 0, 1)) * rng.uniform(0.1, 9))
+                         for _ in range(3)],
+            "eps": [float(rng.choice((0, rng.uniform(-5, 5))))
+                    for _ in range(2)],
+            "revision": [_value(rng, thresholds.EARNING_REVISION, 15, 0)
+                         for _ in range(2)],
+            "large": bool(rng.random() < 0.5),
+        })
+    return rows
+
+
+def _scalar_points(row: dict) -> dict:
+    rating = Levermann.__new__(Levermann)
+    rating.stock = _FakeStock(row)
+    rating.reference_index = "DAX"
+    points = {}
+    for c in levermann.CRITERIA.values():
+        if c.inputs:
+            continue
+        points[c.name] = getattr(rating, c.method)().points
+    momentum = levermann.CRITERIA["momentum"]
+    points["momentum"] = getattr(rating, momentum.method)(
+        *[points[name] for name in momentum.inputs]).points
+    return points
+
+
+def _columns(rows: list) -> dict:
+    columns = {}
+    for name in rows[0]:
+        columns[name] = [
+            [np.nan if v is None else v for v in row[name]]
+            if isinstance(row[name], list)
+            else (np.nan if row[name] is None else row[name])
+            for row in rows]
+    # small caps have no reversal
+    columns["reversal"] = [row["reversal"] if row["large"] else [np.nan] * 3
+                           for row in rows]
+    return columns
+
+
+def test_scalar_and_vectorized_scores_are_equal():
+    logging.disable(logging.CRITICAL)
+    try:
+        rows = _random_rows()
+        vector = vectorized.score(_columns(rows))
+        for idx, row in enumerate(rows):
+            scalar = _scalar_points(row)
+            for name in vectorized.CRITERIA:
+                assert scalar[name] == vector[name][idx], \
+                    "{} of row {}: {}".format(name, idx, row)
+            assert sum(scalar.values()) == vector["score"][idx]
+    finally:
+        logging.disable(logging.NOTSET)
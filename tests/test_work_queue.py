@@ -0,0 +1,122 @@
+"""Tests of the leases and retries of stockanalyser.work_queue"""
+import os
+import sqlite3
+import time
+
+import pytest
+
+from stockanalyser import work_queue
+from stockanalyser.work_queue import DONE, FAILED, LEASED, PENDING
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return work_queue.SQLiteWorkQueue(
+        os.path.join(str(tmp_path), "queue.db"), max_attempts=2)
+
+
+def _state(queue, isin: str) -> str:
+    return queue._connection().execute(
+        "SELECT state FROM tasks WHERE isin = ?", (isin,)).fetchone()[0]
+
+
+def _retry_now(queue):
+    """Makes the failed attempts available without RETRY_DELAY"""
+    with queue._transaction() as connection:
+        connection.execute("UPDATE tasks SET available_at = 0")
+
+
+def test_claim_and_complete(queue):
+    assert queue.add(["A", "B"]) == 2
+    task = queue.claim("w1")
+    assert (task.isin, task.attempt) == ("A", 1)
+    assert _state(queue, "A") == LEASED
+    assert queue.complete("w1", "A", 5)
+    assert queue.counts() == {PENDING: 1, LEASED: 0, DONE: 1, FAILED: 0}
+    assert queue.remaining() == 1
+
+
+def test_expired_lease_is_claimed_again(queue):
+    queue.add(["A"])
+    queue.claim("w1", lease=-1)
+    task = queue.claim("w2")
+    assert (task.isin, task.attempt) == ("A", 2)
+    assert queue.heartbeat("w1", ["A"]) == 0
+    assert queue.heartbeat("w2", ["A"]) == 1
+
+
+def test_lost_lease_can_neither_complete_nor_fail(queue):
+    queue.add(["A"])
+    queue.claim("w1", lease=-1)
+    queue.claim("w2")
+    assert not queue.complete("w1", "A", 3)
+    assert not queue.fail("w1", "A", "error of w1")
+    assert _state(queue, "A") == LEASED
+    assert queue.complete("w2", "A", 4)
+    assert _state(queue, "A") == DONE
+
+
+def test_failed_after_max_attempts(queue):
+    queue.add(["A"])
+    queue.claim("w1")
+    assert queue.fail("w1", "A", "first")
+    assert _state(queue, "A") == PENDING
+    # the retry waits for RETRY_DELAY
+    assert queue.claim("w1") is None
+    _retry_now(queue)
+    task = queue.claim("w1")
+    assert task.attempt == 2
+    assert queue.fail("w1", "A", "second")
+    assert _state(queue, "A") == FAILED
+    assert queue.failures() == {"A": "second"}
+    assert queue.remaining() == 0
+
+
+def test_expired_lease_of_the_last_attempt_fails(queue):
+    queue.add(["A"])
+    queue.claim("w1")
+    queue.fail("w1", "A", "first")
+    _retry_now(queue)
+    queue.claim("w1", lease=-1)
+    assert queue.claim("w2") is None
+    assert queue.failures() == {"A": "Lease expired"}
+
+
+def test_add_queues_done_and_failed_isins_again(queue):
+    queue.add(["A", "B", "C"])
+    queue.claim("w1")
+    queue.complete("w1", "A", 5)
+    queue.claim("w1")
+    queue.fail("w1", "B", "error")
+    queue._connection().execute(
+        "UPDATE tasks SET state = ? WHERE isin = ?", (FAILED, "B"))
+    # C is still pending, only A and B are queued again
+    assert queue.add(["A", "B", "C"]) == 2
+    assert queue.counts()[PENDING] == 3
+    task = queue.claim("w1")
+    assert (task.isin, task.attempt) == ("A", 1)
+
+
+class _BusyQueue(work_queue.SQLiteWorkQueue):
+    """Its first claims fail like on a locked database"""
+
+    def __init__(self, path: str, busy: int):
+        super().__init__(path)
+        self.busy = busy
+
+    def claim(self, worker: str, lease: float = work_queue.LEASE):
+        if self.busy:
+            self.busy -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().claim(worker, lease)
+
+
+def test_worker_retries_a_claim_on_a_busy_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "CLAIM_BACKOFF", 0.01)
+    queue = _BusyQueue(os.path.join(str(tmp_path), "queue.db"), busy=2)
+    queue.add(["A"])
+    worker = work_queue.Worker(queue, threads=1)
+    start = time.monotonic()
+    assert worker._claim().isin == "A"
+    assert queue.busy == 0
+    assert time.monotonic() - start < 1